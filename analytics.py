@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+统计分析：列式导出与向量化报表
+
+把已支付账单（连同就诊的科室、医生）导出为 Arrow IPC 列式文件，报表从内存映射的
+文件读取各列，用 NumPy 按任意维度组合分组汇总：
+
+    python analytics.py export [--db hospital.db] [--out hospital_facts.arrow]
+    python analytics.py report --start 2026-01-01 --end 2026-03-31
+                               [--by dept,doctor,payment_method,week] [--percentiles 50,90]
+    python analytics.py check [--db hospital.db]
+
+- 分组维度：date、week（周一）、month、dept、doctor、payment_method，可任意组合；
+  汇总就诊人次、账单数、收入、医保和自付金额，以及费用的分位数
+- 事实表每行一张已支付账单，按支付日期排序，日期范围用二分查找切片
+- 就诊人次为每组内不同的就诊数：按日期分组时同一天同一就诊的多张账单算一人次，
+  与 revenue_summary 一致；不按日期分组时多日缴费的就诊也只算一人次，与
+  revenue_visit 去重的结果一致。因此按日汇总、多日按科室、按医生汇总的结果与
+  /api/admin/statistics 相同（check 命令核对）
+- 包括已归档的就诊和账单（见 archive.py）
+- 导出文件是快照，之后的缴费、退款在下次导出后才计入，接口返回导出时间；
+  文件更新后下一次请求自动重新加载
+
+需要 numpy 和 pyarrow（可选依赖，pip install -r requirements-optional.txt），未安装时只有本模块不可用。
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+import archive
+
+# 导出文件与数据库放在同一目录：<数据库名>_facts.arrow
+FACTS_SUFFIX = '_facts.arrow'
+
+# 每批读取、写入的行数
+EXPORT_BATCH = 65536
+
+# 与 billing.payment_method 的取值约束一致，文件中保存为编号，-1 表示空
+PAYMENT_METHODS = ('现金', '微信', '支付宝', '银行卡', '医保卡')
+
+DIMENSIONS = ('date', 'week', 'month', 'dept', 'doctor', 'payment_method')
+
+FEE_COLUMNS = ('total_fee', 'insurance_fee', 'self_fee')
+
+FACTS_SQL = """
+    SELECT b.bill_id, b.visit_id, b.payment_date, v.dept_id, COALESCE(v.doctor_id, 0),
+           b.payment_method, b.total_fee, b.insurance_fee, b.self_fee
+    FROM all_billing b
+    JOIN all_visit v ON b.visit_id = v.visit_id
+    WHERE b.payment_status = '已支付'
+      AND b.payment_time >= ? AND b.payment_time < ?
+    ORDER BY b.payment_time, b.bill_id
+"""
+
+_EPOCH = date(1970, 1, 1)
+
+
+class AnalyticsError(Exception):
+    """缺少依赖、导出文件不存在或报表参数无效"""
+
+
+def _require():
+    try:
+        import numpy
+        import pyarrow
+    except ImportError:
+        raise AnalyticsError('统计分析需要先安装 numpy 和 pyarrow：pip install -r requirements-optional.txt')
+    return numpy, pyarrow
+
+
+def facts_file(db_file):
+    stem = os.path.splitext(os.path.abspath(db_file))[0]
+    return stem + FACTS_SUFFIX
+
+
+def _day_number(value):
+    return (datetime.strptime(value, '%Y-%m-%d').date() - _EPOCH).days
+
+
+def _day_label(number):
+    return (_EPOCH + timedelta(days=int(number))).isoformat()
+
+
+# ==================== 导出 ====================
+
+def _schema(pa):
+    return pa.schema([
+        ('bill_id', pa.int64()),
+        ('visit_id', pa.int64()),
+        ('day', pa.int32()),            # 支付日期，1970-01-01 起的天数
+        ('dept_id', pa.int32()),
+        ('doctor_id', pa.int32()),      # 没有医生的就诊为 0
+        ('payment_method', pa.int8()),
+        ('total_fee', pa.float64()),
+        ('insurance_fee', pa.float64()),
+        ('self_fee', pa.float64()),
+    ])
+
+
+def export(conn, path):
+    """把已支付账单导出到 path（先写临时文件再替换），返回导出的行数"""
+    _, pa = _require()
+    from pyarrow import ipc
+
+    method_codes = {method: code for code, method in enumerate(PAYMENT_METHODS)}
+    exported_at = datetime.now().isoformat(timespec='seconds')
+    schema = _schema(pa).with_metadata({'exported_at': exported_at})
+    archive.attach(conn)
+    cursor = conn.cursor()
+    cursor.execute(FACTS_SQL, ('0000-01-01', '9999-12-31'))
+
+    rows = 0
+    temp_path = path + '.tmp'
+    with pa.OSFile(temp_path, 'wb') as sink, ipc.new_file(sink, schema) as writer:
+        while True:
+            batch = cursor.fetchmany(EXPORT_BATCH)
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            writer.write_batch(pa.record_batch([
+                pa.array(columns[0], pa.int64()),
+                pa.array(columns[1], pa.int64()),
+                pa.array([_day_number(value) for value in columns[2]], pa.int32()),
+                pa.array(columns[3], pa.int32()),
+                pa.array(columns[4], pa.int32()),
+                pa.array([method_codes.get(value, -1) for value in columns[5]], pa.int8()),
+                pa.array([value or 0.0 for value in columns[6]], pa.float64()),
+                pa.array([value or 0.0 for value in columns[7]], pa.float64()),
+                pa.array([value or 0.0 for value in columns[8]], pa.float64()),
+            ], schema=schema))
+            rows += len(batch)
+    os.replace(temp_path, path)
+    return rows
+
+
+# ==================== 报表 ====================
+
+class FactTable:
+    """内存映射的事实表，各列为 NumPy 数组，行按支付日期排序"""
+
+    def __init__(self, columns, exported_at=None):
+        self.columns = columns
+        self.exported_at = exported_at
+
+    @classmethod
+    def load(cls, path):
+        _, pa = _require()
+        from pyarrow import ipc
+
+        if not os.path.exists(path):
+            raise AnalyticsError('尚未导出统计数据，请先运行 python analytics.py export')
+        source = pa.memory_map(path, 'r')
+        table = ipc.open_file(source).read_all()
+        # 只有一个数据块的列直接引用映射的内存，多个数据块时合并一次
+        columns = {name: table.column(name).combine_chunks().to_numpy(zero_copy_only=False)
+                   for name in table.column_names}
+        metadata = table.schema.metadata or {}
+        exported_at = metadata.get(b'exported_at')
+        return cls(columns, exported_at.decode() if exported_at else None)
+
+    def __len__(self):
+        return len(self.columns['day'])
+
+    def between(self, start_date, end_date):
+        """支付日期在闭区间 [start_date, end_date] 内的行（切片，不复制数据）"""
+        np, _ = _require()
+        days = self.columns['day']
+        start = np.searchsorted(days, _day_number(start_date), 'left')
+        end = np.searchsorted(days, _day_number(end_date), 'right')
+        return FactTable({name: values[start:end] for name, values in self.columns.items()}, self.exported_at)
+
+    def _keys(self, np, dimension):
+        days = self.columns['day']
+        if dimension == 'date':
+            return days.astype(np.int64)
+        if dimension == 'week':
+            # 1970-01-01 是星期四，(天数 + 3) % 7 为距本周一的天数
+            return (days - (days + 3) % 7).astype(np.int64)
+        if dimension == 'month':
+            return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        if dimension == 'dept':
+            return self.columns['dept_id'].astype(np.int64)
+        if dimension == 'doctor':
+            return self.columns['doctor_id'].astype(np.int64)
+        return self.columns['payment_method'].astype(np.int64)
+
+    def group(self, dimensions, percentiles=(), names=None):
+        """按 dimensions 分组汇总，返回按维度取值升序排列的行
+
+        names 为 load_names() 的结果，用于补充科室、医生名称。
+        """
+        np, _ = _require()
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS:
+                raise AnalyticsError(f'不支持的统计维度：{dimension}')
+        for p in percentiles:
+            if not 0 <= p <= 100:
+                raise AnalyticsError(f'分位数应在 0 到 100 之间：{p}')
+        if len(self) == 0:
+            return []
+
+        keys = [self._keys(np, dimension) for dimension in dimensions]
+        total_fee = self.columns['total_fee']
+        # 先按各维度、组内再按费用排序，分位数直接按位置取值
+        order = np.lexsort([total_fee] + keys[::-1])
+        sorted_keys = [key[order] for key in keys]
+        changed = np.zeros(len(order), dtype=bool)
+        changed[0] = True
+        for key in sorted_keys:
+            changed[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(changed)
+        counts = np.diff(np.append(starts, len(order)))
+
+        # 就诊人次：每组内不同的就诊个数（按日期分组时组号已经区分支付日期）
+        group_ids = np.empty(len(order), dtype=np.int64)
+        group_ids[order] = np.cumsum(changed) - 1
+        visit_order = np.lexsort((self.columns['visit_id'], group_ids))
+        visit_groups = group_ids[visit_order]
+        visit_ids = self.columns['visit_id'][visit_order]
+        first = np.ones(len(visit_order), dtype=bool)
+        first[1:] = (visit_groups[1:] != visit_groups[:-1]) | (visit_ids[1:] != visit_ids[:-1])
+        visits = np.bincount(visit_groups[first], minlength=len(starts))
+
+        sums = {column: np.add.reduceat(self.columns[column][order], starts) for column in FEE_COLUMNS}
+        fees = total_fee[order]
+        quantiles = {}
+        for p in percentiles:
+            position = starts + (counts - 1) * (p / 100)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, starts + counts - 1)
+            quantiles[p] = fees[lower] + (fees[upper] - fees[lower]) * (position - lower)
+
+        names = names or {}
+        departments = names.get('departments', {})
+        doctors = names.get('doctors', {})
+        result = []
+        for i, start in enumerate(starts.tolist()):
+            row = {}
+            for dimension, key in zip(dimensions, sorted_keys):
+                value = int(key[start])
+                if dimension in ('date', 'week'):
+                    row['stat_date' if dimension == 'date' else 'week'] = _day_label(value)
+                elif dimension == 'month':
+                    row['month'] = f'{1970 + value // 12:04d}-{value % 12 + 1:02d}'
+                elif dimension == 'dept':
+                    row['dept_id'] = value
+                    row['dept_name'] = departments.get(value)
+                elif dimension == 'doctor':
+                    row['doctor_id'] = value or None
+                    row['doctor_name'] = doctors.get(value)
+                else:
+                    row['payment_method'] = PAYMENT_METHODS[value] if value >= 0 else None
+            row['visit_count'] = int(visits[i])
+            row['bill_count'] = int(counts[i])
+            row['total_revenue'] = round(float(sums['total_fee'][i]), 2)
+            row['insurance_fee'] = round(float(sums['insurance_fee'][i]), 2)
+            row['self_fee'] = round(float(sums['self_fee'][i]), 2)
+            for p, values in quantiles.items():
+                row[f'fee_p{p:g}'] = round(float(values[i]), 2)
+            result.append(row)
+        return result
+
+
+def load_names(cursor):
+    """科室、医生名称"""
+    cursor.execute("SELECT dept_id, dept_name FROM department")
+    departments = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.execute("SELECT emp_id, emp_name FROM employee")
+    doctors = {row[0]: row[1] for row in cursor.fetchall()}
+    return {'departments': departments, 'doctors': doctors}
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_facts(path):
+    """返回 path 的事实表，文件未变化时复用已加载的表"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise AnalyticsError('尚未导出统计数据，请先运行 python analytics.py export')
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        facts = FactTable.load(path)
+        _loaded[path] = (mtime, facts)
+        return facts
+
+
+# ==================== 核对 ====================
+
+def check(conn, facts, tolerance=0.005):
+    """核对事实表与收入汇总表，返回不一致的 (键, 汇总值, 事实表值)，键为 (日期, 科室, 医生)
+
+    - 按 (日期, 科室, 医生) 与 revenue_summary 核对，对应按日报表
+    - 全部日期按科室、按医生的合计（键中日期和未分组的维度为 None）：收入与
+      revenue_summary 的合计、人次与 revenue_visit 去重后的就诊数核对，对应多日的
+      科室、医生报表（一次就诊在多天缴费只算一人次，逐日核对发现不了这类错误）
+    """
+    expected = {}
+    for row in facts.group(['date', 'dept', 'doctor']):
+        key = (row['stat_date'], row['dept_id'], row['doctor_id'] or 0)
+        expected[key] = (row['visit_count'], row['total_revenue'])
+    for row in facts.group(['dept']):
+        expected[(None, row['dept_id'], None)] = (row['visit_count'], row['total_revenue'])
+    for row in facts.group(['doctor']):
+        expected[(None, None, row['doctor_id'] or 0)] = (row['visit_count'], row['total_revenue'])
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT stat_date, dept_id, doctor_id, total_visits, total_revenue FROM revenue_summary
+    """)
+    actual = {(row[0], row[1], row[2]): (row[3], row[4] or 0.0) for row in cursor.fetchall()}
+    revenue = {}
+    for (_, dept_id, doctor_id), (_, total) in actual.items():
+        revenue[(None, dept_id, None)] = revenue.get((None, dept_id, None), 0.0) + total
+        revenue[(None, None, doctor_id)] = revenue.get((None, None, doctor_id), 0.0) + total
+    visits = {}
+    cursor.execute("SELECT dept_id, COUNT(DISTINCT visit_id) FROM revenue_visit GROUP BY dept_id")
+    visits.update(((None, row[0], None), row[1]) for row in cursor.fetchall())
+    cursor.execute("SELECT doctor_id, COUNT(DISTINCT visit_id) FROM revenue_visit GROUP BY doctor_id")
+    visits.update(((None, None, row[0]), row[1]) for row in cursor.fetchall())
+    for key in set(revenue) | set(visits):
+        actual[key] = (visits.get(key, 0), revenue.get(key, 0.0))
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, (0, 0.0))
+        got = actual.get(key, (0, 0.0))
+        if want[0] != got[0] or abs(want[1] - got[1]) > tolerance:
+            mismatches.append((key, got, want))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='统计分析：列式导出与多维报表')
+    parser.add_argument('command', choices=['export', 'report', 'check'])
+    parser.add_argument('--db', default='hospital.db', help='数据库文件')
+    parser.add_argument('--out', help='导出文件（默认与数据库同目录的 <数据库名>_facts.arrow）')
+    parser.add_argument('--start', default='0001-01-01', help='报表起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', default='9999-12-31', help='报表结束日期 YYYY-MM-DD')
+    parser.add_argument('--by', default='dept', help=f"逗号分隔的分组维度：{','.join(DIMENSIONS)}")
+    parser.add_argument('--percentiles', default='', help='逗号分隔的费用分位数，如 50,90')
+    args = parser.parse_args()
+
+    import migrations
+    path = args.out or facts_file(args.db)
+    conn = sqlite3.connect(args.db)
+    migrations.upgrade(conn)
+
+    try:
+        if args.command == 'export':
+            rows = export(conn, path)
+            print(f"✓ 已导出 {rows} 张已支付账单 → {path}（{os.path.getsize(path) / 1024 / 1024:.1f} MB）")
+        elif args.command == 'report':
+            facts = FactTable.load(path).between(args.start, args.end)
+            dimensions = [d for d in args.by.split(',') if d]
+            percentiles = [float(p) for p in args.percentiles.split(',') if p]
+            for row in facts.group(dimensions, percentiles, load_names(conn.cursor())):
+                print('  '.join(f'{key}={value}' for key, value in row.items()))
+        else:
+            # 导出到临时文件再核对，避免与已有导出文件的时间差造成误报
+            temp_path = path + '.check'
+            try:
+                export(conn, temp_path)
+                mismatches = check(conn, FactTable.load(temp_path))
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            if mismatches:
+                print(f"✗ 有 {len(mismatches)} 处与收入汇总表不一致:")
+                for (stat_date, dept_id, doctor_id), got, want in mismatches[:20]:
+                    label = ' '.join(part for part in (stat_date or '全部日期',
+                                                       f'科室{dept_id}' if dept_id is not None else '',
+                                                       f'医生{doctor_id}' if doctor_id is not None else '') if part)
+                    print(f"  {label}: "
+                          f"汇总 {got[0]}人次/¥{got[1]:.2f}，导出 {want[0]}人次/¥{want[1]:.2f}")
+                sys.exit(1)
+            print("✓ 导出数据与收入汇总表一致")
+    except AnalyticsError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,22 +3,74 @@
 社区医院门诊管理系统 - 主程序 (SQLite版本)
 """
 
-from flask import Flask, render_template, request, jsonify, session
-import sqlite3
-from datetime import datetime, date
+from flask import Flask, render_template, request, jsonify, session, g, Response
+from datetime import datetime, date, timedelta
 from functools import wraps
+import time
+
+import analytics
+import archive
+import assets
+import compression
+import metrics
+import replica
+import serializer
+import writes
+from cache import cached_response, reference_cache
+from dashboard import dashboard_counters
+from db import WriteError, get_db, get_pool, set_connection_factory, utc_today
+from pagination import MAX_PAGE_SIZE, Keyset, encode_cursor, ndjson_response, page_args, ranked_page, wants_ndjson
+from patient_search import MAX_SEARCH_RESULTS, search_patient_ids, in_placeholders, order_by_ids
+from queue_events import queue_hub, fetch_queue_row
 
 app = Flask(__name__)
 app.secret_key = 'hospital_management_secret_key_2026'
 
-# SQLite数据库文件路径
-DB_FILE = 'hospital.db'
-
-def get_db_connection():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# 请求耗时和抽样SQL统计，见 /metrics
+metrics.install(app)
+set_connection_factory(metrics.ProfiledConnection)
+
+# JSON/HTML 响应的 ETag、304 和 gzip/br 压缩，见 compression.py
+compression.install(app)
+metrics.add_collector(compression.compression_stats.render_metrics)
+
+# 管理员首页的今日计数随候诊队列事件更新
+queue_hub.add_listener(dashboard_counters.on_queue_event)
+metrics.add_collector(dashboard_counters.render_metrics)
+
+def day_range(start_date, end_date):
+    """把闭区间日期 [start_date, end_date] 转成半开区间 [start, end)
+
+    直接比较 payment_time 等时间戳字段时可以使用索引，
+    而 date(payment_time) BETWEEN ... 会让索引失效。
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+def read_source():
+    """本请求报表查询的数据来源：开启只读副本时为最新快照，本会话的写操作还不在快照中时为主库
+
+    同一请求内不变，分页导出的各页读同一个快照。
+    """
+    if 'read_source' not in g:
+        g.read_source = replica.choose(session.get(replica.SESSION_KEY))
+    return g.read_source
+
+def reporting_db():
+    """报表查询的数据库连接（见 read_source）"""
+    return read_source().connection()
+
+@app.after_request
+def track_replica_reads(response):
+    """记录本会话最近一次写操作的时间；报表响应带上数据来源"""
+    if replica.enabled() and request.method != 'GET' and request.path.startswith('/api/'):
+        session[replica.SESSION_KEY] = time.time()
+    if 'read_source' in g:
+        response.headers['X-Read-Source'] = g.read_source.name
+        if g.read_source.as_of is not None:
+            response.headers['X-Replica-Age'] = f'{g.read_source.age():.1f}'
+    return response
 
 def login_required(role=None):
     """登录验证装饰器"""
@@ -38,7 +90,7 @@ def login_required(role=None):
 @app.route('/')
 def index():
     """首页"""
-    return render_template('index.html')
+    return assets.page_response('index.html')
 
 @app.route('/help')
 def firewall_guide():
@@ -63,71 +115,126 @@ def get_client_ip():
     except:
         return jsonify({'success': False, 'ip': 'Unknown'})
 
+@app.route('/assets/<name>')
+def asset(name):
+    """页面的CSS/JS（python assets.py build 生成，文件名带内容哈希，长期缓存）"""
+    return assets.asset_response(name)
+
 @app.route('/patient')
 def patient_page():
     """患者页面"""
-    return render_template('patient.html')
+    return assets.page_response('patient.html')
 
 @app.route('/receptionist')
 def receptionist_page():
     """前台页面"""
-    return render_template('receptionist.html')
+    return assets.page_response('receptionist.html')
 
 @app.route('/admin')
 def admin_page():
     """管理员页面"""
-    return render_template('admin.html')
+    return assets.page_response('admin.html')
 
 # ==================== API接口 ====================
 
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """数据库健康检查"""
+    status = get_pool().health_check()
+    return jsonify({'success': status['ok'], 'data': status}), (200 if status['ok'] else 503)
+
+@app.route('/api/admin/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """参考数据缓存命中统计"""
+    return jsonify({'success': True, 'data': reference_cache.stats()})
+
+def _runtime_metrics():
+    """连接池、参考数据缓存、候诊队列推送、只读快照的当前状态"""
+    pool = get_pool()
+    cache = reference_cache.stats()
+    return [
+        '# TYPE hms_db_pool_size gauge',
+        f'hms_db_pool_size {pool.size}',
+        '# TYPE hms_db_pool_idle gauge',
+        f'hms_db_pool_idle {pool.idle_count()}',
+        '# TYPE hms_cache_hits_total counter',
+        f'hms_cache_hits_total {cache["hits"]}',
+        '# TYPE hms_cache_misses_total counter',
+        f'hms_cache_misses_total {cache["misses"]}',
+        '# TYPE hms_cache_not_modified_total counter',
+        f'hms_cache_not_modified_total {cache["not_modified"]}',
+        '# TYPE hms_queue_subscribers gauge',
+        f'hms_queue_subscribers {queue_hub.subscriber_count()}',
+    ] + _replica_metrics()
+
+def _replica_metrics():
+    age = replica.current_age()
+    if age is None:
+        return []
+    return ['# TYPE hms_replica_age_seconds gauge', f'hms_replica_age_seconds {age:.1f}']
+
+metrics.add_collector(_runtime_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 格式的性能指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/sql_stats', methods=['GET'])
+def get_sql_stats():
+    """抽样请求中耗时最多的SQL和最近的慢查询"""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({
+        'success': True,
+        'data': {
+            'sample_rate': metrics.SQL_SAMPLE_RATE,
+            'slow_query_ms': metrics.SLOW_QUERY_SECONDS * 1000,
+            'top_statements': metrics.query_stats.top(limit),
+            'slow_queries': metrics.query_stats.slow_queries(),
+        }
+    })
+
 @app.route('/api/departments', methods=['GET'])
+@cached_response('department')
 def get_departments():
     """获取科室列表"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT dept_id, dept_name, description FROM department")
-        departments = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            departments = serializer.rows(cursor, "SELECT dept_id, dept_name, description FROM department")
         
-        return jsonify({'success': True, 'data': departments})
+        return serializer.json_response({'success': True, 'data': departments})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
 
 @app.route('/api/doctors', methods=['GET'])
+@cached_response('employee')
 def get_doctors_by_dept():
     """获取医生列表（可按科室筛选）"""
     try:
         dept_id = request.args.get('dept_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if dept_id:
-            cursor.execute("""
-                SELECT emp_id, emp_name, title, dept_id
-                FROM employee
-                WHERE dept_id = ? AND emp_type = '医生'
-                ORDER BY emp_name
-            """, (dept_id,))
-        else:
-            cursor.execute("""
-                SELECT emp_id, emp_name, title, dept_id
-                FROM employee
-                WHERE emp_type = '医生'
-                ORDER BY dept_id, emp_name
-            """)
-        
-        doctors = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': doctors})
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            if dept_id:
+                doctors = serializer.rows(cursor, """
+                    SELECT emp_id, emp_name, title, dept_id
+                    FROM employee
+                    WHERE dept_id = ? AND emp_type = '医生'
+                    ORDER BY emp_name
+                """, (dept_id,))
+            else:
+                doctors = serializer.rows(cursor, """
+                    SELECT emp_id, emp_name, title, dept_id
+                    FROM employee
+                    WHERE emp_type = '医生'
+                    ORDER BY dept_id, emp_name
+                """)
+        
+        return serializer.json_response({'success': True, 'data': doctors})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -139,60 +246,68 @@ def create_appointment():
     """患者预约挂号"""
     try:
         data = request.get_json()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO appointment (patient_name, phone, dept_id, doctor_id, appt_date, appt_time, status)
-            VALUES (?, ?, ?, ?, ?, ?, '待到院')
-        """, (
-            data['patient_name'],
-            data['phone'],
-            data['dept_id'],
-            data.get('doctor_id'),
-            data['appt_date'],
-            data['appt_time']
-        ))
-        
-        conn.commit()
-        appt_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        appointment = writes.submit('create_appointment', data)
+        
+        if appointment['schedule_id']:
+            reference_cache.invalidate('doctor_schedule')
         
         return jsonify({
             'success': True,
             'message': '预约成功',
-            'appt_id': appt_id
+            'appt_id': appointment['appt_id']
         })
         
+    except WriteError as e:
+        return jsonify({'success': False, 'message': str(e)})
     except Exception as e:
         return jsonify({'success': False, 'message': f'预约失败：{str(e)}'})
 
+@app.route('/api/patient/appointment/<int:appt_id>/cancel', methods=['POST'])
+def cancel_appointment(appt_id):
+    """取消预约（请求体带预约时登记的手机号 phone，归还排班号源）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = writes.submit('cancel_appointment', {'appt_id': appt_id, 'phone': data.get('phone')})
+        
+        if result['schedule_id']:
+            reference_cache.invalidate('doctor_schedule')
+        
+        return jsonify({'success': True, 'message': '预约已取消'})
+        
+    except WriteError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'取消失败：{str(e)}'})
+
+# 列表接口的分页排序键，每个都对应一个索引（见 pagination.py）
+APPOINTMENT_KEYSET = Keyset(('a.appt_date', 'a.appt_time', 'a.appt_id'))
+PATIENT_CREATED_KEYSET = Keyset(('created_at', 'patient_id'), fields=('registration_date', 'patient_id'))
+PATIENT_VISIT_KEYSET = Keyset(('v.visit_date', 'v.visit_time', 'v.visit_id'))
+DAY_VISIT_KEYSET = Keyset(('v.visit_time', 'v.visit_id'))
+PATIENT_LAST_VISIT_KEYSET = Keyset(('last_visit_date', 'patient_id'), nullable=True)
+EMPLOYEE_KEYSET = Keyset(('e.emp_id',), descending=False)
+
 @app.route('/api/patient/appointments', methods=['GET'])
 def get_appointments():
-    """查询预约信息"""
+    """查询预约信息（分页，format=ndjson 时流式导出）"""
     try:
         phone = request.args.get('phone')
+        limit, after = page_args()
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT a.appt_id, a.patient_name, a.phone, d.dept_name,
-                   a.appt_date, a.appt_time, a.status, a.created_at
-            FROM appointment a
-            JOIN department d ON a.dept_id = d.dept_id
-            WHERE a.phone = ?
-            ORDER BY a.appt_date DESC, a.appt_time DESC
-        """, (phone,))
+        def load(after, limit):
+            with get_db() as conn:
+                return APPOINTMENT_KEYSET.fetch(conn.cursor(), """
+                    SELECT a.appt_id, a.patient_name, a.phone, d.dept_name,
+                           a.appt_date, a.appt_time, a.status, a.created_at
+                    FROM appointment a
+                    JOIN department d ON a.dept_id = d.dept_id
+                """, ['a.phone = ?'], [phone], limit, after)
         
-        appointments = [dict(row) for row in cursor.fetchall()]
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        appointments, next_after = load(after, limit)
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': appointments})
+        return serializer.json_response({'success': True, 'data': appointments, 'next_cursor': encode_cursor(next_after)})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -204,41 +319,14 @@ def register_visit():
     """患者到院登记"""
     try:
         data = request.get_json()
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        visit_id = writes.submit('register_visit', data)['visit_id']
         
-        # 检查患者是否存在
-        cursor.execute("SELECT patient_id FROM patient WHERE phone = ?", (data['phone'],))
-        patient = cursor.fetchone()
+        # 推送给候诊队列订阅者
+        with get_db() as conn:
+            queue_row = fetch_queue_row(conn.cursor(), visit_id)
         
-        if patient:
-            patient = dict(patient)
-            patient_id = patient['patient_id']
-        else:
-            # 创建新患者
-            cursor.execute("""
-                INSERT INTO patient (patient_name, gender, id_card, phone)
-                VALUES (?, ?, ?, ?)
-            """, (data['patient_name'], data.get('gender'), data.get('id_card'), data['phone']))
-            patient_id = cursor.lastrowid
-        
-        # 创建就诊记录
-        cursor.execute("""
-            INSERT INTO visit (patient_id, dept_id, doctor_id, room_id, visit_date, visit_time, status)
-            VALUES (?, ?, ?, ?, date('now'), time('now'), '等待就诊')
-        """, (patient_id, data['dept_id'], data.get('doctor_id'), data['room_id']))
-        
-        visit_id = cursor.lastrowid
-        
-        # 如果是预约患者，更新预约状态
-        if data.get('appt_id'):
-            cursor.execute("""
-                UPDATE appointment SET status = '已到院' WHERE appt_id = ?
-            """, (data['appt_id'],))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        if queue_row:
+            queue_hub.publish_registered(queue_row)
         
         return jsonify({
             'success': True,
@@ -251,85 +339,89 @@ def register_visit():
 
 @app.route('/api/receptionist/patients', methods=['GET'])
 def get_patients():
-    """查询患者信息"""
+    """查询患者信息（分页，format=ndjson 时流式导出）"""
     try:
         keyword = request.args.get('keyword', '').strip()
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if keyword:
-            # 按关键词搜索
-            cursor.execute("""
-                SELECT patient_id, patient_name, gender, phone, id_card, address, created_at as registration_date
-                FROM patient
-                WHERE patient_name LIKE ? OR phone LIKE ? OR id_card LIKE ?
-                ORDER BY created_at DESC
-                LIMIT 50
-            """, (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
-        else:
-            # 获取全部患者（最近50个）
-            cursor.execute("""
-                SELECT patient_id, patient_name, gender, phone, id_card, address, created_at as registration_date
-                FROM patient
-                ORDER BY created_at DESC
-                LIMIT 50
-            """)
-        
-        patients = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': patients})
+        limit, after = page_args()
+        
+        def load(after, limit):
+            with get_db() as conn:
+                cursor = conn.cursor()
+                
+                if not keyword:
+                    # 全部患者，按登记时间倒序
+                    return PATIENT_CREATED_KEYSET.fetch(cursor, """
+                        SELECT patient_id, patient_name, gender, phone, id_card, address, created_at as registration_date
+                        FROM patient
+                    """, [], [], limit, after)
+                
+                # 按关键词搜索（按匹配程度排序）
+                patient_ids, next_after = ranked_page(
+                    lambda n: search_patient_ids(cursor, keyword, limit=n), after, limit, MAX_SEARCH_RESULTS)
+                if not patient_ids:
+                    return [], None
+                rows = serializer.rows(cursor, f"""
+                    SELECT patient_id, patient_name, gender, phone, id_card, address, created_at as registration_date
+                    FROM patient
+                    WHERE patient_id IN ({in_placeholders(patient_ids)})
+                """, patient_ids)
+                return order_by_ids(rows, patient_ids), next_after
+        
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        patients, next_after = load(after, limit)
+        
+        return serializer.json_response({'success': True, 'data': patients, 'next_cursor': encode_cursor(next_after)})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
 
 @app.route('/api/receptionist/patient/<int:patient_id>/visits', methods=['GET'])
 def get_patient_visits(patient_id):
-    """获取患者就诊记录"""
+    """获取患者就诊记录，包括已归档的就诊（分页，format=ndjson 时流式导出就诊记录）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取患者信息
-        cursor.execute("""
-            SELECT patient_id, patient_name, gender, phone, id_card, address
-            FROM patient
-            WHERE patient_id = ?
-        """, (patient_id,))
-        
-        patient = cursor.fetchone()
-        if not patient:
-            return jsonify({'success': False, 'message': '患者不存在'})
-        
-        patient = dict(patient)
-        
-        # 获取就诊记录
-        cursor.execute("""
-            SELECT v.visit_id, v.visit_date, v.visit_time, v.status,
-                   d.dept_name,
-                   e.emp_name as doctor_name,
-                   c.room_name,
-                   v.diagnosis
-            FROM visit v
-            LEFT JOIN department d ON v.dept_id = d.dept_id
-            LEFT JOIN employee e ON v.doctor_id = e.emp_id
-            LEFT JOIN clinic_room c ON v.room_id = c.room_id
-            WHERE v.patient_id = ?
-            ORDER BY v.visit_date DESC, v.visit_time DESC
-        """, (patient_id,))
-        
-        visits = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        limit, after = page_args()
+        
+        def load(after, limit):
+            with get_db() as conn:
+                archive.attach(conn)
+                return PATIENT_VISIT_KEYSET.fetch(conn.cursor(), """
+                    SELECT v.visit_id, v.visit_date, v.visit_time, v.status,
+                           d.dept_name,
+                           e.emp_name as doctor_name,
+                           c.room_name,
+                           v.diagnosis
+                    FROM all_visit v
+                    LEFT JOIN department d ON v.dept_id = d.dept_id
+                    LEFT JOIN employee e ON v.doctor_id = e.emp_id
+                    LEFT JOIN clinic_room c ON v.room_id = c.room_id
+                """, ['v.patient_id = ?'], [patient_id], limit, after)
+        
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # 获取患者信息
+            cursor.execute("""
+                SELECT patient_id, patient_name, gender, phone, id_card, address, visit_count
+                FROM patient
+                WHERE patient_id = ?
+            """, (patient_id,))
+            
+            patient = cursor.fetchone()
+            if not patient:
+                return jsonify({'success': False, 'message': '患者不存在'})
+            
+            patient = dict(patient)
         
-        return jsonify({
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        visits, next_after = load(after, limit)
+        
+        return serializer.json_response({
             'success': True,
             'patient': patient,
-            'visits': visits
+            'visits': visits,
+            'next_cursor': encode_cursor(next_after)
         })
         
     except Exception as e:
@@ -337,40 +429,126 @@ def get_patient_visits(patient_id):
 
 @app.route('/api/receptionist/visits', methods=['GET'])
 def get_visits():
-    """查询就诊信息"""
+    """查询就诊信息（分页，format=ndjson 时流式导出）"""
     try:
         status = request.args.get('status')
         date_filter = request.args.get('date', date.today().strftime('%Y-%m-%d'))
+        limit, after = page_args(100)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT v.visit_id, p.patient_name, d.dept_name, 
-                   cr.room_name, v.visit_time, v.status,
-                   e.emp_name as doctor_name
-            FROM visit v
-            JOIN patient p ON v.patient_id = p.patient_id
-            JOIN department d ON v.dept_id = d.dept_id
-            JOIN clinic_room cr ON v.room_id = cr.room_id
-            LEFT JOIN employee e ON v.doctor_id = e.emp_id
-            WHERE v.visit_date = ?
-        """
+        where = ['v.visit_date = ?']
         params = [date_filter]
         
         if status:
-            query += " AND v.status = ?"
+            where.append('v.status = ?')
             params.append(status)
         
-        query += " ORDER BY v.visit_time DESC"
+        def load(after, limit):
+            with get_db() as conn:
+                # 只有日期落在归档分区内时才读主库和归档库的 UNION ALL 视图
+                visit_table = archive.visit_table(conn, date_filter)
+                return DAY_VISIT_KEYSET.fetch(conn.cursor(), f"""
+                    SELECT v.visit_id, p.patient_name, d.dept_name, 
+                           cr.room_name, v.visit_time, v.status,
+                           e.emp_name as doctor_name
+                    FROM {visit_table} v
+                    JOIN patient p ON v.patient_id = p.patient_id
+                    JOIN department d ON v.dept_id = d.dept_id
+                    JOIN clinic_room cr ON v.room_id = cr.room_id
+                    LEFT JOIN employee e ON v.doctor_id = e.emp_id
+                """, where, params, limit, after)
+        
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        visits, next_after = load(after, limit)
+        
+        return serializer.json_response({'success': True, 'data': visits, 'next_cursor': encode_cursor(next_after)})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
+
+VISIT_STATUSES = ('等待就诊', '就诊中', '已完成', '已离院')
+
+@app.route('/api/receptionist/queue/stream', methods=['GET'])
+def stream_queue():
+    """候诊队列推送（Server-Sent Events），由 asgi.py 在事件循环中处理
+
+    请求到了这里说明没有推送：python app.py 等 WSGI 服务器上每个推送连接要一直
+    占用一个线程，asgi.py 多进程部署时各进程又只能看到自己处理的写操作。
+    返回 204，浏览器的 EventSource 不再重连，页面改为定时查询就诊列表。
+    """
+    return Response(status=204)
+
+@app.route('/api/receptionist/visit/<int:visit_id>/status', methods=['POST'])
+def update_visit_status(visit_id):
+    """更新就诊状态"""
+    try:
+        data = request.get_json()
+        status = data.get('status')
+        if status not in VISIT_STATUSES:
+            return jsonify({'success': False, 'message': '无效的就诊状态'})
+        
+        visit_date = writes.submit('update_visit_status', {'visit_id': visit_id, 'status': status})['visit_date']
+        
+        queue_hub.publish_status(visit_date, visit_id, status)
+        
+        return jsonify({'success': True, 'message': '状态已更新'})
+        
+    except WriteError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'更新失败：{str(e)}'})
+
+APPOINTMENT_STATUSES = ('待到院', '已到院', '已取消')
+RECEPTION_APPOINTMENT_KEYSET = Keyset(('a.appt_date', 'a.appt_time', 'a.appt_id'), descending=False)
+
+@app.route('/api/receptionist/appointments', methods=['GET'])
+def get_reception_appointments():
+    """前台查询预约（按日期范围、科室、状态、电话过滤，分页，format=ndjson 时流式导出）"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date') or start_date
+        dept_id = request.args.get('dept_id', type=int)
+        status = request.args.get('status')
+        phone = request.args.get('phone', '').strip()
+        limit, after = page_args()
+        
+        if status and status not in APPOINTMENT_STATUSES:
+            return jsonify({'success': False, 'message': '预约状态无效'})
+        
+        # 按电话查询时可以不限日期，否则默认查当天
+        if not start_date and not phone:
+            start_date = end_date = date.today().strftime('%Y-%m-%d')
+        
+        # 按日期范围 [start, end) 走 idx_appointment_date_dept_status，带电话时走 idx_appointment_phone_date
+        where, params = [], []
+        if start_date:
+            start, end = day_range(start_date, end_date)
+            where += ['a.appt_date >= ?', 'a.appt_date < ?']
+            params += [start, end]
+        if dept_id:
+            where.append('a.dept_id = ?')
+            params.append(dept_id)
+        if status:
+            where.append('a.status = ?')
+            params.append(status)
+        if phone:
+            where.append('a.phone = ?')
+            params.append(phone)
         
-        cursor.execute(query, params)
-        visits = [dict(row) for row in cursor.fetchall()]
+        def load(after, limit):
+            with get_db() as conn:
+                return RECEPTION_APPOINTMENT_KEYSET.fetch(conn.cursor(), """
+                    SELECT a.appt_id, a.patient_name, a.phone, d.dept_name,
+                           a.appt_date, a.appt_time, a.status, a.created_at
+                    FROM appointment a
+                    JOIN department d ON a.dept_id = d.dept_id
+                """, where, params, limit, after)
         
-        cursor.close()
-        conn.close()
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        appointments, next_after = load(after, limit)
         
-        return jsonify({'success': True, 'data': visits})
+        return serializer.json_response({'success': True, 'data': appointments, 'next_cursor': encode_cursor(next_after)})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -381,25 +559,22 @@ def get_visit_info():
     try:
         visit_id = request.args.get('visit_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT v.visit_id, v.patient_id, p.patient_name, p.phone,
-                   d.dept_name, cr.room_name, v.visit_date, v.visit_time
-            FROM visit v
-            JOIN patient p ON v.patient_id = p.patient_id
-            JOIN department d ON v.dept_id = d.dept_id
-            JOIN clinic_room cr ON v.room_id = cr.room_id
-            WHERE v.visit_id = ?
-        """, (visit_id,))
-        
-        visit = cursor.fetchone()
-        if visit:
-            visit = dict(visit)
-        
-        cursor.close()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT v.visit_id, v.patient_id, p.patient_name, p.phone,
+                       d.dept_name, cr.room_name, v.visit_date, v.visit_time
+                FROM visit v
+                JOIN patient p ON v.patient_id = p.patient_id
+                JOIN department d ON v.dept_id = d.dept_id
+                JOIN clinic_room cr ON v.room_id = cr.room_id
+                WHERE v.visit_id = ?
+            """, (visit_id,))
+            
+            visit = cursor.fetchone()
+            if visit:
+                visit = dict(visit)
         
         if visit:
             return jsonify({'success': True, 'data': visit})
@@ -413,73 +588,57 @@ def get_visit_info():
 def create_billing():
     """创建费用账单"""
     try:
-        data = request.get_json()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        total_fee = float(data['total_fee'])
-        insurance_fee = float(data.get('insurance_fee', 0))
-        self_fee = total_fee - insurance_fee
-        
-        # 创建账单
-        cursor.execute("""
-            INSERT INTO billing (visit_id, patient_id, total_fee, insurance_fee, 
-                                self_fee, payment_method, payment_status, payment_time, operator_id)
-            VALUES (?, ?, ?, ?, ?, ?, '已支付', datetime('now'), ?)
-        """, (
-            data['visit_id'],
-            data['patient_id'],
-            total_fee,
-            insurance_fee,
-            self_fee,
-            data['payment_method'],
-            session.get('emp_id')
-        ))
-        
-        # 更新就诊状态为已离院
-        cursor.execute("""
-            UPDATE visit SET status = '已离院' WHERE visit_id = ?
-        """, (data['visit_id'],))
-        
-        conn.commit()
-        bill_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        data = dict(request.get_json(), operator_id=session.get('emp_id'))
+        bill = writes.submit('create_billing', data)
+        
+        if bill['visit_date']:
+            queue_hub.publish_status(bill['visit_date'], int(data['visit_id']), '已离院',
+                                     event_type='billed', bill_id=bill['bill_id'], total_fee=bill['total_fee'],
+                                     dept_id=bill['dept_id'])
         
         return jsonify({
             'success': True,
             'message': '缴费成功',
-            'bill_id': bill_id
+            'bill_id': bill['bill_id']
         })
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'缴费失败：{str(e)}'})
 
+@app.route('/api/receptionist/billing/<int:bill_id>/refund', methods=['POST'])
+def refund_billing(bill_id):
+    """账单退款"""
+    try:
+        writes.submit('refund_billing', {'bill_id': bill_id})
+        dashboard_counters.record_refund(bill_id)
+        
+        return jsonify({'success': True, 'message': '退款成功'})
+        
+    except WriteError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'退款失败：{str(e)}'})
+
 @app.route('/api/rooms', methods=['GET'])
+@cached_response('clinic_room')
 def get_rooms():
     """获取诊室列表"""
     try:
         dept_id = request.args.get('dept_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if dept_id:
-            cursor.execute("""
-                SELECT room_id, room_name, status 
-                FROM clinic_room 
-                WHERE dept_id = ? AND status = '开放'
-            """, (dept_id,))
-        else:
-            cursor.execute("SELECT room_id, room_name, status FROM clinic_room WHERE status = '开放'")
-        
-        rooms = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            if dept_id:
+                rooms = serializer.rows(cursor, """
+                    SELECT room_id, room_name, status 
+                    FROM clinic_room 
+                    WHERE dept_id = ? AND status = '开放'
+                """, (dept_id,))
+            else:
+                rooms = serializer.rows(cursor, "SELECT room_id, room_name, status FROM clinic_room WHERE status = '开放'")
         
-        return jsonify({'success': True, 'data': rooms})
+        return serializer.json_response({'success': True, 'data': rooms})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -488,55 +647,20 @@ def get_rooms():
 
 @app.route('/api/admin/dashboard', methods=['GET'])
 def get_dashboard():
-    """获取仪表板数据"""
+    """获取仪表板数据（内存中的今日计数，见 dashboard.py）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 今日就诊人次
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM visit 
-            WHERE visit_date = date('now')
-        """)
-        today_visits = cursor.fetchone()
-        today_visits = dict(today_visits) if today_visits else {'count': 0}
-        
-        # 今日收入
-        cursor.execute("""
-            SELECT COALESCE(SUM(total_fee), 0) as revenue FROM billing 
-            WHERE date(payment_time) = date('now') AND payment_status = '已支付'
-        """)
-        today_revenue = cursor.fetchone()
-        today_revenue = dict(today_revenue) if today_revenue else {'revenue': 0}
-        
-        # 待就诊患者数
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM visit 
-            WHERE visit_date = date('now') AND status = '等待就诊'
-        """)
-        waiting_patients = cursor.fetchone()
-        waiting_patients = dict(waiting_patients) if waiting_patients else {'count': 0}
-        
-        # 在职医生数
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM employee 
-            WHERE emp_type = '医生' AND work_status = '在职'
-        """)
-        active_doctors = cursor.fetchone()
-        active_doctors = dict(active_doctors) if active_doctors else {'count': 0}
-        
-        cursor.close()
-        conn.close()
+        return jsonify({'success': True, 'data': dashboard_counters.summary(),
+                        'counted_from': dashboard_counters.describe()})
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'today_visits': today_visits['count'],
-                'today_revenue': float(today_revenue['revenue']),
-                'waiting_patients': waiting_patients['count'],
-                'active_doctors': active_doctors['count']
-            }
-        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
+
+@app.route('/api/admin/dashboard/breakdown', methods=['GET'])
+def get_dashboard_breakdown():
+    """今日按科室、诊室的就诊人次、候诊人数和科室收入"""
+    try:
+        return jsonify({'success': True, 'data': dashboard_counters.breakdown(),
+                        'counted_from': dashboard_counters.describe()})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -548,152 +672,194 @@ def get_statistics():
         stat_type = request.args.get('type', 'daily')
         start_date = request.args.get('start_date', date.today().strftime('%Y-%m-%d'))
         end_date = request.args.get('end_date', date.today().strftime('%Y-%m-%d'))
+        range_start, range_end = day_range(start_date, end_date)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if stat_type == 'daily':
-            # 按日期统计
-            cursor.execute("""
-                SELECT date(b.payment_time) as stat_date,
-                       COUNT(DISTINCT v.visit_id) as visit_count,
-                       SUM(b.total_fee) as total_revenue
-                FROM billing b
-                JOIN visit v ON b.visit_id = v.visit_id
-                WHERE b.payment_status = '已支付'
-                  AND date(b.payment_time) BETWEEN ? AND ?
-                GROUP BY date(b.payment_time)
-                ORDER BY stat_date
-            """, (start_date, end_date))
+        with reporting_db() as conn:
+            cursor = conn.cursor()
             
-        elif stat_type == 'department':
-            # 按科室统计
-            cursor.execute("""
-                SELECT d.dept_name,
-                       COUNT(DISTINCT v.visit_id) as visit_count,
-                       SUM(b.total_fee) as total_revenue
-                FROM billing b
-                JOIN visit v ON b.visit_id = v.visit_id
-                JOIN department d ON v.dept_id = d.dept_id
-                WHERE b.payment_status = '已支付'
-                  AND date(b.payment_time) BETWEEN ? AND ?
-                GROUP BY d.dept_id, d.dept_name
-                ORDER BY total_revenue DESC
-            """, (start_date, end_date))
+            # 按日期、科室、医生的统计都读取 revenue_summary 汇总表，
+            # 该表由 billing 表上的触发器随缴费、退款同步维护；一次就诊可能在几天
+            # 分别缴费，多日的科室、医生人次从 revenue_visit 按就诊去重计算
+            params = (range_start, range_end)
+            if stat_type == 'daily':
+                # 按日期统计
+                sql = """
+                    SELECT stat_date,
+                           SUM(total_visits) as visit_count,
+                           SUM(total_revenue) as total_revenue
+                    FROM revenue_summary
+                    WHERE stat_date >= ? AND stat_date < ?
+                    GROUP BY stat_date
+                    ORDER BY stat_date
+                """
             
-        elif stat_type == 'doctor':
-            # 按医生统计
-            cursor.execute("""
-                SELECT e.emp_name,
-                       d.dept_name,
-                       COUNT(DISTINCT v.visit_id) as visit_count,
-                       SUM(b.total_fee) as total_revenue
-                FROM billing b
-                JOIN visit v ON b.visit_id = v.visit_id
-                JOIN employee e ON v.doctor_id = e.emp_id
-                JOIN department d ON v.dept_id = d.dept_id
-                WHERE b.payment_status = '已支付'
-                  AND date(b.payment_time) BETWEEN ? AND ?
-                GROUP BY e.emp_id, e.emp_name, d.dept_name
-                ORDER BY total_revenue DESC
-            """, (start_date, end_date))
-        else:
-            return jsonify({'success': False, 'message': '不支持的统计类型'})
+            elif stat_type == 'department':
+                # 按科室统计
+                sql = """
+                    SELECT d.dept_name,
+                           rv.visit_count,
+                           rs.total_revenue
+                    FROM (
+                        SELECT dept_id, SUM(total_revenue) as total_revenue
+                        FROM revenue_summary
+                        WHERE stat_date >= ? AND stat_date < ?
+                        GROUP BY dept_id
+                    ) rs
+                    JOIN (
+                        SELECT dept_id, COUNT(DISTINCT visit_id) as visit_count
+                        FROM revenue_visit
+                        WHERE stat_date >= ? AND stat_date < ?
+                        GROUP BY dept_id
+                    ) rv ON rv.dept_id = rs.dept_id
+                    JOIN department d ON rs.dept_id = d.dept_id
+                    ORDER BY total_revenue DESC
+                """
+                params = params * 2
+            
+            elif stat_type == 'doctor':
+                # 按医生统计
+                sql = """
+                    SELECT e.emp_name,
+                           d.dept_name,
+                           rv.visit_count,
+                           rs.total_revenue
+                    FROM (
+                        SELECT doctor_id, dept_id, SUM(total_revenue) as total_revenue
+                        FROM revenue_summary
+                        WHERE stat_date >= ? AND stat_date < ?
+                        GROUP BY doctor_id, dept_id
+                    ) rs
+                    JOIN (
+                        SELECT doctor_id, dept_id, COUNT(DISTINCT visit_id) as visit_count
+                        FROM revenue_visit
+                        WHERE stat_date >= ? AND stat_date < ?
+                        GROUP BY doctor_id, dept_id
+                    ) rv ON rv.doctor_id = rs.doctor_id AND rv.dept_id = rs.dept_id
+                    JOIN employee e ON rs.doctor_id = e.emp_id
+                    JOIN department d ON rs.dept_id = d.dept_id
+                    ORDER BY total_revenue DESC
+                """
+                params = params * 2
+            else:
+                return jsonify({'success': False, 'message': '不支持的统计类型'})
+            
+            # 金额统一返回 float
+            statistics = serializer.rows(cursor, sql, params, coerce={'total_revenue': float})
         
-        statistics = [dict(row) for row in cursor.fetchall()]
+        return serializer.json_response({'success': True, 'data': statistics, 'read_from': read_source().describe()})
         
-        # 格式化数据
-        for stat in statistics:
-            if 'total_revenue' in stat and stat['total_revenue']:
-                stat['total_revenue'] = float(stat['total_revenue'])
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'统计失败：{str(e)}'})
+
+@app.route('/api/admin/analytics', methods=['GET'])
+def get_analytics():
+    """多维统计分析（读取 analytics.py 导出的列式文件）
+
+    by 为逗号分隔的分组维度（date、week、month、dept、doctor、payment_method），
+    percentiles 为逗号分隔的费用分位数，如 50,90。
+    """
+    try:
+        start_date = request.args.get('start_date', date.today().strftime('%Y-%m-%d'))
+        end_date = request.args.get('end_date', date.today().strftime('%Y-%m-%d'))
+        dimensions = [d for d in request.args.get('by', 'dept').split(',') if d]
+        percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p]
         
-        cursor.close()
-        conn.close()
+        facts = analytics.load_facts(analytics.facts_file(get_pool().db_file))
+        with get_db() as conn:
+            names = analytics.load_names(conn.cursor())
+        rows = facts.between(start_date, end_date).group(dimensions, percentiles, names)
         
-        return jsonify({'success': True, 'data': statistics})
+        return jsonify({'success': True, 'data': rows, 'exported_at': facts.exported_at})
         
+    except analytics.AnalyticsError as e:
+        return jsonify({'success': False, 'message': str(e)})
     except Exception as e:
         return jsonify({'success': False, 'message': f'统计失败：{str(e)}'})
 
 @app.route('/api/admin/patients', methods=['GET'])
 def search_patients():
-    """查询患者信息"""
+    """查询患者信息（分页，format=ndjson 时流式导出）"""
     try:
-        keyword = request.args.get('keyword', '')
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT p.patient_id, p.patient_name, p.gender, p.phone, p.id_card,
-                   COUNT(v.visit_id) as visit_count,
-                   MAX(v.visit_date) as last_visit_date
-            FROM patient p
-            LEFT JOIN visit v ON p.patient_id = v.patient_id
-            WHERE p.patient_name LIKE ? 
-               OR p.phone LIKE ? 
-               OR p.id_card LIKE ?
-            GROUP BY p.patient_id
-            ORDER BY last_visit_date DESC
-            LIMIT 100
-        """, (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
-        
-        patients = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': patients})
+        keyword = request.args.get('keyword', '').strip()
+        limit, after = page_args(100)
+        
+        def load(after, limit):
+            with reporting_db() as conn:
+                cursor = conn.cursor()
+                
+                where, params = [], []
+                if keyword:
+                    # 先用搜索索引找出最匹配的患者，再按最近就诊日期分页
+                    patient_ids = search_patient_ids(cursor, keyword, limit=MAX_SEARCH_RESULTS)
+                    if not patient_ids:
+                        return [], None
+                    where.append(f'patient_id IN ({in_placeholders(patient_ids)})')
+                    params = patient_ids
+                
+                # visit_count、last_visit_date 由就诊登记时的触发器维护
+                return PATIENT_LAST_VISIT_KEYSET.fetch(cursor, """
+                    SELECT patient_id, patient_name, gender, phone, id_card,
+                           visit_count, last_visit_date
+                    FROM patient
+                """, where, params, limit, after)
+        
+        if wants_ndjson():
+            # 导出开始前确定数据来源，响应头中带上快照时间
+            read_source()
+            return ndjson_response(load, after)
+        patients, next_after = load(after, limit)
+        
+        return serializer.json_response({'success': True, 'data': patients, 'next_cursor': encode_cursor(next_after),
+                                         'read_from': read_source().describe()})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
 
 @app.route('/api/admin/employees', methods=['GET'])
+@cached_response('employee', 'department')
 def get_employees():
-    """查询员工信息"""
+    """查询员工信息（分页，format=ndjson 时流式导出）
+
+    响应按表版本号缓存，只有读主库时缓存才与写操作同步失效，不走只读快照。
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        limit, after = page_args(MAX_PAGE_SIZE)
         
-        cursor.execute("""
-            SELECT e.emp_id, e.emp_name, e.emp_type, d.dept_name,
-                   e.title, e.phone, e.work_status
-            FROM employee e
-            LEFT JOIN department d ON e.dept_id = d.dept_id
-            ORDER BY e.emp_id
-        """)
+        def load(after, limit):
+            with get_db() as conn:
+                return EMPLOYEE_KEYSET.fetch(conn.cursor(), """
+                    SELECT e.emp_id, e.emp_name, e.emp_type, d.dept_name,
+                           e.title, e.phone, e.work_status
+                    FROM employee e
+                    LEFT JOIN department d ON e.dept_id = d.dept_id
+                """, [], [], limit, after)
         
-        employees = [dict(row) for row in cursor.fetchall()]
+        if wants_ndjson():
+            return ndjson_response(load, after)
+        employees, next_after = load(after, limit)
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': employees})
+        return serializer.json_response({'success': True, 'data': employees, 'next_cursor': encode_cursor(next_after)})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
 
 @app.route('/api/admin/doctors', methods=['GET'])
+@cached_response('employee', 'department')
 def get_doctors():
     """获取医生列表"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT e.emp_id, e.emp_name, e.title, d.dept_name
-            FROM employee e
-            LEFT JOIN department d ON e.dept_id = d.dept_id
-            WHERE e.emp_type = '医生' AND e.work_status = '在职'
-            ORDER BY e.emp_id
-        """)
-        
-        doctors = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            doctors = serializer.rows(cursor, """
+                SELECT e.emp_id, e.emp_name, e.title, d.dept_name
+                FROM employee e
+                LEFT JOIN department d ON e.dept_id = d.dept_id
+                WHERE e.emp_type = '医生' AND e.work_status = '在职'
+                ORDER BY e.emp_id
+            """)
         
-        return jsonify({'success': True, 'data': doctors})
+        return serializer.json_response({'success': True, 'data': doctors})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -703,26 +869,9 @@ def create_schedule():
     """创建医生排班"""
     try:
         data = request.get_json()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO doctor_schedule (doctor_id, room_id, work_date, start_time, end_time, max_patients)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            data['doctor_id'],
-            data['room_id'],
-            data['work_date'],
-            data['start_time'],
-            data['end_time'],
-            data.get('max_patients', 30)
-        ))
-        
-        conn.commit()
-        schedule_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        schedule_id = writes.submit('create_schedule', data)['schedule_id']
+        
+        reference_cache.invalidate('doctor_schedule')
         
         return jsonify({
             'success': True,
@@ -734,32 +883,28 @@ def create_schedule():
         return jsonify({'success': False, 'message': f'排班失败：{str(e)}'})
 
 @app.route('/api/admin/schedules', methods=['GET'])
+@cached_response('doctor_schedule', 'employee', 'clinic_room', 'department')
 def get_schedules():
     """查询排班信息"""
     try:
-        work_date = request.args.get('date', date.today().strftime('%Y-%m-%d'))
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        work_date = request.args.get('date', utc_today())
         
-        cursor.execute("""
-            SELECT ds.schedule_id, e.emp_name as doctor_name, e.title,
-                   d.dept_name, cr.room_name, ds.work_date,
-                   ds.start_time, ds.end_time, ds.max_patients, ds.current_patients
-            FROM doctor_schedule ds
-            JOIN employee e ON ds.doctor_id = e.emp_id
-            JOIN clinic_room cr ON ds.room_id = cr.room_id
-            JOIN department d ON cr.dept_id = d.dept_id
-            WHERE ds.work_date = ?
-            ORDER BY ds.start_time
-        """, (work_date,))
-        
-        schedules = [dict(row) for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'data': schedules})
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            schedules = serializer.rows(cursor, """
+                SELECT ds.schedule_id, e.emp_name as doctor_name, e.title,
+                       d.dept_name, cr.room_name, ds.work_date,
+                       ds.start_time, ds.end_time, ds.max_patients, ds.current_patients
+                FROM doctor_schedule ds
+                JOIN employee e ON ds.doctor_id = e.emp_id
+                JOIN clinic_room cr ON ds.room_id = cr.room_id
+                JOIN department d ON cr.dept_id = d.dept_id
+                WHERE ds.work_date = ?
+                ORDER BY ds.start_time
+            """, (work_date,))
+        
+        return serializer.json_response({'success': True, 'data': schedules})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'查询失败：{str(e)}'})
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+历史数据归档
+
+就诊日期早于保留期限、已经结束（已完成、已离院）且没有未支付账单的就诊，
+连同它的账单一起从主库移到按年（或按月）分开的归档库
+archive/<主库名>_<分区>.db 中。主库只保留近期数据，表和索引小，能常驻页缓存。
+
+    python archive.py run [--db hospital.db] [--keep-days 365 | --before 2025-01-01]
+                          [--by year|month] [--vacuum]
+    python archive.py list [--db hospital.db]
+
+读取历史数据的查询使用临时视图 all_visit、all_billing（主库与全部归档库的
+UNION ALL），对连接调用 attach(conn) 后可用：患者就诊记录、按日期查询就诊
+（日期落在归档分区内时，见 visit_table）、汇总数据的重建和核对都通过这两个视图
+读取。收入统计读取 revenue_summary、revenue_visit 汇总表，billing 上没有删除
+触发器，归档不改变汇总表；患者的就诊次数同样保留。
+
+- 每个分区分两步移动：先复制到归档库并提交；再在一个事务中重新检查条件，
+  复制之后不再符合条件（又产生了账单、改了状态）的就诊从归档库中删掉，其余的
+  按主库当前内容重新复制并从主库删除，all_visit、all_billing 中不会出现两份。
+  中途中断时记录会同时出现在两边（list 会提示），重新运行 run 即可完成移动
+- 归档后的账单不能再退款，保留期限应长于退款期限
+- 一个连接最多附加 SQLITE_LIMIT_ATTACHED 个数据库（一般为10），按年分区
+  可以覆盖约9年，按月分区只适合归档时间较短的情况
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+from backends import dialect
+from db import write_transaction
+
+ARCHIVE_DIR = 'archive'
+
+# 默认保留最近多少天的就诊
+DEFAULT_KEEP_DAYS = 365
+
+# 归档的表，视图名为 all_<表名>
+ARCHIVED_TABLES = ('visit', 'billing')
+
+CLOSED_VISIT_STATUSES = ('已完成', '已离院')
+
+# 归档库的索引，对应主库中按日期、按患者查询就诊和按就诊查询账单的索引
+ARCHIVE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_visit_date_time ON visit(visit_date, visit_time)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_visit_patient_date ON visit(patient_id, visit_date, visit_time)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_billing_visit ON billing(visit_id, payment_status, payment_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_billing_status_time ON billing(payment_status, payment_time)",
+)
+
+_PARTITION = re.compile(r'\d{4}(-\d{2})?')
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?["`\[]?\w+["`\]]?', re.I)
+
+_listings = {}
+_listings_lock = threading.Lock()
+
+
+class ArchiveError(Exception):
+    """归档库无法附加或归档参数无效"""
+
+
+def archive_dir(db_file):
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), ARCHIVE_DIR)
+
+
+def archive_file(db_file, partition):
+    stem = os.path.splitext(os.path.basename(db_file))[0]
+    return os.path.join(archive_dir(db_file), f'{stem}_{partition}.db')
+
+
+def list_archives(db_file):
+    """返回主库的归档库 [(分区, 文件路径)]，按分区排序；目录未变化时使用缓存"""
+    directory = archive_dir(db_file)
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    key = os.path.abspath(db_file)
+    with _listings_lock:
+        cached = _listings.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    prefix = os.path.splitext(os.path.basename(db_file))[0] + '_'
+    archives = []
+    for name in os.listdir(directory):
+        partition = name[len(prefix):-3] if name.startswith(prefix) and name.endswith('.db') else ''
+        if _PARTITION.fullmatch(partition):
+            archives.append((partition, os.path.join(directory, name)))
+    archives.sort()
+    with _listings_lock:
+        _listings[key] = (mtime, archives)
+    return archives
+
+
+def _schema(partition):
+    return 'arch_' + partition.replace('-', '_')
+
+
+def _main_file(conn):
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == 'main':
+            return row[2] or None
+    return None
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _union_sql(conn, table, schemas):
+    # 以主库的列为准，归档库缺少的列（归档之后新增的列）补 NULL
+    columns = _columns(conn, 'main', table)
+    selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for schema in schemas:
+        existing = set(_columns(conn, schema, table))
+        select_list = ', '.join(c if c in existing else f'NULL AS {c}' for c in columns)
+        selects.append(f"SELECT {select_list} FROM {schema}.{table}")
+    return '\nUNION ALL\n'.join(selects)
+
+
+def attach(conn):
+    """附加主库的全部归档库，并创建临时视图 all_visit、all_billing
+
+    已是最新时只做两次很小的查询。会执行 ATTACH，不能在事务中调用。
+    MySQL 不归档，all_visit、all_billing 是 database/schema.sql 中的普通视图。
+    """
+    if dialect(conn) != 'sqlite':
+        return
+    db_file = _main_file(conn)
+    wanted = {_schema(partition): path for partition, path in (list_archives(db_file) if db_file else [])}
+    attached = {row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith('arch_')}
+    views = conn.execute("""
+        SELECT COUNT(*) FROM temp.sqlite_master WHERE type = 'view' AND name IN ('all_visit', 'all_billing')
+    """).fetchone()[0]
+    if views == len(ARCHIVED_TABLES) and attached == set(wanted):
+        return
+
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(wanted) > limit:
+        raise ArchiveError(f'归档库有 {len(wanted)} 个，超过可附加的数据库数 {limit}，请按年重新归档')
+    for schema in attached - set(wanted):
+        conn.execute(f"DETACH DATABASE {schema}")
+    for schema in sorted(set(wanted) - attached):
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (wanted[schema],))
+    for table in ARCHIVED_TABLES:
+        conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+        conn.execute(f"CREATE TEMP VIEW all_{table} AS {_union_sql(conn, table, sorted(wanted))}")
+
+
+def visit_table(conn, visit_date):
+    """按就诊日期查询时使用的表：日期落在某个归档分区内时附加归档库并返回 all_visit，
+    否则返回主库的 visit（当天的就诊不必经过 UNION ALL 视图）"""
+    db_file = _main_file(conn) if dialect(conn) == 'sqlite' else None
+    for partition, _ in (list_archives(db_file) if db_file else []):
+        start, end = _partition_range(partition)
+        if start <= visit_date < end:
+            attach(conn)
+            return 'all_visit'
+    return 'visit'
+
+
+# ==================== 归档 ====================
+
+def _partition_range(partition):
+    year = int(partition[:4])
+    if len(partition) == 4:
+        return f'{year:04d}-01-01', f'{year + 1:04d}-01-01'
+    month = int(partition[5:7])
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return f'{year:04d}-{month:02d}-01', end.isoformat()
+
+
+def _prepare_archive(conn, schema):
+    """在归档库中建表（与主库相同的定义）和索引，补上主库新增的列"""
+    for table in ARCHIVED_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table,)).fetchone()[0]
+        conn.execute(_CREATE_TABLE.sub(f'CREATE TABLE IF NOT EXISTS {schema}.{table}', sql, count=1))
+        existing = set(_columns(conn, schema, table))
+        for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            if row[1] not in existing:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {row[1]} {row[2]}")
+    for sql in ARCHIVE_INDEXES:
+        conn.execute(sql.format(schema=schema))
+    conn.commit()
+
+
+def _archive_partition(conn, db_file, partition, before):
+    path = archive_file(db_file, partition)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start, end = _partition_range(partition)
+    end = min(end, before)
+    placeholders = ', '.join('?' * len(CLOSED_VISIT_STATUSES))
+
+    conn.execute("ATTACH DATABASE ? AS archive_target", (path,))
+    try:
+        _prepare_archive(conn, 'archive_target')
+        conn.execute("DROP TABLE IF EXISTS temp.archive_visits")
+        conn.execute("DROP TABLE IF EXISTS temp.archive_bills")
+        conn.execute(f"""
+            CREATE TEMP TABLE archive_visits AS
+            SELECT visit_id FROM main.visit v
+            WHERE v.visit_date >= ? AND v.visit_date < ? AND v.status IN ({placeholders})
+              AND NOT EXISTS (
+                  SELECT 1 FROM main.billing b
+                  WHERE b.visit_id = v.visit_id AND b.payment_status = '未支付'
+              )
+        """, (start, end) + CLOSED_VISIT_STATUSES)
+        conn.execute("""
+            CREATE TEMP TABLE archive_bills AS
+            SELECT bill_id FROM main.billing WHERE visit_id IN (SELECT visit_id FROM temp.archive_visits)
+        """)
+        conn.commit()
+
+        def copy(cursor):
+            counts = []
+            for table, key, batch in (('visit', 'visit_id', 'archive_visits'), ('billing', 'bill_id', 'archive_bills')):
+                columns = ', '.join(_columns(conn, 'main', table))
+                cursor.execute(f"""
+                    INSERT OR REPLACE INTO archive_target.{table} ({columns})
+                    SELECT {columns} FROM main.{table} WHERE {key} IN (SELECT {key} FROM temp.{batch})
+                """)
+                counts.append(cursor.rowcount)
+            return counts
+
+        def move(cursor):
+            # 复制之后又产生账单、改了状态的就诊不再归档
+            cursor.execute(f"""
+                DELETE FROM temp.archive_visits
+                WHERE visit_id IN (
+                    SELECT v.visit_id FROM main.visit v
+                    WHERE v.visit_id IN (SELECT visit_id FROM temp.archive_visits)
+                      AND (v.status NOT IN ({placeholders}) OR EXISTS (
+                          SELECT 1 FROM main.billing b
+                          WHERE b.visit_id = v.visit_id
+                            AND (b.payment_status = '未支付'
+                                 OR b.bill_id NOT IN (SELECT bill_id FROM temp.archive_bills))
+                      ))
+                )
+            """, CLOSED_VISIT_STATUSES)
+            cursor.execute("""
+                DELETE FROM temp.archive_bills
+                WHERE bill_id NOT IN (
+                    SELECT bill_id FROM main.billing
+                    WHERE visit_id IN (SELECT visit_id FROM temp.archive_visits)
+                )
+            """)
+            # 归档库中仍留在主库的就诊（上面跳过的，或以前中断后不再符合条件的）删掉，
+            # 本批就诊也删掉后按主库的当前内容重新复制
+            cursor.execute("""
+                DELETE FROM archive_target.billing
+                WHERE visit_id IN (
+                    SELECT a.visit_id FROM archive_target.visit a
+                    WHERE a.visit_date >= ? AND a.visit_date < ?
+                      AND EXISTS (SELECT 1 FROM main.visit v WHERE v.visit_id = a.visit_id)
+                )
+            """, (start, end))
+            cursor.execute("""
+                DELETE FROM archive_target.visit
+                WHERE visit_date >= ? AND visit_date < ?
+                  AND EXISTS (SELECT 1 FROM main.visit v WHERE v.visit_id = visit.visit_id)
+            """, (start, end))
+            counts = copy(cursor)
+            cursor.execute("DELETE FROM main.billing WHERE bill_id IN (SELECT bill_id FROM temp.archive_bills)")
+            cursor.execute("DELETE FROM main.visit WHERE visit_id IN (SELECT visit_id FROM temp.archive_visits)")
+            return counts
+
+        # 先复制并提交：WAL 模式下跨库的提交不是原子的，删除之前归档库中已经有一份
+        write_transaction(conn, copy)
+        visits, bills = write_transaction(conn, move)
+        conn.execute("DROP TABLE temp.archive_visits")
+        conn.execute("DROP TABLE temp.archive_bills")
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE archive_target")
+    return visits, bills
+
+
+def archive_before(conn, before, by='year'):
+    """把就诊日期早于 before 的已结束就诊及其账单移到归档库，返回 [(分区, 就诊数, 账单数)]"""
+    db_file = _main_file(conn)
+    if db_file is None:
+        raise ArchiveError('内存数据库不能归档')
+    length = 4 if by == 'year' else 7
+    placeholders = ', '.join('?' * len(CLOSED_VISIT_STATUSES))
+    partitions = [row[0] for row in conn.execute(f"""
+        SELECT DISTINCT substr(visit_date, 1, {length}) FROM visit
+        WHERE visit_date < ? AND status IN ({placeholders})
+        ORDER BY 1
+    """, (before,) + CLOSED_VISIT_STATUSES)]
+    conn.commit()
+    results = []
+    for partition in partitions:
+        visits, bills = _archive_partition(conn, db_file, partition, before)
+        results.append((partition, visits, bills))
+    return results
+
+
+def describe(conn):
+    """主库与各归档库的就诊数、账单数，以及同时出现在两边的就诊数"""
+    db_file = _main_file(conn)
+    attach(conn)
+    rows = [('主库', db_file, conn.execute("SELECT COUNT(*) FROM main.visit").fetchone()[0],
+             conn.execute("SELECT COUNT(*) FROM main.billing").fetchone()[0], 0)]
+    for partition, path in list_archives(db_file):
+        schema = _schema(partition)
+        rows.append((partition, path,
+                     conn.execute(f"SELECT COUNT(*) FROM {schema}.visit").fetchone()[0],
+                     conn.execute(f"SELECT COUNT(*) FROM {schema}.billing").fetchone()[0],
+                     conn.execute(f"""
+                         SELECT COUNT(*) FROM {schema}.visit a
+                         WHERE EXISTS (SELECT 1 FROM main.visit v WHERE v.visit_id = a.visit_id)
+                     """).fetchone()[0]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史就诊和账单归档')
+    parser.add_argument('command', choices=['run', 'list'])
+    parser.add_argument('--db', default='hospital.db', help='数据库文件')
+    parser.add_argument('--keep-days', type=int, default=DEFAULT_KEEP_DAYS, help='主库保留最近多少天的就诊')
+    parser.add_argument('--before', help='归档就诊日期早于该日期（YYYY-MM-DD）的记录，优先于 --keep-days')
+    parser.add_argument('--by', choices=['year', 'month'], default='year', help='归档库分区方式')
+    parser.add_argument('--vacuum', action='store_true', help='归档后整理主库文件（期间会阻塞其他读写）')
+    args = parser.parse_args()
+
+    import migrations
+    conn = sqlite3.connect(args.db)
+    migrations.upgrade(conn)
+    conn.execute("PRAGMA busy_timeout = 5000")
+
+    if args.command == 'run':
+        before = args.before or (date.today() - timedelta(days=args.keep_days)).isoformat()
+        print(f"归档 {before} 之前已结束的就诊（按{'年' if args.by == 'year' else '月'}分区）...")
+        results = archive_before(conn, before, args.by)
+        for partition, visits, bills in results:
+            print(f"  {partition}: {visits} 条就诊，{bills} 条账单 → {archive_file(args.db, partition)}")
+        if not results:
+            print("  没有需要归档的记录")
+        if args.vacuum:
+            conn.execute("VACUUM")
+            print("✓ 主库已整理")
+    else:
+        for name, path, visits, bills, duplicates in describe(conn):
+            size = os.path.getsize(path) / 1024 / 1024
+            print(f"  {name:<10}{visits:>10} 条就诊{bills:>10} 条账单{size:>10.1f} MB  {path}")
+            if duplicates:
+                print(f"  ✗ {duplicates} 条就诊同时在主库和归档库中（归档中断），请重新运行 run")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 服务入口（生产模式）
+
+    python asgi.py [--host 0.0.0.0] [--port 5000] [--workers 1] [--threads 8] [--db hospital.db]
+
+也可以用其他 ASGI 服务器加载 asgi:application，线程数和数据库文件通过环境变量
+HMS_THREADS、HMS_DB 设置：
+
+    HMS_THREADS=16 uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+- 普通接口仍由 app.py 的 Flask 视图处理，在有界线程池（threads 个线程，数据库
+  连接池同样大小）中执行。事件循环只负责收发HTTP，慢客户端和空闲的长连接
+  不占线程。排队的请求超过 threads * PENDING_PER_THREAD 时直接返回 503。
+- 候诊队列推送（/api/receptionist/queue/stream）直接在事件循环中实现，
+  每个连接只是一个协程，不占线程。python app.py 等 WSGI 服务器不提供推送
+  （app.stream_queue 返回 204），前台页面改为定时查询。
+- 收到 SIGINT/SIGTERM 后先结束所有推送连接（浏览器的 EventSource 会自动重连），
+  服务器等进行中的请求处理完，再关闭线程池和数据库连接。
+- workers 为进程数，每个进程有自己的线程池。workers > 1 时自动启动单写进程
+  （writes.py），各进程的写操作都交给它合并提交，读操作在各进程并行执行；
+  也可以用 --writer host:port 连接单独启动的写进程（两边设置相同的
+  HMS_WRITER_KEY 认证密钥）。--group-commit-ms 为合并提交的等待窗口：单进程
+  时开启进程内合并提交，多进程时传给自动启动的写进程。
+- 候诊队列推送的 queue_hub 在每个进程的内存中，只能看到本进程处理的写操作；
+  多进程推送需要各进程共享的事件来源（如由写进程发布事件），目前没有，所以
+  workers > 1 时关闭推送（HMS_QUEUE_STREAM=0），前台页面改为定时查询。
+- --replica-refresh 秒数：每隔这段时间把数据库复制成只读快照，管理端报表查询
+  改读快照（见 replica.py）。刷新在启动服务的主进程中进行，各工作进程共用。
+- --db 也可以是 MySQL 地址（mysql://用户:密码@主机:3306/hospital_management，见
+  backends.py）。MySQL 本身支持多个连接并发写入，workers > 1 时不启动写进程。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qs
+
+import backends
+import db
+import replica
+import writes
+from dashboard import dashboard_counters
+from queue_events import queue_hub, fetch_queue_rows, format_sse
+
+# 默认线程数（同时也是数据库连接池大小）
+DEFAULT_THREADS = db.POOL_SIZE
+
+# 每个线程最多排队的请求数，超过后返回 503
+PENDING_PER_THREAD = 8
+
+# 请求体上限（字节）
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+# 流式响应（如 NDJSON 导出）每次在线程中攒够多少字节再发送
+STREAM_CHUNK_BYTES = 64 * 1024
+
+QUEUE_STREAM_PATH = '/api/receptionist/queue/stream'
+# 设为 0 时不提供推送，请求交给 app.stream_queue（返回 204）
+QUEUE_STREAM_ENV = 'HMS_QUEUE_STREAM'
+KEEPALIVE_SECONDS = 15
+
+SHUTDOWN_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def _load_queue(day):
+    with db.get_db() as conn:
+        return fetch_queue_rows(conn.cursor(), day)
+
+
+def _json_body(data):
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class HospitalASGI:
+    """把 Flask 应用包装成 ASGI 应用
+
+    Flask 应用和数据库连接池在启动时（lifespan startup，或第一个请求时）才创建，
+    这样 python asgi.py 可以先设置好环境变量再交给服务器加载。
+    """
+
+    def __init__(self):
+        self.wsgi_app = None
+        self.executor = None
+        self.threads = None
+        self.max_pending = None
+        self.pending = 0
+        self.closing = False
+        self.queue_stream = True
+        self._loop = None
+        self._streams = set()
+
+    # ==================== 启动与关闭 ====================
+
+    def _start(self):
+        if self.wsgi_app is not None:
+            return
+        self.threads = int(os.environ.get('HMS_THREADS', DEFAULT_THREADS))
+        self.max_pending = self.threads * PENDING_PER_THREAD
+        self.queue_stream = os.environ.get(QUEUE_STREAM_ENV, '1') != '0'
+        db.configure(os.environ.get('HMS_DB', db.DB_FILE), pool_size=self.threads)
+        writes.configure_from_env()
+        replica.configure_from_env()
+        from app import app
+        self.wsgi_app = app.wsgi_app
+        self._loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='hms-worker')
+
+    def _install_signal_handlers(self):
+        # 服务器会先等所有连接结束再通知 lifespan.shutdown，推送连接不会自己结束，
+        # 所以收到退出信号时先关闭推送连接，再交给服务器原来的处理函数
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for sig in SHUTDOWN_SIGNALS:
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                self._loop.call_soon_threadsafe(self.begin_shutdown)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def begin_shutdown(self):
+        """停止接受新的推送连接并结束已有的推送连接（在事件循环线程中调用）"""
+        self.closing = True
+        for subscriber in list(self._streams):
+            subscriber.close()
+
+    def _stop(self):
+        self.executor.shutdown(wait=True)
+        dashboard_counters.stop()
+        db.get_pool().close_all()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self._start()
+                    self._install_signal_handlers()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.begin_shutdown()
+                if self.executor is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self._stop)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ==================== 请求分发 ====================
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._start()
+        if self.queue_stream and scope['path'] == QUEUE_STREAM_PATH and scope['method'] == 'GET':
+            await self._stream_queue(scope, receive, send)
+        else:
+            await self._call_wsgi(scope, receive, send)
+
+    async def _send_json(self, send, status, data, headers=()):
+        body = _json_body(data)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode('ascii'))] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_busy(self, send):
+        await self._send_json(send, 503, {'success': False, 'message': '服务器繁忙，请稍后重试'},
+                              [(b'retry-after', b'1')])
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise ValueError('请求体过大')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # ==================== Flask 接口 ====================
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-length':
+                continue
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+                continue
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run_wsgi(self, environ):
+        """在线程池中调用 Flask，返回 (状态码, 响应头, 第一批数据, 剩余数据的迭代器或 None)"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        iterator = iter(result)
+        try:
+            body, finished = self._read_chunk(iterator)
+        except BaseException:
+            self._close_result(result)
+            raise
+        if finished:
+            self._close_result(result)
+            return started['status'], started['headers'], body, None
+        return started['status'], started['headers'], body, (iterator, result)
+
+    @staticmethod
+    def _read_chunk(iterator):
+        """取出 STREAM_CHUNK_BYTES 左右的数据，返回 (数据, 是否已结束)
+
+        普通接口的响应只有一段，第一次调用就会全部取完。
+        """
+        parts = []
+        size = 0
+        for part in iterator:
+            if part:
+                parts.append(part)
+                size += len(part)
+            if size >= STREAM_CHUNK_BYTES:
+                return b''.join(parts), False
+        return b''.join(parts), True
+
+    @staticmethod
+    def _close_result(result):
+        close = getattr(result, 'close', None)
+        if close is not None:
+            close()
+
+    async def _call_wsgi(self, scope, receive, send):
+        if self.pending >= self.max_pending:
+            await self._send_busy(send)
+            return
+        self.pending += 1
+        try:
+            try:
+                body = await self._read_body(receive)
+            except ValueError as e:
+                await self._send_json(send, 413, {'success': False, 'message': str(e)})
+                return
+            if body is None:
+                return
+            environ = self._environ(scope, body)
+            status, headers, chunk, rest = await self._loop.run_in_executor(
+                self.executor, self._run_wsgi, environ)
+        finally:
+            self.pending -= 1
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        if rest is None:
+            await send({'type': 'http.response.body', 'body': chunk})
+            return
+
+        # 流式响应：每次在线程中取一批数据再发送，客户端断开时停止
+        iterator, result = rest
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            finished = False
+            while not finished and not disconnected.done():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk, finished = await self._loop.run_in_executor(self.executor, self._read_chunk, iterator)
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': chunk})
+        finally:
+            disconnected.cancel()
+            await self._loop.run_in_executor(self.executor, self._close_result, result)
+
+    # ==================== 候诊队列推送 ====================
+
+    async def _stream_queue(self, scope, receive, send):
+        """候诊队列推送（Server-Sent Events），连接等待事件时不占线程
+
+        连接后先发送一次 snapshot 事件（当天全部就诊记录），之后推送
+        registered / status / billed 增量事件；空闲时定期发送注释行保持连接。
+        """
+        if self.closing:
+            await self._send_busy(send)
+            return
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        day = query.get('date', [date.today().strftime('%Y-%m-%d')])[0]
+        try:
+            subscriber, rows = await self._loop.run_in_executor(
+                self.executor, queue_hub.subscribe, day, _load_queue)
+        except Exception as e:
+            await self._send_json(send, 200, {'success': False, 'message': f'订阅失败：{str(e)}'})
+            return
+
+        wake = asyncio.Event()
+        subscriber.waker = lambda: self._loop.call_soon_threadsafe(wake.set)
+        self._streams.add(subscriber)
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                            (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')],
+            })
+            snapshot = 'retry: 3000\n\n' + format_sse(queue_hub.snapshot_event(day, rows))
+            await send({'type': 'http.response.body', 'body': snapshot.encode('utf-8'), 'more_body': True})
+
+            # 订阅之后、设置 waker 之前可能已经有事件，先处理一次
+            wake.set()
+            while not disconnected.done():
+                waiter = asyncio.ensure_future(wake.wait())
+                done, _ = await asyncio.wait({waiter, disconnected}, timeout=KEEPALIVE_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if disconnected.done():
+                    break
+                wake.clear()
+                events = subscriber.drain()
+                if events:
+                    payload = ''.join(format_sse(event) for event in events)
+                elif not done:
+                    payload = ': keepalive\n\n'
+                else:
+                    payload = None
+                if payload:
+                    await send({'type': 'http.response.body', 'body': payload.encode('utf-8'), 'more_body': True})
+                if subscriber.closed:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+        finally:
+            disconnected.cancel()
+            self._streams.discard(subscriber)
+            queue_hub.unsubscribe(subscriber)
+
+
+application = HospitalASGI()
+
+
+def start_writer(db_file, address, window_ms=0):
+    """启动单写进程并等待它开始监听"""
+    writer = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'writes.py'),
+                               '--db', db_file, '--address', address, '--window-ms', str(window_ms)])
+    if not writes.wait_for_writer(writes.parse_address(address)):
+        writer.kill()
+        print(f"写进程启动失败：{address}")
+        sys.exit(1)
+    return writer
+
+
+def stop_writer(writer):
+    # 工作进程都已退出，没有进行中的写操作
+    writer.terminate()
+    try:
+        writer.wait(10)
+    except subprocess.TimeoutExpired:
+        writer.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='社区医院门诊管理系统 - ASGI 服务')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='监听端口')
+    parser.add_argument('--workers', type=int, default=1, help='进程数（大于1时不提供候诊队列推送）')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='每个进程处理请求的线程数')
+    parser.add_argument('--db', default=db.DB_FILE, help='数据库文件或 MySQL 地址')
+    parser.add_argument('--graceful-timeout', type=int, default=30, help='退出时等待进行中请求的最长秒数')
+    parser.add_argument('--writer', help='写进程地址 host:port（workers > 1 时默认自动启动写进程）')
+    parser.add_argument('--group-commit-ms', type=float, help='合并提交的等待窗口（毫秒），不设置时单进程逐个提交')
+    parser.add_argument('--replica-refresh', type=float, help='报表只读快照的刷新间隔（秒），不设置时报表读主库')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("需要先安装 uvicorn：pip install -r requirements.txt")
+        sys.exit(1)
+
+    os.environ['HMS_THREADS'] = str(args.threads)
+    os.environ['HMS_DB'] = args.db
+    writer = None
+    if args.writer:
+        if not os.environ.get(writes.WRITER_KEY_ENV):
+            print(f"使用 --writer 时需要设置环境变量 {writes.WRITER_KEY_ENV}（与写进程相同的认证密钥）")
+            sys.exit(1)
+        os.environ[writes.WRITER_ENV] = args.writer
+    elif args.workers > 1 and backends.is_sqlite(args.db):
+        # 写进程和各工作进程从环境变量继承同一个随机密钥
+        os.environ.setdefault(writes.WRITER_KEY_ENV, secrets.token_hex(32))
+        writer = start_writer(args.db, writes.DEFAULT_WRITER_ADDRESS, args.group_commit_ms or 0)
+        os.environ[writes.WRITER_ENV] = writes.DEFAULT_WRITER_ADDRESS
+    elif args.group_commit_ms is not None:
+        os.environ[writes.GROUP_COMMIT_ENV] = str(args.group_commit_ms)
+    if args.workers > 1:
+        os.environ[QUEUE_STREAM_ENV] = '0'
+    refresher = None
+    if args.replica_refresh and backends.is_sqlite(args.db):
+        refresher = replica.Refresher(args.db, args.replica_refresh)
+        refresher.start()
+        os.environ[replica.REPLICA_ENV] = '1'
+    print(f"启动服务 http://{args.host}:{args.port}（{args.workers} 个进程 x {args.threads} 个线程）")
+    try:
+        uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                    timeout_graceful_shutdown=args.graceful_timeout, access_log=False)
+    finally:
+        if refresher is not None:
+            refresher.stop()
+        if writer is not None:
+            stop_writer(writer)
+
+
+if __name__ == '__main__':
+    main()
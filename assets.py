@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+页面静态资源构建与预生成页面
+
+首页和三个角色页面（templates/ 下的 index、patient、receptionist、admin）的全部
+CSS、JS 都写在页面里，管理后台、前台页面各有上千行，每次打开都要整页下载、
+渲染模板，浏览器缓存不了其中任何部分。构建后：
+
+    python assets.py build      # 修改模板后重新执行
+    python assets.py list
+
+- 页面中的 <style> 和没有 src 的 <script> 取出来压缩（CSS 去掉注释和多余空白，
+  JS 去掉缩进、空行和整行注释，保留换行；字符串、模板字符串和正则原样保留），
+  按内容哈希命名写入 build/assets/（如 admin.3f2a9c1e0b.js），页面中原来的位置
+  换成 <link> / <script src>。
+- 几个页面共用的 JS 放在 static/ 下（如分页的 static/pagination.js），页面用
+  <script src="/static/文件名"> 引用：没有构建时由 Flask 的 /static/ 返回，构建时
+  同样压缩、按内容哈希命名写入 build/assets/，引用换成 /assets/ 下的文件。
+- 去掉缩进后的页面（<pre>、<textarea>、<script>、<style> 的内容原样保留）写入
+  build/pages/，build/manifest.json 记录每个页面的源模板和引用的 static/ 文件的
+  哈希，以及引用的资源文件。
+  check_assets.py 检查构建后的 JS 与模板中的 JS 行为一致。
+- /assets/<文件名> 返回资源文件：内容变了文件名就变，响应带
+  Cache-Control: public, max-age=31536000, immutable，浏览器一年内直接用缓存。
+- 角色页面直接返回构建好的HTML，不再渲染模板，带 ETag（Cache-Control: no-cache，
+  未变化时 304）。
+- 页面和资源读入内存时用最高级别预先压缩（compression.precompress），按
+  Accept-Encoding 直接返回。
+
+没有构建、或模板、引用的 static/ 文件在构建之后修改过（哈希与 manifest 不一致）时，页面照常
+渲染模板，不会返回过期的页面。重新构建时保留上一次构建的资源文件，已经打开的
+旧页面仍能加载。
+
+python -m bench.page_load 对比内联页面与构建后每次打开页面传输的字节数和耗时。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from flask import abort, render_template
+
+import compression
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(ROOT, 'templates')
+STATIC_DIR = os.path.join(ROOT, 'static')
+BUILD_DIR = os.path.join(ROOT, 'build')
+
+# 构建的页面
+PAGES = ('index.html', 'patient.html', 'receptionist.html', 'admin.html')
+
+# 资源文件的URL前缀和缓存时间
+ASSET_URL = '/assets/'
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+HASH_LENGTH = 10
+
+_STYLE_RE = re.compile(r'^[ \t]*<style>(.*?)</style>[ \t]*$', re.S | re.M)
+_SCRIPT_RE = re.compile(r'^[ \t]*<script>(.*?)</script>[ \t]*$', re.S | re.M)
+_STATIC_SCRIPT_RE = re.compile(r'<script src="/static/([\w-]+\.js)"></script>')
+_ASSET_NAME_RE = re.compile(r'^[\w-]+\.[0-9a-f]+\.(css|js)$')
+
+MIMETYPES = {'css': 'text/css', 'js': 'application/javascript'}
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# ==================== 构建 ====================
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def _strip_lines(text, line_comments=False):
+    """去掉缩进、行尾空白和空行（line_comments 为真时还去掉整行 // 注释），保留换行；
+    text 可能从一行中间开始，第一个换行之前的内容不动"""
+    text = re.sub(r'[ \t]+(?=\n)', '', text)
+    text = re.sub(r'\n[ \t]+', '\n', text)
+    if line_comments:
+        text = re.sub(r'\n//[^\n]*', '\n', text)
+    return re.sub(r'\n{2,}', '\n', text)
+
+
+def _minify_outside(text, spans, line_comments=False):
+    """只处理 spans（[(开始, 结束)]）之外的部分，spans 内原样保留"""
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append(_strip_lines(text[last:start], line_comments))
+        pieces.append(text[start:end])
+        last = end
+    pieces.append(_strip_lines(text[last:], line_comments))
+    return ''.join(pieces)
+
+
+# 这些字符或关键字之后的 / 是正则字面量的开始，其他情况是除号
+_REGEX_AFTER_CHARS = frozenset('(,=:[!&|?{};+-*%<>~^')
+_REGEX_AFTER_WORDS = frozenset(('return', 'typeof', 'case', 'in', 'of', 'void', 'delete',
+                                'new', 'throw', 'else', 'do', 'yield', 'await'))
+_JS_WORD_RE = re.compile(r'[\w$]+')
+
+
+def _js_string_end(js, i):
+    """js[i] 是引号或反引号，返回字符串结束之后的位置"""
+    quote = js[i]
+    i += 1
+    while i < len(js):
+        c = js[i]
+        if c == '\\':
+            i += 2
+        elif c == quote:
+            return i + 1
+        elif quote == '`' and js.startswith('${', i):
+            i = _scan_js(js, i + 2, in_template=True)
+        else:
+            i += 1
+    return i
+
+
+def _js_regex_end(js, i):
+    """js[i] 是正则字面量开头的 /，返回标志之后的位置"""
+    i += 1
+    in_class = False
+    while i < len(js) and js[i] != '\n':
+        c = js[i]
+        if c == '\\':
+            i += 1
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            in_class = True
+        elif c == '/':
+            match = _JS_WORD_RE.match(js, i + 1)
+            return match.end() if match else i + 1
+        i += 1
+    return i
+
+
+def _scan_js(js, i=0, spans=None, in_template=False):
+    """扫描 JS 代码，把字符串、模板字符串、正则字面量和块注释的范围加入 spans；
+    in_template 为真时扫描模板字符串中的 ${...}，返回匹配的 } 之后的位置"""
+    depth = 0
+    prev = ''  # 上一个代码单词或符号，用来区分正则和除号
+    while i < len(js):
+        c = js[i]
+        start = i
+        if js.startswith('//', i):
+            end = js.find('\n', i)
+            i = len(js) if end < 0 else end
+            continue
+        if js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            i = len(js) if end < 0 else end + 2
+        elif c in '\'"`':
+            i = _js_string_end(js, i)
+            prev = c
+        elif c == '/' and (not prev or prev in _REGEX_AFTER_CHARS or prev in _REGEX_AFTER_WORDS):
+            i = _js_regex_end(js, i)
+            prev = c
+        else:
+            word = _JS_WORD_RE.match(js, i)
+            if word:
+                prev = word.group()
+                i = word.end()
+                continue
+            if in_template:
+                if c == '{':
+                    depth += 1
+                elif c == '}':
+                    if depth == 0:
+                        return i + 1
+                    depth -= 1
+            if not c.isspace():
+                prev = c
+            i += 1
+            continue
+        if spans is not None:
+            spans.append((start, i))
+    return i
+
+
+def minify_js(js):
+    # 字符串、模板字符串、正则和块注释原样保留，其余部分去掉缩进、空行和整行 // 注释；
+    # 保留换行，不依赖自动补分号的规则；行尾注释不去掉
+    js = '\n' + js
+    spans = []
+    _scan_js(js, 0, spans)
+    return _minify_outside(js, spans, line_comments=True).strip()
+
+
+# 内容中的空白有意义或不是 HTML 的元素，原样保留
+_PRESERVE_RE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.S | re.I)
+
+
+def minify_html(html):
+    spans = [match.span() for match in _PRESERVE_RE.finditer(html)]
+    return _minify_outside(html, spans).strip() + '\n'
+
+
+def _write_asset(assets_dir, stem, kind, content):
+    """按内容哈希命名写入资源文件，返回文件名"""
+    name = f'{stem}.{_sha1(content)[:HASH_LENGTH]}.{kind}'
+    path = os.path.join(assets_dir, name)
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+    return name
+
+
+def build_page(template, source, assets_dir, static_dir=STATIC_DIR):
+    """把一个页面的内联 CSS/JS 和引用的 static/ 脚本写成资源文件，
+    返回 (页面HTML, 资源文件名列表, {引用的 static/ 文件名: 内容哈希})"""
+    stem = os.path.splitext(template)[0]
+    names = []
+    static_sources = {}
+
+    def extract(match, kind, minify, tag):
+        name = _write_asset(assets_dir, stem, kind, minify(match.group(1)).encode('utf-8'))
+        names.append(name)
+        return tag.format(url=ASSET_URL + name)
+
+    def shared(match):
+        with open(os.path.join(static_dir, match.group(1)), 'rb') as f:
+            data = f.read()
+        static_sources[match.group(1)] = _sha1(data)
+        name = _write_asset(assets_dir, os.path.splitext(match.group(1))[0], 'js',
+                            minify_js(data.decode('utf-8')).encode('utf-8'))
+        names.append(name)
+        return f'<script src="{ASSET_URL + name}"></script>'
+
+    html = _STATIC_SCRIPT_RE.sub(shared, source)
+    html = _STYLE_RE.sub(lambda m: extract(m, 'css', minify_css, '<link rel="stylesheet" href="{url}">'), html)
+    html = _SCRIPT_RE.sub(lambda m: extract(m, 'js', minify_js, '<script src="{url}"></script>'), html)
+    return minify_html(html), names, static_sources
+
+
+def _read_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build(build_dir=BUILD_DIR, template_dir=TEMPLATE_DIR, pages=PAGES, static_dir=STATIC_DIR):
+    """构建全部页面，返回新的 manifest"""
+    assets_dir = os.path.join(build_dir, 'assets')
+    pages_dir = os.path.join(build_dir, 'pages')
+    os.makedirs(assets_dir, exist_ok=True)
+    os.makedirs(pages_dir, exist_ok=True)
+    previous = _read_manifest(build_dir)
+
+    manifest = {'built_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'pages': {}}
+    for template in pages:
+        with open(os.path.join(template_dir, template), 'rb') as f:
+            source = f.read()
+        html, names, static_sources = build_page(template, source.decode('utf-8'), assets_dir, static_dir)
+        _write_atomic(os.path.join(pages_dir, template), html.encode('utf-8'))
+        manifest['pages'][template] = {'source': _sha1(source), 'static': static_sources, 'assets': names}
+    # 页面写完后再替换 manifest，服务进程读到新 manifest 时页面和资源都已就绪
+    _write_atomic(os.path.join(build_dir, 'manifest.json'),
+                  json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # 只保留本次和上一次构建引用的资源文件
+    keep = set()
+    for entry in [manifest] + ([previous] if previous else []):
+        for page in entry['pages'].values():
+            keep.update(page['assets'])
+    for name in os.listdir(assets_dir):
+        if name not in keep:
+            os.remove(os.path.join(assets_dir, name))
+    return manifest
+
+
+# ==================== 服务 ====================
+
+class _Prebuilt:
+    """读入内存、预先压缩好的页面或资源"""
+
+    __slots__ = ('body', 'encoded', 'etag', 'mimetype')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.encoded = compression.precompress(body)
+        self.etag = _sha1(body)
+        self.mimetype = mimetype
+
+
+class PrebuiltStore:
+    """构建好的页面（manifest、模板或引用的 static/ 文件修改后重新读取）和资源文件（按文件名缓存）"""
+
+    def __init__(self, build_dir=BUILD_DIR, template_dir=TEMPLATE_DIR, static_dir=STATIC_DIR):
+        self.build_dir = build_dir
+        self.template_dir = template_dir
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._assets = {}
+
+    def _source_key(self, template, static_names):
+        paths = [os.path.join(self.build_dir, 'manifest.json'), os.path.join(self.template_dir, template)]
+        paths += [os.path.join(self.static_dir, name) for name in static_names]
+        return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+    def page(self, template):
+        """构建好的页面，没有构建或构建已过期时返回 None"""
+        with self._lock:
+            cached = self._pages.get(template)
+        try:
+            key = self._source_key(template, cached[2] if cached is not None else ())
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            page, static_names = self._load_page(template)
+            key = self._source_key(template, static_names)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._pages[template] = (key, page, static_names)
+        return page
+
+    def _load_page(self, template):
+        """返回 (构建好的页面或 None, 页面引用的 static/ 文件名)"""
+        manifest = _read_manifest(self.build_dir)
+        entry = (manifest or {}).get('pages', {}).get(template)
+        if entry is None:
+            return None, ()
+        static_sources = entry.get('static', {})
+        sources = [(os.path.join(self.template_dir, template), entry['source'])]
+        sources += [(os.path.join(self.static_dir, name), digest) for name, digest in static_sources.items()]
+        for path, digest in sources:
+            with open(path, 'rb') as f:
+                if _sha1(f.read()) != digest:
+                    return None, tuple(static_sources)
+        with open(os.path.join(self.build_dir, 'pages', template), 'rb') as f:
+            return _Prebuilt(f.read(), 'text/html'), tuple(static_sources)
+
+    def asset(self, name):
+        """资源文件，不存在时返回 None；文件名带内容哈希，读入后不再检查修改"""
+        match = _ASSET_NAME_RE.match(name)
+        if match is None:
+            return None
+        with self._lock:
+            asset = self._assets.get(name)
+        if asset is not None:
+            return asset
+        try:
+            with open(os.path.join(self.build_dir, 'assets', name), 'rb') as f:
+                asset = _Prebuilt(f.read(), MIMETYPES[match.group(1)])
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._assets[name] = asset
+        return asset
+
+
+prebuilt_store = PrebuiltStore()
+
+
+def configure(build_dir=BUILD_DIR):
+    """改用另一个构建目录（bench.page_load 使用），build_dir 为 None 时不使用构建好的页面"""
+    global prebuilt_store
+    prebuilt_store = PrebuiltStore(build_dir) if build_dir else None
+
+
+def page_response(template):
+    """角色页面：有构建好的页面时直接返回，否则渲染模板"""
+    page = prebuilt_store.page(template) if prebuilt_store is not None else None
+    if page is None:
+        return render_template(template)
+    return compression.prebuilt_response(page.body, page.encoded, page.etag, page.mimetype, 'no-cache')
+
+
+def asset_response(name):
+    asset = prebuilt_store.asset(name) if prebuilt_store is not None else None
+    if asset is None:
+        abort(404)
+    return compression.prebuilt_response(asset.body, asset.encoded, asset.etag, asset.mimetype,
+                                         f'public, max-age={ASSET_MAX_AGE}, immutable')
+
+
+# ==================== 命令行 ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='页面静态资源构建')
+    parser.add_argument('command', choices=['build', 'list'],
+                        help='build 构建全部页面，list 列出构建结果')
+    parser.add_argument('--out', default=BUILD_DIR, help='构建输出目录')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        manifest = build(args.out)
+        print(f"已构建 {len(manifest['pages'])} 个页面，用时 {time.perf_counter() - start:.2f}s")
+
+    manifest = _read_manifest(args.out)
+    if manifest is None:
+        print("还没有构建，请先运行 python assets.py build")
+        return
+    print(f"构建时间 {manifest['built_at']}")
+    for template, entry in manifest['pages'].items():
+        html_size = os.path.getsize(os.path.join(args.out, 'pages', template))
+        sizes = ', '.join(f"{name} {os.path.getsize(os.path.join(args.out, 'assets', name)) / 1024:.1f}KB"
+                          for name in entry['assets'])
+        sources = [(os.path.join(TEMPLATE_DIR, template), entry['source'])]
+        sources += [(os.path.join(STATIC_DIR, name), digest) for name, digest in entry.get('static', {}).items()]
+        stale = ''
+        for path, digest in sources:
+            with open(path, 'rb') as f:
+                if _sha1(f.read()) != digest:
+                    stale = '  （模板或 static/ 文件已修改，需要重新构建）'
+        print(f"  {template}  {html_size / 1024:.1f}KB  {sizes}{stale}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+数据库后端
+
+db.configure() 的数据库参数决定使用哪个后端：
+
+    hospital.db、sqlite:///hospital.db          SQLite 文件（默认）
+    :memory:、sqlite://:memory:                 SQLite 内存数据库（脚本和本地测试）
+    mysql://用户:密码@主机:3306/hospital_management   MySQL / MariaDB（需要 pymysql）
+
+连接池（db.ConnectionPool）通过后端建立和检查连接、开始写事务、判断锁冲突，
+业务代码不区分后端，照常使用 ? 占位符、conn.execute()、row['列名']：MySQL 连接
+包装成与 sqlite3 相同的用法，日期、时间按 SQLite 中的字符串格式返回，金额返回
+float，接口输出与 SQLite 相同。
+
+两个后端 SQL 写法不同的地方（RETURNING、当前日期时间、全文索引、前缀匹配）
+按 dialect(cursor) 选用各自的写法，见 booking、writes、patient_search。
+
+MySQL 的表结构、索引和触发器见 database/schema.sql（init_db.py 创建）。
+归档（archive.py）、汇总维护（summary.py）、批量导入和统计导出只支持 SQLite。
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from urllib.parse import unquote, urlsplit
+from urllib.request import pathname2url
+
+import migrations
+
+# 每个新的 SQLite 连接建立时执行的PRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",     # 约16MB页缓存
+    "PRAGMA mmap_size = 268435456",   # 256MB内存映射
+    "PRAGMA temp_store = MEMORY",
+)
+
+# database/schema.sql 对应的结构版本（与 SQLite 迁移的版本号一致）
+MYSQL_SCHEMA_VERSION = 11
+
+# MySQL 锁等待超时、死锁，回滚后可以重试
+MYSQL_BUSY_ERRORS = (1205, 1213)
+
+# 每个 SQLite 连接缓存的已编译语句数、每个 MySQL 后端缓存的已转换语句数
+STATEMENT_CACHE_SIZE = 512
+
+
+def dialect(cursor):
+    """cursor（或连接）所属后端的 SQL 写法：'sqlite' 或 'mysql'"""
+    return getattr(cursor, 'dialect', 'sqlite')
+
+
+def is_sqlite(target):
+    return not target.startswith(('mysql://', 'mariadb://'))
+
+
+def from_url(target, readonly=False):
+    """按 db.configure() 的数据库参数创建后端；readonly 只用于 SQLite 快照文件（见 replica.py）"""
+    if not is_sqlite(target):
+        return MySQLBackend(target)
+    if target.startswith('sqlite://'):
+        target = target[len('sqlite://'):]
+        # sqlite:///hospital.db 是相对路径，sqlite:////var/lib/hms.db 是绝对路径
+        target = target[1:] if target.startswith('/') else target
+    return SQLiteBackend(target, readonly)
+
+
+# ==================== SQLite ====================
+
+class SQLiteBackend:
+    dialect = 'sqlite'
+    errors = (sqlite3.Error,)
+    database_errors = (sqlite3.DatabaseError,)
+
+    def __init__(self, db_file, readonly=False):
+        self.db_file = db_file
+        self.readonly = readonly
+        self._uri = False
+        self._keeper = None
+        if readonly:
+            # 只读快照生成后不再修改：不加锁、不建 -wal/-shm 文件，也不执行迁移
+            self.db_file = f'file:{pathname2url(os.path.abspath(db_file))}?mode=ro&immutable=1'
+            self._uri = True
+        elif db_file == ':memory:':
+            # 同一后端的连接共享一个内存数据库；保留一个连接，连接池清空时数据库不会被释放
+            self.db_file = f'file:hms-memory-{id(self)}?mode=memory&cache=shared'
+            self._uri = True
+            self._keeper = sqlite3.connect(self.db_file, uri=True, check_same_thread=False)
+        self._migrated = readonly
+        self._migrate_lock = threading.Lock()
+
+    def connect(self, factory=sqlite3.Connection):
+        # 已编译的语句按SQL文本缓存在连接上，分页、筛选条件不同的查询也都能复用
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, factory=factory, uri=self._uri,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        try:
+            for pragma in CONNECTION_PRAGMAS:
+                if not (self.readonly and 'journal_mode' in pragma):
+                    conn.execute(pragma)
+            if not self._migrated:
+                with self._migrate_lock:
+                    if not self._migrated:
+                        migrations.upgrade(conn)
+                        self._migrated = True
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def begin(conn):
+        # 事务开始时就取得写锁，事务内先读后写的检查不会被其他连接的写入打断
+        conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def is_busy_error(error):
+        """数据库被其他连接锁住（SQLITE_BUSY / SQLITE_LOCKED）"""
+        if not isinstance(error, sqlite3.OperationalError):
+            return False
+        code = getattr(error, 'sqlite_errorcode', None)
+        if code is not None:
+            return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+        return 'locked' in str(error) or 'busy' in str(error)
+
+    @staticmethod
+    def describe(conn):
+        return {'backend': 'sqlite', 'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0]}
+
+
+# ==================== MySQL ====================
+
+# 字符串、带引号的标识符和注释原样保留，只替换其外的 ? 占位符
+_SQL_TOKEN_RE = re.compile(r"""
+    '(?:[^'\\]|\\.|'')*'
+  | "(?:[^"\\]|\\.|"")*"
+  | `[^`]*`
+  | --[^\n]*
+  | /\*.*?\*/
+  | [?%]
+""", re.S | re.X)
+
+
+def _translate_token(match):
+    token = match.group(0)
+    if token == '?':
+        return '%s'
+    # pymysql 用 % 把参数格式化进整条语句，字符串里的 % 同样要转义
+    return token.replace('%', '%%')
+
+
+def translate(sql):
+    """把 sqlite3 风格的 SQL 转成 pymysql 的格式：? 占位符换成 %s，% 转义为 %%；
+    字符串、标识符和注释中的 ? 不是占位符，不替换"""
+    return _SQL_TOKEN_RE.sub(_translate_token, sql)
+
+
+class Row:
+    """MySQL 结果行，用法与 sqlite3.Row 相同：row[0]、row['列名']、dict(row)"""
+
+    __slots__ = ('_values', '_columns')
+
+    def __init__(self, columns, values):
+        self._columns = columns
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._columns[key]]
+        return self._values[key]
+
+    def keys(self):
+        return list(self._columns)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, Row) and self._columns == other._columns and self._values == other._values
+
+    def __repr__(self):
+        return f'Row({dict(zip(self._columns, self._values))!r})'
+
+
+class MySQLCursor:
+    dialect = 'mysql'
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self._columns = None
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(self.connection.backend.translate(sql), tuple(params))
+        self._columns = None
+        if self._cursor.description:
+            # 重名的列与 sqlite3.Row 一样取第一个
+            columns = {}
+            for index, column in enumerate(self._cursor.description):
+                columns.setdefault(column[0], index)
+            self._columns = columns
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(self.connection.backend.translate(sql), [tuple(p) for p in seq_of_params])
+        self._columns = None
+        return self
+
+    def fetchone(self):
+        values = self._cursor.fetchone()
+        return None if values is None else Row(self._columns, values)
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [Row(self._columns, values) for values in rows]
+
+    def fetchall(self):
+        return [Row(self._columns, values) for values in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class MySQLConnection:
+    """pymysql 连接，提供业务代码用到的 sqlite3.Connection 接口"""
+
+    dialect = 'mysql'
+
+    def __init__(self, raw, backend):
+        self.raw = raw
+        self.backend = backend
+        self.row_factory = None
+
+    def cursor(self, factory=None):
+        return MySQLCursor(self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self):
+        from pymysql.constants import SERVER_STATUS
+        return bool(self.raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+def _decimal(value):
+    # SUM(整数列) 在 MySQL 中是 DECIMAL，与 SQLite 一样返回整数
+    return float(value) if '.' in value else int(value)
+
+
+class MySQLBackend:
+    dialect = 'mysql'
+
+    def __init__(self, url):
+        try:
+            import pymysql
+            from pymysql.constants import CLIENT, FIELD_TYPE
+            from pymysql.converters import conversions
+        except ImportError:
+            raise RuntimeError('使用 MySQL 需要先安装 pymysql：pip install -r requirements.txt')
+        self._pymysql = pymysql
+        self.errors = (pymysql.err.Error,)
+        self.database_errors = (pymysql.err.DatabaseError,)
+
+        parts = urlsplit(url)
+        # 日期时间按 SQLite 中的格式返回字符串，金额返回 float
+        conv = dict(conversions)
+        for field_type in (FIELD_TYPE.DATE, FIELD_TYPE.TIME, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+            conv[field_type] = str
+        conv[FIELD_TYPE.DECIMAL] = conv[FIELD_TYPE.NEWDECIMAL] = _decimal
+        self.params = {
+            'host': parts.hostname or 'localhost',
+            'port': parts.port or 3306,
+            'user': unquote(parts.username or 'root'),
+            'password': unquote(parts.password or ''),
+            'database': parts.path.lstrip('/') or 'hospital_management',
+            'charset': 'utf8mb4',
+            # 与 SQLite 一样按 UTC 记录 CURRENT_TIMESTAMP
+            'init_command': "SET time_zone = '+00:00'",
+            # 查询在自动提交模式下执行，连接复用时不会读到旧快照；写操作由 begin() 显式开启事务
+            'autocommit': True,
+            # UPDATE 的 rowcount 为匹配的行数（与 SQLite 一致），而不是实际修改的行数
+            'client_flag': CLIENT.FOUND_ROWS,
+            'conv': conv,
+        }
+        # 不含密码，供日志和健康检查显示
+        self.db_file = f"mysql://{self.params['user']}@{self.params['host']}:{self.params['port']}/{self.params['database']}"
+        self._statements = {}
+        self._checked = False
+        self._check_lock = threading.Lock()
+
+    def translate(self, sql):
+        """translate(sql) 的结果，按原语句缓存
+
+        只缓存转换后的SQL文本：pymysql 在客户端把参数拼进语句，没有服务端预编译，
+        MySQL 每次执行仍会重新解析语句。
+        """
+        translated = self._statements.get(sql)
+        if translated is None:
+            translated = translate(sql)
+            if len(self._statements) >= STATEMENT_CACHE_SIZE:
+                self._statements.clear()
+            self._statements[sql] = translated
+        return translated
+
+    def connect(self, factory=None):
+        conn = MySQLConnection(self._pymysql.connect(**self.params), self)
+        try:
+            if not self._checked:
+                with self._check_lock:
+                    if not self._checked:
+                        self._check_schema(conn)
+                        self._checked = True
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _check_schema(self, conn):
+        try:
+            row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        except self._pymysql.err.ProgrammingError:
+            row = None
+        if row is None or row[0] is None or row[0] < MYSQL_SCHEMA_VERSION:
+            raise RuntimeError('MySQL 数据库结构不是最新版本，请用 database/schema.sql（python init_db.py）创建数据库')
+
+    def is_healthy(self, conn):
+        try:
+            conn.raw.ping(reconnect=False)
+            return True
+        except self.errors:
+            return False
+
+    @staticmethod
+    def begin(conn):
+        conn.execute("START TRANSACTION")
+
+    def is_busy_error(self, error):
+        return (isinstance(error, self._pymysql.err.OperationalError)
+                and bool(error.args) and error.args[0] in MYSQL_BUSY_ERRORS)
+
+    @staticmethod
+    def describe(conn):
+        return {'backend': 'mysql', 'server_version': conn.raw.get_server_info()}
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+性能测试脚本
+
+在仓库根目录下以模块方式运行，例如：
+
+    python -m bench.billing_date_range
+"""
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+多维报表对比：SQL 分组 vs 列式导出 + NumPy 分组（analytics.py）
+
+在数据库的临时副本上导出事实表，对若干日期范围和维度组合分别用 SQL
+（已支付账单 JOIN 就诊，GROUP BY）和 FactTable.group 计算，输出耗时，
+并校验两者的分组数、账单数和收入一致。
+
+    python -m bench.analytics --db bench.db [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import analytics
+import archive
+import migrations
+
+# 维度 -> SQL 分组表达式
+SQL_KEYS = {
+    'date': 'b.payment_date',
+    'week': "date(b.payment_date, '-' || ((CAST(strftime('%w', b.payment_date) AS INTEGER) + 6) % 7) || ' days')",
+    'month': 'substr(b.payment_date, 1, 7)',
+    'dept': 'v.dept_id',
+    'doctor': 'COALESCE(v.doctor_id, 0)',
+    'payment_method': 'b.payment_method',
+}
+
+CASES = [
+    ('全部按科室', None, ['dept']),
+    ('全部按周', None, ['week']),
+    ('科室×医生×支付方式×周', None, ['dept', 'doctor', 'payment_method', 'week']),
+    ('近90天按日×科室', 90, ['date', 'dept']),
+]
+
+
+def sql_report(conn, start_date, end_date, dimensions):
+    keys = [SQL_KEYS[d] for d in dimensions]
+    return conn.execute(f"""
+        SELECT {', '.join(keys)}, COUNT(*), SUM(b.total_fee)
+        FROM all_billing b
+        JOIN all_visit v ON b.visit_id = v.visit_id
+        WHERE b.payment_status = '已支付'
+          AND b.payment_time >= ? AND b.payment_time < date(?, '+1 day')
+        GROUP BY {', '.join(keys)}
+    """, (start_date, end_date)).fetchall()
+
+
+def best_of(repeat, func):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQL 分组与列式向量化分组的报表耗时对比')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--repeat', type=int, default=5, help='每个报表重复次数（取最快一次）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'analytics.db')
+    shutil.copy(args.db, db_file)
+    conn = sqlite3.connect(db_file)
+    migrations.upgrade(conn)
+    archive.attach(conn)
+    path = analytics.facts_file(db_file)
+
+    try:
+        start = time.perf_counter()
+        rows = analytics.export(conn, path)
+        print(f"导出 {rows} 张已支付账单，用时 {time.perf_counter() - start:.2f}s")
+        facts = analytics.FactTable.load(path)
+        last_day = conn.execute("SELECT MAX(payment_date) FROM all_billing").fetchone()[0]
+
+        print(f"\n{'报表':<20}{'分组数':>8}{'SQL':>10}{'NumPy':>10}{'加速':>8}  结果一致")
+        failed = False
+        for label, days, dimensions in CASES:
+            start_date = '0001-01-01' if days is None else conn.execute(
+                "SELECT date(?, ?)", (last_day, f'-{days - 1} days')).fetchone()[0]
+            sql_time, sql_rows = best_of(args.repeat, lambda: sql_report(conn, start_date, last_day, dimensions))
+            numpy_time, groups = best_of(args.repeat, lambda: facts.between(start_date, last_day).group(dimensions))
+            same = (len(sql_rows) == len(groups)
+                    and sum(row[-2] for row in sql_rows) == sum(g['bill_count'] for g in groups)
+                    and abs(sum(row[-1] for row in sql_rows) - sum(g['total_revenue'] for g in groups)) < 0.01 * len(groups) + 0.01)
+            failed = failed or not same
+            print(f"{label:<16}{len(groups):>8}{sql_time * 1000:>9.1f}ms{numpy_time * 1000:>8.1f}ms"
+                  f"{sql_time / numpy_time:>7.1f}x  {'✓' if same else '✗'}")
+    finally:
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
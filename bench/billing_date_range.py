@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+账单日期范围查询对比
+
+在临时数据库中生成大量账单（默认100万条），对比
+date(payment_time) 写法和半开区间写法的耗时，并校验两者结果一致。
+
+    python -m bench.billing_date_range [--rows 1000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import migrations
+
+OLD_DASHBOARD = """
+    SELECT COALESCE(SUM(total_fee), 0) FROM billing
+    WHERE date(payment_time) = ? AND payment_status = '已支付'
+"""
+NEW_DASHBOARD = """
+    SELECT COALESCE(SUM(total_fee), 0) FROM billing
+    WHERE payment_status = '已支付'
+      AND payment_time >= ? AND payment_time < date(?, '+1 day')
+"""
+OLD_DAILY = """
+    SELECT date(b.payment_time) as stat_date,
+           COUNT(DISTINCT v.visit_id) as visit_count,
+           SUM(b.total_fee) as total_revenue
+    FROM billing b
+    JOIN visit v ON b.visit_id = v.visit_id
+    WHERE b.payment_status = '已支付'
+      AND date(b.payment_time) BETWEEN ? AND ?
+    GROUP BY date(b.payment_time)
+    ORDER BY stat_date
+"""
+NEW_DAILY = """
+    SELECT b.payment_date as stat_date,
+           COUNT(DISTINCT v.visit_id) as visit_count,
+           SUM(b.total_fee) as total_revenue
+    FROM billing b
+    JOIN visit v ON b.visit_id = v.visit_id
+    WHERE b.payment_status = '已支付'
+      AND b.payment_time >= ? AND b.payment_time < date(?, '+1 day')
+    GROUP BY b.payment_date
+    ORDER BY stat_date
+"""
+
+
+def seed(conn, rows, days):
+    """生成 rows 条就诊及对应账单，支付时间分布在最近 days 天内"""
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO department (dept_name) VALUES ('内科')")
+    cursor.execute("INSERT INTO clinic_room (room_name, dept_id) VALUES ('内科1诊室', 1)")
+    cursor.execute("INSERT INTO patient (patient_name, phone) VALUES ('测试患者', '13800000000')")
+    now = datetime.now()
+    batch = 50000
+    for offset in range(0, rows, batch):
+        visits, bills = [], []
+        for i in range(offset + 1, min(offset + batch, rows) + 1):
+            paid = now - timedelta(days=random.randrange(days), seconds=random.randrange(86400))
+            visits.append((i, paid.strftime('%Y-%m-%d'), paid.strftime('%H:%M:%S')))
+            bills.append((i, random.randint(50, 500), paid.strftime('%Y-%m-%d %H:%M:%S'),
+                          '已支付' if random.random() < 0.95 else '已退款'))
+        cursor.executemany("""
+            INSERT INTO visit (visit_id, patient_id, dept_id, room_id, visit_date, visit_time, status)
+            VALUES (?, 1, 1, 1, ?, ?, '已离院')
+        """, visits)
+        cursor.executemany("""
+            INSERT INTO billing (visit_id, patient_id, total_fee, self_fee, payment_method,
+                                 payment_status, payment_time)
+            VALUES (?, 1, ?, 0, '现金', ?, ?)
+        """, [(v, fee, status, t) for v, fee, t, status in bills])
+    conn.commit()
+
+
+def timed(conn, sql, params, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, [tuple(row) for row in result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='账单日期范围查询对比')
+    parser.add_argument('--rows', type=int, default=1000000, help='账单条数')
+    parser.add_argument('--days', type=int, default=730, help='支付时间分布的天数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个查询重复次数（取最快一次）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'bench.db')
+    conn = sqlite3.connect(db_file)
+    migrations.upgrade(conn)
+
+    print(f"正在生成 {args.rows} 条账单...")
+    start = time.perf_counter()
+    seed(conn, args.rows, args.days)
+    conn.execute("ANALYZE")
+    print(f"  完成，用时 {time.perf_counter() - start:.1f}s")
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    month_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    cases = [
+        ('仪表板今日收入', OLD_DASHBOARD, (today,), NEW_DASHBOARD, (today, today)),
+        ('近30天按日统计', OLD_DAILY, (month_ago, today), NEW_DAILY, (month_ago, today)),
+    ]
+
+    print()
+    print(f"{'查询':<14}{'原写法':>12}{'半开区间':>12}{'加速':>10}  结果一致")
+    mismatches = 0
+    for name, old_sql, old_params, new_sql, new_params in cases:
+        old_time, old_rows = timed(conn, old_sql, old_params, args.repeat)
+        new_time, new_rows = timed(conn, new_sql, new_params, args.repeat)
+        same = old_rows == new_rows
+        mismatches += not same
+        print(f"{name:<14}{old_time * 1000:>10.1f}ms{new_time * 1000:>10.1f}ms"
+              f"{old_time / new_time:>9.1f}x  {'✓' if same else '✗'}")
+
+    conn.close()
+    os.remove(db_file)
+    os.rmdir(workdir)
+    if mismatches:
+        raise SystemExit('✗ 新旧查询结果不一致')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+预约并发压力测试
+
+在临时数据库中建一个排班（默认30个号源），用多个进程、每个进程多个线程
+同时发起大量预约（默认4000次），其中一部分随后取消。结束后检查：
+
+- 成功预约数不超过号源数；没有取消时，号源未约满不应有因"已满"被拒的预约
+- doctor_schedule.current_patients 与未取消的预约记录数完全一致
+- 没有因数据库锁重试耗尽而失败的预约
+
+    python -m bench.booking_stress [--bookings 4000] [--processes 4] [--threads 16]
+                                   [--capacity 30] [--cancel-rate 0.2] [--busy-timeout 5000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import booking
+import db
+import migrations
+import summary
+
+WORK_DATE = '2030-01-01'
+
+
+def seed(db_file, capacity):
+    conn = sqlite3.connect(db_file)
+    migrations.upgrade(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("INSERT INTO department (dept_id, dept_name) VALUES (1, '内科')")
+    conn.execute("INSERT INTO employee (emp_id, emp_name, emp_type, dept_id) VALUES (1, '张医生', '医生', 1)")
+    conn.execute("INSERT INTO clinic_room (room_id, room_name, dept_id) VALUES (1, '内科1诊室', 1)")
+    conn.execute("""
+        INSERT INTO doctor_schedule (schedule_id, doctor_id, room_id, work_date, start_time, end_time, max_patients)
+        VALUES (1, 1, 1, ?, '08:00:00', '12:00:00', ?)
+    """, (WORK_DATE, capacity))
+    conn.commit()
+    conn.close()
+
+
+_busy_timeout = None
+
+
+def _init_worker(db_file, threads, busy_timeout):
+    global _busy_timeout
+    db.configure(db_file, pool_size=threads)
+    _busy_timeout = busy_timeout
+
+
+def _attempt(args):
+    index, cancel = args
+    data = {
+        'patient_name': f'患者{index}',
+        'phone': f'139{index:08d}',
+        'dept_id': 1,
+        'doctor_id': 1 if index % 2 else None,
+        'appt_date': WORK_DATE,
+        'appt_time': '09:30',
+    }
+    try:
+        with db.get_db() as conn:
+            conn.execute(f"PRAGMA busy_timeout = {_busy_timeout}")
+            appointment = booking.create_appointment(conn, data)
+            if cancel:
+                booking.cancel_appointment(conn, appointment['appt_id'], data['phone'])
+                return 'cancelled'
+        return 'booked'
+    except booking.BookingError:
+        return 'full'
+    except sqlite3.OperationalError as e:
+        return 'busy' if db.is_busy_error(e) else f'error: {e}'
+
+
+def _run_batch(tasks, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(_attempt, tasks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预约并发压力测试')
+    parser.add_argument('--bookings', type=int, default=4000, help='预约请求总数')
+    parser.add_argument('--processes', type=int, default=4, help='进程数')
+    parser.add_argument('--threads', type=int, default=16, help='每个进程的线程数')
+    parser.add_argument('--capacity', type=int, default=30, help='排班号源数')
+    parser.add_argument('--cancel-rate', type=float, default=0.2, help='预约成功后立即取消的比例')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='SQLite busy_timeout（毫秒），调小可以触发重试')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'bench.db')
+    seed(db_file, args.capacity)
+
+    tasks = [(i, random.random() < args.cancel_rate) for i in range(args.bookings)]
+    chunks = [tasks[i::args.processes] for i in range(args.processes)]
+
+    print(f"{args.processes} 个进程 x {args.threads} 个线程，共 {args.bookings} 次预约，号源 {args.capacity} 个")
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes, initializer=_init_worker,
+                              initargs=(db_file, args.threads, args.busy_timeout)) as pool:
+        results = [r for batch in pool.starmap(_run_batch, [(chunk, args.threads) for chunk in chunks]) for r in batch]
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for result in results:
+        counts[result] = counts.get(result, 0) + 1
+    print(f"  用时 {elapsed:.2f}s（{len(results) / elapsed:.0f} 次/秒）")
+    for result, count in sorted(counts.items()):
+        print(f"  {result}: {count}")
+
+    conn = sqlite3.connect(db_file)
+    current, maximum = conn.execute("""
+        SELECT current_patients, max_patients FROM doctor_schedule WHERE schedule_id = 1
+    """).fetchone()
+    active = conn.execute("""
+        SELECT COUNT(*) FROM appointment WHERE schedule_id = 1 AND status != '已取消'
+    """).fetchone()[0]
+    mismatches = summary.check_schedule_counts(conn.cursor())
+    conn.close()
+
+    failed = False
+    print(f"  排班已约 {current}/{maximum}，有效预约记录 {active}")
+    if current != counts.get('booked', 0) or active != current:
+        failed = True
+        print("✗ 已约人数与成功预约数不一致")
+    if current > maximum or mismatches:
+        failed = True
+        print(f"✗ 超出号源或计数不一致: {mismatches}")
+    if counts.get('full') and current < maximum and not counts.get('cancelled'):
+        failed = True
+        print("✗ 号源未满却拒绝了预约")
+    if any(result not in ('booked', 'cancelled', 'full') for result in results):
+        failed = True
+        print("✗ 有预约因数据库锁或其他错误失败")
+    if not failed:
+        print("✓ 没有超约，计数准确")
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    os.rmdir(workdir)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+模拟医院数据生成
+
+按患者规模生成一家完整的模拟医院，供 bench.workload 等性能测试使用：
+科室、医生/护士/行政人员、诊室、排班、患者、就诊、账单和预约。
+
+    python -m bench.datagen --out bench.db [--scale 10k|100k|1m] [--patients N]
+                            [--days 365] [--visits-per-patient 4] [--seed 1]
+
+数据规模随患者数增长：每约5000名患者一个诊室、每约2500名患者一名医生，
+就诊记录分布在最近 days 天内（今天的就诊有各种状态，可以直接测试候诊队列），
+已离院的就诊有已支付账单（约2%退款），未来7天有预约并占用排班号源。
+
+写入方式与 bulk_import 相同：先删除二级索引和触发器，批量写入后重建，
+再统一计算汇总表。
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import bulk_import
+from bench.patient_search import SURNAMES, GIVEN
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+DEPARTMENTS = ['内科', '外科', '儿科', '妇产科', '骨科', '眼科', '耳鼻喉科', '口腔科',
+               '皮肤科', '中医科', '神经内科', '心血管内科', '呼吸内科', '消化内科', '急诊科']
+TITLES = ['主任医师', '副主任医师', '主治医师', '住院医师']
+PAYMENT_METHODS = ['现金', '微信', '支付宝', '银行卡', '医保卡']
+DIAGNOSES = ['上呼吸道感染', '高血压', '2型糖尿病', '急性胃肠炎', '腰椎间盘突出', '过敏性鼻炎',
+             '支气管炎', '结膜炎', '湿疹', '龋齿', '偏头痛', '冠心病']
+# 门诊时段：(开始, 结束)
+SHIFTS = [('08:00:00', '12:00:00'), ('14:00:00', '17:30:00')]
+
+BATCH = 50000
+
+
+def random_name(rng):
+    return rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN) for _ in range(rng.choice((1, 2))))
+
+
+def patient_phone(index):
+    # 由序号决定，不需要在内存中保存全部患者的电话
+    return f'1{"3589"[index % 4]}{index:09d}'
+
+
+def random_time(rng, shift):
+    start = int(shift[0][:2]) * 3600
+    end = int(shift[1][:2]) * 3600 + int(shift[1][3:5]) * 60
+    seconds = rng.randrange(start, end)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Hospital:
+    """生成过程中需要互相引用的编号"""
+
+    def __init__(self):
+        self.departments = []
+        self.rooms = {}      # dept_id -> [room_id]
+        self.doctors = {}    # dept_id -> [(doctor_id, room_id)]
+        self.patient_count = 0
+
+
+def seed_staff(cursor, rng, hospital, patients):
+    dept_count = min(len(DEPARTMENTS), max(5, patients // 20000 + 5))
+    room_count = max(dept_count, patients // 5000)
+    doctor_count = max(dept_count * 2, patients // 2500)
+
+    for name in DEPARTMENTS[:dept_count]:
+        cursor.execute("INSERT INTO department (dept_name, description) VALUES (?, ?)", (name, f'{name}门诊'))
+        hospital.departments.append(cursor.lastrowid)
+
+    for i in range(room_count):
+        dept_id = hospital.departments[i % dept_count]
+        number = len(hospital.rooms.get(dept_id, [])) + 1
+        cursor.execute("""
+            INSERT INTO clinic_room (room_name, dept_id, status) VALUES (?, ?, ?)
+        """, (f'{DEPARTMENTS[hospital.departments.index(dept_id)]}{number}诊室', dept_id,
+              '开放' if rng.random() > 0.05 else '维护中'))
+        hospital.rooms.setdefault(dept_id, []).append(cursor.lastrowid)
+
+    for i in range(doctor_count):
+        dept_id = hospital.departments[i % dept_count]
+        cursor.execute("""
+            INSERT INTO employee (emp_name, emp_type, dept_id, title, phone, work_status)
+            VALUES (?, '医生', ?, ?, ?, ?)
+        """, (random_name(rng), dept_id, rng.choice(TITLES), f'135{rng.randrange(10 ** 8):08d}',
+              '在职' if rng.random() > 0.03 else '休假'))
+        rooms = hospital.rooms[dept_id]
+        hospital.doctors.setdefault(dept_id, []).append((cursor.lastrowid, rooms[i // dept_count % len(rooms)]))
+
+    staff = [(random_name(rng), '护士', rng.choice(hospital.departments)) for _ in range(doctor_count // 2)]
+    staff += [(random_name(rng), '行政人员', None) for _ in range(max(3, doctor_count // 10))]
+    cursor.executemany("""
+        INSERT INTO employee (emp_name, emp_type, dept_id) VALUES (?, ?, ?)
+    """, staff)
+    return dept_count, room_count, doctor_count
+
+
+def seed_schedules(cursor, hospital, first_day, last_day):
+    rows = []
+    day = first_day
+    while day <= last_day:
+        for doctors in hospital.doctors.values():
+            for doctor_id, room_id in doctors:
+                for start, end in SHIFTS:
+                    rows.append((doctor_id, room_id, day.isoformat(), start, end, 30))
+        day += timedelta(days=1)
+    cursor.executemany("""
+        INSERT INTO doctor_schedule (doctor_id, room_id, work_date, start_time, end_time, max_patients)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+
+def seed_patients(conn, rng, hospital, patients):
+    for offset in range(0, patients, BATCH):
+        rows = []
+        for i in range(offset, min(offset + BATCH, patients)):
+            phone = patient_phone(i)
+            # 地区码和顺序码由序号决定，保证身份证号不重复
+            id_card = (f'{440000 + i // 10000 % 10000:06d}{rng.randint(1940, 2020)}'
+                       f'{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{i % 10000:04d}')
+            rows.append((i + 1, random_name(rng), rng.choice('男女'), id_card if rng.random() > 0.1 else None,
+                         phone, rng.choice(['广州市', '深圳市', '佛山市', '东莞市']) + f'{rng.randint(1, 999)}号'))
+        conn.executemany("""
+            INSERT INTO patient (patient_id, patient_name, gender, id_card, phone, address)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    hospital.patient_count = patients
+
+
+def seed_visits(conn, rng, hospital, days, visits_per_patient, today):
+    total = hospital.patient_count * visits_per_patient
+    visit_id = 0
+    bill_id = 0
+    for offset in range(0, total, BATCH):
+        visits = []
+        bills = []
+        for _ in range(min(BATCH, total - offset)):
+            visit_id += 1
+            patient_id = rng.randint(1, hospital.patient_count)
+            dept_id = rng.choice(hospital.departments)
+            doctor_id, room_id = rng.choice(hospital.doctors[dept_id])
+            # 越近的日期就诊越多
+            days_ago = min(int(rng.expovariate(3.0 / days)), days - 1)
+            visit_date = (today - timedelta(days=days_ago)).isoformat()
+            visit_time = random_time(rng, rng.choice(SHIFTS))
+            if days_ago == 0:
+                status = rng.choices(['等待就诊', '就诊中', '已完成', '已离院'], [3, 1, 2, 4])[0]
+            else:
+                status = '已离院'
+            visits.append((visit_id, patient_id, dept_id, room_id, doctor_id, visit_date, visit_time,
+                           rng.choice(DIAGNOSES) if status in ('已完成', '已离院') else None, status))
+            if status == '已离院':
+                bill_id += 1
+                total_fee = round(rng.lognormvariate(5, 0.8), 2)
+                insurance_fee = round(total_fee * rng.uniform(0, 0.8), 2)
+                payment_time = f'{visit_date} {visit_time}'
+                bills.append((bill_id, visit_id, patient_id, total_fee, insurance_fee,
+                              round(total_fee - insurance_fee, 2), rng.choice(PAYMENT_METHODS),
+                              '已支付' if rng.random() > 0.02 else '已退款', payment_time, visit_date))
+        conn.executemany("""
+            INSERT INTO visit (visit_id, patient_id, dept_id, room_id, doctor_id, visit_date,
+                               visit_time, diagnosis, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, visits)
+        conn.executemany("""
+            INSERT INTO billing (bill_id, visit_id, patient_id, total_fee, insurance_fee, self_fee,
+                                 payment_method, payment_status, payment_time, payment_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, bills)
+        conn.commit()
+    return visit_id, bill_id
+
+
+def seed_appointments(conn, rng, hospital, today, count):
+    rows = []
+    booked = {}
+    for _ in range(count):
+        phone = patient_phone(rng.randrange(hospital.patient_count))
+        dept_id = rng.choice(hospital.departments)
+        doctor_id, _room = rng.choice(hospital.doctors[dept_id])
+        appt_date = (today + timedelta(days=rng.randint(0, 7))).isoformat()
+        shift = rng.randrange(len(SHIFTS))
+        key = (doctor_id, appt_date, SHIFTS[shift][0])
+        if booked.get(key, 0) >= 30:
+            continue
+        booked[key] = booked.get(key, 0) + 1
+        rows.append((random_name(rng), phone, dept_id, doctor_id, appt_date,
+                     random_time(rng, SHIFTS[shift]), doctor_id, appt_date, SHIFTS[shift][0]))
+    conn.executemany("""
+        INSERT INTO appointment (patient_name, phone, dept_id, doctor_id, appt_date, appt_time, schedule_id)
+        VALUES (?, ?, ?, ?, ?, ?, (
+            SELECT schedule_id FROM doctor_schedule WHERE doctor_id = ? AND work_date = ? AND start_time = ?
+        ))
+    """, rows)
+    conn.execute("""
+        UPDATE doctor_schedule SET current_patients = (
+            SELECT COUNT(*) FROM appointment a
+            WHERE a.schedule_id = doctor_schedule.schedule_id AND a.status != '已取消'
+        )
+        WHERE work_date >= ?
+    """, (today.isoformat(),))
+    conn.commit()
+    return len(rows)
+
+
+def generate(db_file, patients, days=365, visits_per_patient=4, seed=1, verbose=True):
+    """生成模拟医院数据库，返回各表行数"""
+    if os.path.exists(db_file):
+        raise FileExistsError(f'{db_file} 已存在')
+    rng = random.Random(seed)
+    today = date.today()
+    hospital = Hospital()
+    log = print if verbose else (lambda *args: None)
+
+    conn = bulk_import.connect(db_file)
+    bulk_import.defer_indexes(conn)
+    started = time.perf_counter()
+
+    cursor = conn.cursor()
+    depts, rooms, doctors = seed_staff(cursor, rng, hospital, patients)
+    schedules = seed_schedules(cursor, hospital, today - timedelta(days=7), today + timedelta(days=7))
+    conn.commit()
+    log(f"  科室 {depts}，诊室 {rooms}，医生 {doctors}，排班 {schedules}")
+
+    seed_patients(conn, rng, hospital, patients)
+    log(f"  患者 {patients}（{time.perf_counter() - started:.1f}s）")
+
+    visits, bills = seed_visits(conn, rng, hospital, days, visits_per_patient, today)
+    log(f"  就诊 {visits}，账单 {bills}（{time.perf_counter() - started:.1f}s）")
+
+    appointments = seed_appointments(conn, rng, hospital, today, max(100, patients // 50))
+    log(f"  预约 {appointments}")
+
+    log("  重建索引和汇总表...")
+    bulk_import.restore_indexes(conn, verbose=False)
+    conn.execute("ANALYZE")
+    conn.commit()
+    log(f"  完成，用时 {time.perf_counter() - started:.1f}s")
+
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('department', 'employee', 'clinic_room', 'doctor_schedule',
+                            'patient', 'visit', 'billing', 'appointment')}
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟医院数据生成')
+    parser.add_argument('--out', required=True, help='输出数据库文件（不能已存在）')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k', help='患者规模')
+    parser.add_argument('--patients', type=int, help='患者人数（覆盖 --scale）')
+    parser.add_argument('--days', type=int, default=365, help='就诊记录覆盖的天数')
+    parser.add_argument('--visits-per-patient', type=int, default=4, help='平均每个患者的就诊次数')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    args = parser.parse_args()
+
+    patients = args.patients or SCALES[args.scale]
+    print(f"正在生成 {patients} 名患者规模的模拟医院: {args.out}")
+    counts = generate(args.out, patients, args.days, args.visits_per_patient, args.seed)
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+合并提交压测：逐个提交 vs 进程内合并提交（writes.configure_group_commit）
+
+在数据库的临时副本上，用一个进程的多个线程持续执行"到院登记 + 缴费"，
+先逐个提交，再依次用不同的等待窗口合并提交，输出写操作吞吐量、延迟和
+平均每批的写操作数。
+
+其中 --fail-rate 比例的登记故意不带诊室：新患者已经插入后，插入就诊记录
+违反 NOT NULL 约束失败。结束后检查这些患者都已随 SAVEPOINT 回滚，成功的
+登记和缴费都已写入，收入汇总表和患者就诊次数与原始表一致。
+
+    python -m bench.group_commit --db bench.db [--threads 16] [--duration 10]
+                                 [--windows 0,1,2,5] [--max-batch 64]
+                                 [--synchronous FULL] [--fail-rate 0.05]
+
+默认 synchronous=FULL：每次提交都等数据写入磁盘，接近逐个提交时
+fsync 占大部分耗时的情况（系统默认的 NORMAL 在 WAL 模式下提交时不 fsync）。
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import summary
+import writes
+
+
+def _visit_and_bill(thread, index, fail):
+    phone = f'16{thread:03d}{index:06d}'
+    visit = writes.submit('register_visit', {
+        'patient_name': f'合并{thread}-{index}', 'phone': phone, 'dept_id': 1,
+        'room_id': None if fail else 1,
+    })
+    writes.submit('create_billing', {
+        'visit_id': visit['visit_id'], 'patient_id': visit['patient_id'],
+        'total_fee': 80, 'insurance_fee': 30, 'payment_method': '医保卡',
+    })
+
+
+def _prepare_connections(size, synchronous):
+    # 连接在池中复用，预先设置好每个连接的同步级别
+    pool = db.get_pool()
+    conns = [pool.acquire() for _ in range(size)]
+    for conn in conns:
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+    for conn in conns:
+        pool.release(conn)
+
+
+def _check(db_file, failed_phones):
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    problems = []
+    leaked = 0
+    for i in range(0, len(failed_phones), 500):
+        chunk = failed_phones[i:i + 500]
+        cursor.execute(f"SELECT COUNT(*) FROM patient WHERE phone IN ({', '.join('?' * len(chunk))})", chunk)
+        leaked += cursor.fetchone()[0]
+    if leaked:
+        problems.append(f'{leaked} 个失败登记的患者没有回滚')
+    if summary.check_revenue_summary(cursor):
+        problems.append('收入汇总表与账单不一致')
+    if summary.check_patient_visit_stats(cursor):
+        problems.append('患者就诊次数与就诊记录不一致')
+    conn.close()
+    return problems
+
+
+def measure(args, window):
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'group_commit.db')
+    shutil.copy(args.db, db_file)
+    db.configure(db_file, pool_size=args.threads + 1)
+    _prepare_connections(args.threads + 1, args.synchronous)
+    committer = writes.configure_group_commit(window / 1000 if window is not None else None, args.max_batch)
+
+    latencies, failed_phones, errors = [], [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def loop(thread):
+        rng = random.Random(thread)
+        index = 0
+        while time.perf_counter() < deadline:
+            index += 1
+            fail = rng.random() < args.fail_rate
+            start = time.perf_counter()
+            try:
+                _visit_and_bill(thread, index, fail)
+                result = None
+            except (sqlite3.IntegrityError, writes.WriteFailed) as e:
+                result = 'expected' if fail and 'NOT NULL' in str(e) else str(e)
+            except Exception as e:
+                result = str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if result is None:
+                    latencies.append(elapsed)
+                elif result == 'expected':
+                    failed_phones.append(f'16{thread:03d}{index:06d}')
+                else:
+                    errors[result] = errors.get(result, 0) + 1
+
+    try:
+        threads = [threading.Thread(target=loop, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batch_size = committer.operations / committer.batches if committer and committer.batches else 1
+    finally:
+        writes.configure_writer(None)
+        db.get_pool().close_all()
+
+    problems = _check(db_file, failed_phones)
+    shutil.rmtree(workdir, ignore_errors=True)
+    latencies.sort()
+    # 每次循环是两个写操作，失败的登记算一个
+    operations = len(latencies) * 2 + len(failed_phones)
+    return {
+        'throughput': operations / args.duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+        'batch': batch_size,
+        'rolled_back': len(failed_phones),
+        'errors': errors,
+        'problems': problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='逐个提交与合并提交的写入吞吐量对比')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--threads', type=int, default=16, help='并发线程数')
+    parser.add_argument('--duration', type=float, default=10, help='每轮压测时长（秒）')
+    parser.add_argument('--windows', default='0,1,2,5', help='逗号分隔的合并提交等待窗口（毫秒）')
+    parser.add_argument('--max-batch', type=int, default=writes.MAX_BATCH, help='一个事务最多合并的写操作数')
+    parser.add_argument('--synchronous', default='FULL', choices=('OFF', 'NORMAL', 'FULL'), help='SQLite 同步级别')
+    parser.add_argument('--fail-rate', type=float, default=0.05, help='故意失败的登记比例')
+    args = parser.parse_args()
+
+    print(f"{args.threads} 个线程，每轮 {args.duration:.0f} 秒，synchronous={args.synchronous}，"
+          f"失败比例 {args.fail_rate:.0%}")
+    print(f"\n{'方式':<14}{'写/秒':>10}{'p50':>9}{'p99':>9}{'每批':>8}{'回滚':>8}")
+    failed = False
+    rounds = [('逐个提交', None)] + [(f'合并 {w}ms', float(w)) for w in args.windows.split(',')]
+    for label, window in rounds:
+        result = measure(args, window)
+        print(f"{label:<12}{result['throughput']:>10.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['batch']:>8.1f}{result['rolled_back']:>8}")
+        for message, count in result['errors'].items():
+            failed = True
+            print(f"  ✗ 意外错误 {count} 次: {message}")
+        for problem in result['problems']:
+            failed = True
+            print(f"  ✗ {problem}")
+    print("\n写/秒为每秒完成的写操作数，延迟单位 ms，为一次登记 + 缴费的耗时")
+    if not failed:
+        print("✓ 失败的登记均已回滚，汇总数据一致")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+页面加载对比：内联 CSS/JS 的模板页面 vs assets.py 构建后的页面
+
+在临时目录中构建页面，对首页和三个角色页面分别统计：
+
+- 原始：每次打开都渲染模板、整页和共用的 static/ 脚本不压缩下载（构建和响应压缩之前的方式）
+- 内联+压缩：渲染模板，响应按 Accept-Encoding 压缩（没有构建时的方式）
+- 构建后：页面和 /assets/ 资源预先压缩；再次打开时页面 304，资源直接用浏览器缓存
+
+输出首次、再次打开传输的字节数（响应体）和请求数、服务端处理一次页面请求的耗时，
+并按给定的网络往返时间和带宽估算页面可交互的时间（页面下载完后并行下载 CSS/JS，
+不计 TCP/TLS 建连和浏览器执行时间）。
+
+    python -m bench.page_load [--rtt-ms 100] [--kbps 2000] [--repeat 200]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import assets
+import db
+
+ACCEPT = {'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def serve_time(client, url, repeat, headers=ACCEPT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url, headers=headers)
+    return (time.perf_counter() - start) / repeat
+
+
+def load(client, url):
+    """首次打开：页面和引用的资源，返回 (页面字节数, [资源字节数], 页面 ETag, 资源URL)"""
+    page = client.get(url, headers=ACCEPT)
+    urls = re.findall(r'(?:href|src)="(/(?:assets|static)/[^"]+)"', client.get(url).get_data(as_text=True))
+    sizes = [len(client.get(asset, headers=ACCEPT).data) for asset in urls]
+    return len(page.data), sizes, page.headers.get('ETag'), urls
+
+
+def revisit(client, url, etag):
+    """再次打开：带 If-None-Match 重新验证页面，返回页面字节数"""
+    response = client.get(url, headers=dict(ACCEPT, **{'If-None-Match': etag}))
+    return len(response.data) if response.status_code == 200 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='内联页面与构建后页面的加载对比')
+    parser.add_argument('--rtt-ms', type=float, default=100, help='网络往返时间（毫秒）')
+    parser.add_argument('--kbps', type=float, default=2000, help='带宽（kbit/s）')
+    parser.add_argument('--repeat', type=int, default=200, help='测量服务端耗时的请求次数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db.configure(':memory:')
+    import app
+    client = app.app.test_client()
+    rtt = args.rtt_ms / 1000
+    byte_time = 8 / (args.kbps * 1000)
+
+    def estimate(page_bytes, asset_bytes, server):
+        # 页面一个往返；有资源时再一个往返，各资源并行下载、共用带宽
+        total = rtt + page_bytes * byte_time + server
+        if asset_bytes:
+            total += rtt + sum(asset_bytes) * byte_time
+        return total * 1000
+
+    try:
+        build_dir = os.path.join(workdir, 'build')
+        assets.build(build_dir)
+        print(f"网络：往返 {args.rtt_ms:g}ms，带宽 {args.kbps:g}kbit/s（字节数为响应体，估算时间单位 ms）\n")
+        print(f"{'页面':<20}{'方式':<12}{'首次字节':>10}{'请求':>6}{'再次字节':>10}{'服务端':>10}"
+              f"{'首次估算':>10}{'再次估算':>10}")
+        for template in assets.PAGES:
+            url = '/' if template == 'index.html' else '/' + template[:-len('.html')]
+
+            assets.configure(None)
+            original = len(client.get(url).data)
+            original_time = serve_time(client, url, args.repeat, {})
+            inline_bytes, inline_assets, inline_etag, static_urls = load(client, url)
+            # 页面共用的 static/ 脚本（没有构建时由 Flask 返回，不压缩）
+            static_bytes = [len(client.get(static_url).data) for static_url in static_urls]
+            inline_revisit = revisit(client, url, inline_etag)
+            inline_time = serve_time(client, url, args.repeat)
+
+            assets.configure(build_dir)
+            page_bytes, asset_bytes, etag, _ = load(client, url)
+            built_revisit = revisit(client, url, etag)
+            built_time = serve_time(client, url, args.repeat)
+
+            rows = [
+                ('原始', original + sum(static_bytes), 1 + len(static_bytes), original, original_time,
+                 estimate(original, static_bytes, original_time), estimate(original, [], original_time)),
+                ('内联+压缩', inline_bytes + sum(inline_assets), 1 + len(inline_assets), inline_revisit, inline_time,
+                 estimate(inline_bytes, inline_assets, inline_time), estimate(inline_revisit, [], inline_time)),
+                ('构建后', page_bytes + sum(asset_bytes), 1 + len(asset_bytes), built_revisit, built_time,
+                 estimate(page_bytes, asset_bytes, built_time), estimate(built_revisit, [], built_time)),
+            ]
+            for label, first, requests, again, server, first_ms, again_ms in rows:
+                print(f"{template:<20}{label:<10}{first:>12}{requests:>6}{again:>10}"
+                      f"{server * 1000:>8.2f}ms{first_ms:>10.0f}{again_ms:>10.0f}")
+    finally:
+        assets.configure()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
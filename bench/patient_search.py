@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+患者搜索对比
+
+在临时数据库中生成大量患者（默认100万），对比原来的
+LIKE '%关键词%' 查询和 patient_search 搜索索引的耗时。
+
+    python -m bench.patient_search [--rows 1000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import migrations
+from patient_search import search_patient_ids
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈'
+GIVEN = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超兰霞平刚桂建国华文博志晓东海波红玲雅琪俊浩然思婷梦洁宇鑫'
+
+OLD_SEARCH = """
+    SELECT patient_id FROM patient
+    WHERE patient_name LIKE ? OR phone LIKE ? OR id_card LIKE ?
+    ORDER BY created_at DESC
+    LIMIT 50
+"""
+
+
+def random_name():
+    return random.choice(SURNAMES) + ''.join(random.choice(GIVEN) for _ in range(random.choice((1, 2))))
+
+
+def seed(conn, rows):
+    batch = 50000
+    for offset in range(0, rows, batch):
+        patients = []
+        for i in range(offset, min(offset + batch, rows)):
+            patients.append((
+                random_name(),
+                random.choice('男女'),
+                f'4401{random.randint(1950, 2020)}{i:010d}'[:18],
+                f'1{random.choice("3589")}{random.randint(0, 999999999):09d}',
+            ))
+        conn.executemany("""
+            INSERT INTO patient (patient_name, gender, id_card, phone) VALUES (?, ?, ?, ?)
+        """, patients)
+    conn.commit()
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='患者搜索对比')
+    parser.add_argument('--rows', type=int, default=1000000, help='患者人数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个查询重复次数（取最快一次）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'bench.db')
+    conn = sqlite3.connect(db_file)
+    migrations.upgrade(conn)
+
+    print(f"正在生成 {args.rows} 个患者...")
+    start = time.perf_counter()
+    seed(conn, args.rows)
+    conn.execute("ANALYZE")
+    print(f"  完成，用时 {time.perf_counter() - start:.1f}s")
+
+    sample = conn.execute("SELECT patient_name, phone, id_card FROM patient ORDER BY random() LIMIT 1").fetchone()
+    keywords = [
+        ('姓氏', sample[0][0]),
+        ('完整姓名', sample[0]),
+        ('电话前7位', sample[1][:7]),
+        ('电话中间4位', sample[1][3:7]),
+        ('身份证号', sample[2]),
+    ]
+
+    print()
+    print(f"{'关键词':<12}{'LIKE':>12}{'搜索索引':>12}{'命中':>8}")
+    cursor = conn.cursor()
+    for name, keyword in keywords:
+        pattern = f'%{keyword}%'
+        old_time, _ = timed(lambda: conn.execute(OLD_SEARCH, (pattern,) * 3).fetchall(), args.repeat)
+        new_time, ids = timed(lambda: search_patient_ids(cursor, keyword, limit=50), args.repeat)
+        print(f"{name:<12}{old_time * 1000:>10.1f}ms{new_time * 1000:>10.2f}ms{len(ids):>8}")
+
+    conn.close()
+    os.remove(db_file)
+    os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
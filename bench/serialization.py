@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 响应序列化对比：dict(row) + jsonify vs serializer 快速路径
+
+对就诊列表（当天就诊，/api/receptionist/visits）和患者列表（/api/receptionist/patients、
+/api/admin/patients）的查询，分别计时：
+
+- 原方式：fetchall() 得到 sqlite3.Row，逐行 dict(row)，再 jsonify（排序字典键）
+- 快速路径：serializer.rows() 按元组取结果、用缓存的列名组成字典，标准库 json
+  或 orjson（已安装时）直接编码成字节
+
+并校验各方式解码后的结果一致。
+
+    python -m bench.serialization --db bench.db [--limit 500] [--repeat 50]
+"""
+
+import argparse
+import json
+import sys
+
+from flask import Flask, jsonify
+
+import serializer
+from backends import SQLiteBackend
+from bench.analytics import best_of
+
+CASES = [
+    ('当天就诊', """
+        SELECT v.visit_id, p.patient_name, d.dept_name,
+               cr.room_name, v.visit_time, v.status,
+               e.emp_name as doctor_name
+        FROM visit v
+        JOIN patient p ON v.patient_id = p.patient_id
+        JOIN department d ON v.dept_id = d.dept_id
+        JOIN clinic_room cr ON v.room_id = cr.room_id
+        LEFT JOIN employee e ON v.doctor_id = e.emp_id
+        WHERE v.visit_date = ?
+        ORDER BY v.visit_time DESC, v.visit_id DESC LIMIT ?
+    """, 'day'),
+    ('患者（按登记时间）', """
+        SELECT patient_id, patient_name, gender, phone, id_card, address, created_at as registration_date
+        FROM patient
+        ORDER BY created_at DESC, patient_id DESC LIMIT ?
+    """, None),
+    ('患者（按最近就诊）', """
+        SELECT patient_id, patient_name, gender, phone, id_card,
+               visit_count, last_visit_date
+        FROM patient
+        ORDER BY last_visit_date DESC, patient_id DESC LIMIT ?
+    """, None),
+]
+
+
+def old_response(flask_app, cursor, sql, params):
+    with flask_app.app_context():
+        cursor.execute(sql, params)
+        data = [dict(row) for row in cursor.fetchall()]
+        return jsonify({'success': True, 'data': data}).get_data()
+
+
+def fast_response(cursor, sql, params, encode):
+    return encode({'success': True, 'data': serializer.rows(cursor, sql, params)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 响应序列化耗时对比')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--limit', type=int, default=500, help='每页行数（接口的最大每页行数）')
+    parser.add_argument('--repeat', type=int, default=50, help='每种方式重复次数（取最快一次）')
+    args = parser.parse_args()
+
+    conn = SQLiteBackend(args.db).connect()
+    cursor = conn.cursor()
+    flask_app = Flask(__name__)
+    # 就诊最多的一天
+    day = conn.execute("""
+        SELECT visit_date FROM visit GROUP BY visit_date ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()[0]
+
+    encoders = sorted(serializer.ENCODERS)
+    if 'orjson' not in encoders:
+        print("未安装 orjson，只对比标准库 json（pip install orjson）")
+    print(f"{'查询':<16}{'行数':>6}{'原方式':>10}" + ''.join(f'{name:>10}' for name in encoders)
+          + f"{'加速':>8}  结果一致")
+    failed = False
+    try:
+        for label, sql, extra in CASES:
+            params = (day, args.limit) if extra == 'day' else (args.limit,)
+            old_time, old_body = best_of(args.repeat, lambda: old_response(flask_app, cursor, sql, params))
+            expected = json.loads(old_body)
+            timings = []
+            same = True
+            for name in encoders:
+                encode = serializer.ENCODERS[name]
+                elapsed, body = best_of(args.repeat, lambda: fast_response(cursor, sql, params, encode))
+                timings.append(elapsed)
+                same = same and json.loads(body) == expected
+            failed = failed or not same
+            print(f"{label:<12}{len(expected['data']):>8}{old_time * 1000:>8.2f}ms"
+                  + ''.join(f'{t * 1000:>8.2f}ms' for t in timings)
+                  + f"{old_time / min(timings):>7.1f}x  {'✓' if same else '✗'}")
+    finally:
+        conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
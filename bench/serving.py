@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+服务模式对比：Flask 开发服务器 vs ASGI 服务（asgi.py）
+
+分别在数据库的两个临时副本上启动两种服务，用 bench.workload 的混合请求
+压测同样的时长，输出吞吐量、延迟，以及服务进程每个请求消耗的CPU时间：
+
+    python -m bench.serving --db bench.db [--duration 20] [--threads 16]
+                            [--workers 1] [--server-threads 8]
+
+压测客户端与服务在同一台机器上运行、互相争用CPU；服务进程已占满CPU时，
+吞吐量主要取决于每个请求的CPU时间和可用的核数（--workers）。
+"""
+
+import argparse
+import http.client
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import workload
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEV_SERVER = (
+    "import sys, db; db.configure(sys.argv[1]); import app; "
+    "app.app.run(debug=True, host='127.0.0.1', port=int(sys.argv[2]), use_reloader=False)"
+)
+
+
+def server_command(mode, db_file, port, workers, threads):
+    if mode == 'dev':
+        return [sys.executable, '-c', DEV_SERVER, db_file, str(port)]
+    return [sys.executable, 'asgi.py', '--host', '127.0.0.1', '--port', str(port), '--db', db_file,
+            '--workers', str(workers), '--threads', str(threads)]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def process_cpu(pid):
+    """进程及其子进程累计的CPU秒数（只支持 Linux 的 /proc），不支持时返回 None"""
+    if not os.path.exists(f'/proc/{pid}/stat'):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    total = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] 为父进程号，fields[11]/fields[12] 为用户态/内核态时间
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += int(fields[11]) + int(fields[12])
+    return total / ticks
+
+
+def measure(mode, args, port):
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'serving.db')
+    shutil.copy(args.db, db_file)
+    server = subprocess.Popen(server_command(mode, db_file, port, args.workers, args.server_threads),
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(port):
+            raise RuntimeError(f'{mode} 服务启动失败')
+        scenario = workload.Scenario(db_file, random.Random(args.seed))
+        cpu_before = process_cpu(server.pid)
+        _, total = workload.run(workload.HttpTransport(f'http://127.0.0.1:{port}'), scenario,
+                                workload.parse_mix(args.mix), args.threads, args.duration,
+                                seed=args.seed)
+        cpu_after = process_cpu(server.pid)
+        if cpu_before is not None and total['count']:
+            total['cpu_ms_per_request'] = round((cpu_after - cpu_before) / total['count'] * 1000, 3)
+        return total
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flask 开发服务器与 ASGI 服务吞吐量对比')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--duration', type=float, default=20, help='每种服务的压测时长（秒）')
+    parser.add_argument('--threads', type=int, default=16, help='压测并发线程数')
+    parser.add_argument('--workers', type=int, default=1, help='ASGI 服务进程数')
+    parser.add_argument('--server-threads', type=int, default=8, help='ASGI 服务每个进程的线程数')
+    parser.add_argument('--mix', default=workload.DEFAULT_MIX, help='角色请求比例')
+    parser.add_argument('--port', type=int, default=5055, help='服务端口')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    args = parser.parse_args()
+
+    print(f"{args.threads} 个压测线程，每种服务 {args.duration:.0f} 秒，CPU 核数 {os.cpu_count()}")
+    results = {}
+    for mode, label in (('dev', 'Flask 开发服务器'),
+                        ('asgi', f'ASGI（{args.workers} 进程 x {args.server_threads} 线程）')):
+        print(f"  压测 {label} ...")
+        results[label] = measure(mode, args, args.port)
+
+    print(f"\n{'服务':<32}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'错误':>6}{'CPU/请求':>10}")
+    for label, total in results.items():
+        cpu = total.get('cpu_ms_per_request')
+        print(f"{label:<30}{total['throughput']:>9.1f}{total['p50_ms']:>9.2f}{total['p95_ms']:>9.2f}"
+              f"{total['p99_ms']:>9.2f}{total['errors']:>6}{cpu if cpu is not None else '-':>10}")
+    dev, asgi = results.values()
+    print(f"\nASGI 吞吐量为开发服务器的 {asgi['throughput'] / dev['throughput']:.2f} 倍（延迟单位 ms，CPU 单位 ms）")
+    sys.exit(1 if dev['errors'] or asgi['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
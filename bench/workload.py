@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+接口负载测试
+
+按患者端、前台、管理端的请求比例，多线程回放预约、到院登记、候诊队列、
+缴费、统计等接口，统计每个接口的 p50/p95/p99 延迟和吞吐量：
+
+    python -m bench.workload --db bench.db [--duration 30] [--threads 8]
+                             [--mix patient=3,receptionist=5,admin=2]
+                             [--save baseline.json] [--compare baseline.json]
+
+默认在进程内通过 Flask test client 调用 app.py，数据库为 --db 的临时副本
+（写接口不会修改原文件）；指定 --url 时改为请求已启动的服务，例如：
+
+    python -m bench.workload --db bench.db --url http://127.0.0.1:5000
+
+--save 把结果保存为 JSON 基线；--compare 与基线对比，某个接口的 p95 比基线慢
+超过 --tolerance（默认30%，且至少慢1ms）时列出并以状态码1退出。
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from urllib.parse import quote, urlsplit
+
+# 各角色的操作及权重
+PATIENT_OPERATIONS = [
+    ('departments', 3),
+    ('doctors_by_dept', 3),
+    ('book', 3),
+    ('my_appointments', 2),
+]
+RECEPTIONIST_OPERATIONS = [
+    ('queue', 6),
+    ('search_patient', 3),
+    ('register', 3),
+    ('visit_status', 3),
+    ('billing', 2),
+    ('visit_info', 1),
+    ('patient_history', 1),
+]
+ADMIN_OPERATIONS = [
+    ('dashboard', 4),
+    ('statistics', 3),
+    ('admin_patients', 2),
+    ('schedules', 1),
+]
+ROLES = {
+    'patient': PATIENT_OPERATIONS,
+    'receptionist': RECEPTIONIST_OPERATIONS,
+    'admin': ADMIN_OPERATIONS,
+}
+DEFAULT_MIX = 'patient=3,receptionist=5,admin=2'
+
+# 回归判定：p95 比基线慢超过该比例且至少慢 MIN_REGRESSION_MS 毫秒
+DEFAULT_TOLERANCE = 0.3
+MIN_REGRESSION_MS = 1.0
+
+
+# ==================== 客户端 ====================
+
+class _Response:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+
+class TestClientTransport:
+    """进程内调用 app.py（Flask test client）"""
+
+    def __init__(self, db_file):
+        import db
+        db.configure(db_file)
+        from app import app
+        self.app = app
+
+    def client(self):
+        client = self.app.test_client()
+
+        def request(method, path, body=None):
+            response = client.open(path, method=method, json=body)
+            return _Response(response.status_code, response.get_data())
+        return request
+
+
+class HttpTransport:
+    """请求已启动的服务，每个线程一个长连接"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+
+    def client(self):
+        state = {'conn': None}
+
+        def request(method, path, body=None):
+            headers = {}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+            for attempt in range(2):
+                if state['conn'] is None:
+                    state['conn'] = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                try:
+                    state['conn'].request(method, quote(path, safe='/?&='), payload, headers)
+                    response = state['conn'].getresponse()
+                    return _Response(response.status, response.read())
+                except (http.client.HTTPException, ConnectionError):
+                    state['conn'].close()
+                    state['conn'] = None
+                    if attempt:
+                        raise
+        return request
+
+
+# ==================== 请求生成 ====================
+
+class Scenario:
+    """从数据库中取样本数据，生成各个操作的请求"""
+
+    def __init__(self, db_file, rng):
+        self.rng = rng
+        self.today = date.today().isoformat()
+        conn = sqlite3.connect(db_file)
+        self.departments = [row[0] for row in conn.execute("SELECT dept_id FROM department")]
+        self.doctors = conn.execute("""
+            SELECT e.emp_id, e.dept_id FROM employee e WHERE e.emp_type = '医生'
+        """).fetchall()
+        self.rooms = {}
+        for room_id, dept_id in conn.execute("SELECT room_id, dept_id FROM clinic_room"):
+            self.rooms.setdefault(dept_id, []).append(room_id)
+        self.patients = conn.execute("""
+            SELECT patient_id, patient_name, phone, id_card FROM patient ORDER BY random() LIMIT 2000
+        """).fetchall()
+        self.visits = [row[0] for row in conn.execute("SELECT visit_id FROM visit ORDER BY random() LIMIT 2000")]
+        self.patient_count = conn.execute("SELECT COUNT(*) FROM patient").fetchone()[0]
+        conn.close()
+        self.patient_ids = {patient[2]: patient[0] for patient in self.patients}
+        if not (self.departments and self.doctors and self.patients):
+            raise ValueError('数据库中没有科室、医生或患者，请先用 bench.datagen 生成数据')
+        # 本次测试中登记的就诊，依次变更为已完成、缴费
+        self.waiting = deque()
+        self.completed = deque()
+        self.lock = threading.Lock()
+
+    def _patient(self):
+        return self.rng.choice(self.patients)
+
+    def _doctor(self):
+        return self.rng.choice(self.doctors)
+
+    def next_request(self, operation):
+        """返回 (接口名, 方法, 路径, 请求体)；当前无法执行的操作返回 None"""
+        rng = self.rng
+        if operation == 'departments':
+            return 'GET /api/departments', 'GET', '/api/departments', None
+        if operation == 'doctors_by_dept':
+            return 'GET /api/doctors', 'GET', f'/api/doctors?dept_id={rng.choice(self.departments)}', None
+        if operation == 'book':
+            doctor_id, dept_id = self._doctor()
+            patient = self._patient()
+            appt_date = (date.today() + timedelta(days=rng.randint(0, 7))).isoformat()
+            return 'POST /api/patient/appointment', 'POST', '/api/patient/appointment', {
+                'patient_name': patient[1], 'phone': patient[2], 'dept_id': dept_id,
+                'doctor_id': doctor_id if rng.random() < 0.7 else '',
+                'appt_date': appt_date, 'appt_time': f'{rng.choice((8, 9, 10, 11, 14, 15, 16))}:{rng.choice(("00", "30"))}',
+            }
+        if operation == 'my_appointments':
+            return 'GET /api/patient/appointments', 'GET', f'/api/patient/appointments?phone={self._patient()[2]}', None
+        if operation == 'queue':
+            status = rng.choice(('', '', '等待就诊', '已完成'))
+            path = f'/api/receptionist/visits?date={self.today}' + (f'&status={status}' if status else '')
+            return 'GET /api/receptionist/visits', 'GET', path, None
+        if operation == 'search_patient':
+            patient = self._patient()
+            keyword = rng.choice((patient[1], patient[1][0], patient[2], patient[2][:7], patient[3] or patient[2]))
+            return 'GET /api/receptionist/patients', 'GET', f'/api/receptionist/patients?keyword={keyword}', None
+        if operation == 'register':
+            doctor_id, dept_id = self._doctor()
+            patient = self._patient()
+            rooms = self.rooms.get(dept_id) or [1]
+            return 'POST /api/receptionist/register', 'POST', '/api/receptionist/register', {
+                'patient_name': patient[1], 'phone': patient[2], 'dept_id': dept_id,
+                'doctor_id': doctor_id, 'room_id': rng.choice(rooms),
+            }
+        if operation == 'visit_status':
+            with self.lock:
+                if not self.waiting:
+                    return None
+                visit_id, patient_id = self.waiting.popleft()
+                self.completed.append((visit_id, patient_id))
+            return ('POST /api/receptionist/visit/<id>/status', 'POST',
+                    f'/api/receptionist/visit/{visit_id}/status', {'status': '已完成'})
+        if operation == 'billing':
+            with self.lock:
+                if not self.completed:
+                    return None
+                visit_id, patient_id = self.completed.popleft()
+            total_fee = round(rng.lognormvariate(5, 0.8), 2)
+            return 'POST /api/receptionist/billing', 'POST', '/api/receptionist/billing', {
+                'visit_id': visit_id, 'patient_id': patient_id, 'total_fee': total_fee,
+                'insurance_fee': round(total_fee * 0.5, 2), 'payment_method': rng.choice(('现金', '微信', '医保卡')),
+            }
+        if operation == 'visit_info':
+            return ('GET /api/receptionist/visit_info', 'GET',
+                    f'/api/receptionist/visit_info?visit_id={rng.choice(self.visits)}', None)
+        if operation == 'patient_history':
+            return ('GET /api/receptionist/patient/<id>/visits', 'GET',
+                    f'/api/receptionist/patient/{self._patient()[0]}/visits', None)
+        if operation == 'dashboard':
+            return 'GET /api/admin/dashboard', 'GET', '/api/admin/dashboard', None
+        if operation == 'statistics':
+            stat_type = rng.choice(('daily', 'department', 'doctor'))
+            days = rng.choice((7, 30, 90))
+            start = (date.today() - timedelta(days=days)).isoformat()
+            return ('GET /api/admin/statistics', 'GET',
+                    f'/api/admin/statistics?type={stat_type}&start_date={start}&end_date={self.today}', None)
+        if operation == 'admin_patients':
+            keyword = rng.choice(('', '', self._patient()[1][0], self._patient()[2][:7]))
+            return 'GET /api/admin/patients', 'GET', f'/api/admin/patients?keyword={keyword}', None
+        if operation == 'schedules':
+            return 'GET /api/admin/schedules', 'GET', f'/api/admin/schedules?date={self.today}', None
+        raise ValueError(f'未知操作: {operation}')
+
+    def record_response(self, operation, request, response):
+        """登记成功后把就诊加入待处理队列，供后续的状态变更和缴费使用"""
+        if operation == 'register' and response.status == 200:
+            result = json.loads(response.body)
+            if result.get('success'):
+                patient_id = self.patient_ids.get(request[3]['phone'])
+                if patient_id is not None:
+                    with self.lock:
+                        self.waiting.append((result['visit_id'], patient_id))
+
+
+def parse_mix(text):
+    operations = []
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        role = role.strip()
+        if role not in ROLES:
+            raise ValueError(f'未知角色: {role}')
+        role_weight = float(weight or 1)
+        total = sum(w for _, w in ROLES[role])
+        operations += [(operation, role_weight * w / total) for operation, w in ROLES[role]]
+    return operations
+
+
+# ==================== 运行和统计 ====================
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.rejected = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, elapsed, status, success):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(elapsed)
+            if status >= 500:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            elif not success:
+                self.rejected[endpoint] = self.rejected.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            endpoints[endpoint] = {
+                'count': len(samples),
+                'throughput': round(len(samples) / duration, 2),
+                'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+                'max_ms': round(samples[-1] * 1000, 3),
+                'errors': self.errors.get(endpoint, 0),
+                'rejected': self.rejected.get(endpoint, 0),
+            }
+        all_samples = sorted(s for samples in self.samples.values() for s in samples)
+        total = {
+            'count': len(all_samples),
+            'throughput': round(len(all_samples) / duration, 2),
+            'p50_ms': round(percentile(all_samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(all_samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(all_samples, 0.99) * 1000, 3),
+            'errors': sum(self.errors.values()),
+            'rejected': sum(self.rejected.values()),
+        }
+        return endpoints, total
+
+
+def _worker(transport, scenario, operations, recorder, deadline, remaining, seed):
+    rng = random.Random(seed)
+    request = transport.client()
+    names = [operation for operation, _ in operations]
+    weights = [weight for _, weight in operations]
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            with remaining['lock']:
+                if remaining['count'] <= 0:
+                    return
+                remaining['count'] -= 1
+        operation = rng.choices(names, weights)[0]
+        planned = scenario.next_request(operation)
+        if planned is None:
+            continue
+        endpoint, method, path, body = planned
+        start = time.perf_counter()
+        try:
+            response = request(method, path, body)
+        except Exception:
+            recorder.add(endpoint, time.perf_counter() - start, 599, False)
+            continue
+        elapsed = time.perf_counter() - start
+        success = True
+        if response.status == 200 and response.body[:1] == b'{':
+            success = bool(json.loads(response.body).get('success', True))
+        recorder.add(endpoint, elapsed, response.status, success and response.status < 400)
+        scenario.record_response(operation, planned, response)
+
+
+def run(transport, scenario, operations, threads, duration, requests=None, seed=1):
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    remaining = {'count': requests, 'lock': threading.Lock()} if requests else None
+    workers = [threading.Thread(target=_worker, args=(transport, scenario, operations, recorder,
+                                                      deadline, remaining, seed + i))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return recorder.summary(time.perf_counter() - start)
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """返回比基线慢的接口列表 [(接口, 基线p95, 本次p95)]"""
+    regressions = []
+    for endpoint, stats in result['endpoints'].items():
+        base = baseline['endpoints'].get(endpoint)
+        if not base:
+            continue
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance) and stats['p95_ms'] - base['p95_ms'] >= MIN_REGRESSION_MS:
+            regressions.append((endpoint, base['p95_ms'], stats['p95_ms']))
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(endpoints, total):
+    print(f"{'接口':<46}{'次数':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'错误':>6}{'拒绝':>6}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:<48}{stats['count']:>7}{stats['throughput']:>9.1f}"
+              f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['errors']:>6}{stats['rejected']:>6}")
+    print('-' * 100)
+    print(f"{'合计':<46}{total['count']:>7}{total['throughput']:>9.1f}"
+          f"{total['p50_ms']:>9.2f}{total['p95_ms']:>9.2f}{total['p99_ms']:>9.2f}"
+          f"{total['errors']:>6}{total['rejected']:>6}")
+    print("（延迟单位 ms；拒绝 = 返回 success: false，如号源已满）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口负载测试')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--url', help='已启动服务的地址；不指定时在进程内调用 app.py')
+    parser.add_argument('--duration', type=float, default=30, help='测试时长（秒）')
+    parser.add_argument('--requests', type=int, help='请求总数（达到后提前结束）')
+    parser.add_argument('--threads', type=int, default=8, help='并发线程数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='角色请求比例')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--save', help='把结果保存为 JSON 基线')
+    parser.add_argument('--compare', help='与 JSON 基线对比')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='p95 允许变慢的比例')
+    args = parser.parse_args()
+
+    operations = parse_mix(args.mix)
+    workdir = None
+    db_file = args.db
+    if args.url:
+        transport = HttpTransport(args.url)
+    else:
+        workdir = tempfile.mkdtemp()
+        db_file = os.path.join(workdir, 'workload.db')
+        shutil.copy(args.db, db_file)
+        transport = TestClientTransport(db_file)
+    scenario = Scenario(db_file, random.Random(args.seed))
+
+    print(f"{'服务 ' + args.url if args.url else '进程内 test client'}，{args.threads} 个线程，"
+          f"{args.duration:.0f} 秒，请求比例 {args.mix}")
+    endpoints, total = run(transport, scenario, operations, args.threads, args.duration, args.requests, args.seed)
+    print_report(endpoints, total)
+
+    result = {
+        'meta': {
+            'db': os.path.basename(args.db),
+            'patients': scenario.patient_count,
+            'mode': 'http' if args.url else 'test_client',
+            'threads': args.threads,
+            'duration': args.duration,
+            'mix': args.mix,
+            'revision': _git_revision(),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'total': total,
+        'endpoints': endpoints,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 结果已保存到 {args.save}")
+
+    failed = total['errors'] > 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        print(f"\n与基线 {args.compare}（{baseline['meta'].get('revision')}）对比:")
+        if regressions:
+            failed = True
+            for endpoint, before, after in regressions:
+                print(f"  ✗ {endpoint}: p95 {before:.2f}ms -> {after:.2f}ms")
+        else:
+            print(f"  ✓ 没有接口的 p95 变慢超过 {args.tolerance:.0%}")
+
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+多进程写入对比：各进程直接写库 vs 单写进程（writes.py）
+
+在数据库的临时副本上，用多个进程（每个进程多个线程）持续执行"到院登记 + 缴费"
+两个写操作，分别测试：
+
+- direct：每个进程在自己的连接上开 BEGIN IMMEDIATE 事务，进程之间争抢写锁
+- writer：写操作都发给单写进程，由它合并成批、每批只提交一次
+
+    python -m bench.write_path --db bench.db [--processes 1,2,4,8] [--threads 4]
+                               [--duration 10] [--busy-timeout 5000]
+
+输出每种方式在不同进程数下的写操作吞吐量、延迟和因数据库锁失败的次数。
+"""
+
+import argparse
+import multiprocessing
+import os
+import secrets
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import db
+import writes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRITER_ADDRESS = '127.0.0.1:5199'
+
+
+def _visit_and_bill(worker, index):
+    phone = f'17{worker:03d}{index:06d}'
+    visit = writes.submit('register_visit', {
+        'patient_name': f'压测{worker}-{index}', 'phone': phone, 'dept_id': 1, 'room_id': 1,
+    })
+    writes.submit('create_billing', {
+        'visit_id': visit['visit_id'], 'patient_id': visit['patient_id'],
+        'total_fee': 50, 'insurance_fee': 20, 'payment_method': '现金',
+    })
+
+
+def _run_process(worker, db_file, writer, threads, duration, busy_timeout):
+    db.configure(db_file, pool_size=threads)
+    writes.configure_writer(writer)
+    if writer is None:
+        # 连接在池中复用，预先设置好每个连接的 busy_timeout
+        conns = [db.get_pool().acquire() for _ in range(threads)]
+        for conn in conns:
+            conn.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+        for conn in conns:
+            db.get_pool().release(conn)
+
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop(thread):
+        index = 0
+        while time.perf_counter() < deadline:
+            index += 1
+            start = time.perf_counter()
+            try:
+                _visit_and_bill(worker * 100 + thread, index)
+                result = None
+            except sqlite3.OperationalError as e:
+                result = 'busy' if db.is_busy_error(e) else str(e)
+            except Exception as e:
+                result = str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if result is None:
+                    latencies.append(elapsed)
+                else:
+                    errors[result] = errors.get(result, 0) + 1
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    db.get_pool().close_all()
+    return latencies, errors
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(mode, args, processes):
+    workdir = tempfile.mkdtemp()
+    db_file = os.path.join(workdir, 'write_path.db')
+    shutil.copy(args.db, db_file)
+    writer = None
+    try:
+        if mode == 'writer':
+            # 写进程和压测进程从环境变量继承同一个认证密钥
+            os.environ.setdefault(writes.WRITER_KEY_ENV, secrets.token_hex(32))
+            writer = subprocess.Popen([sys.executable, 'writes.py', '--db', db_file, '--address', WRITER_ADDRESS],
+                                      cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            if not writes.wait_for_writer(writes.parse_address(WRITER_ADDRESS)):
+                raise RuntimeError('写进程启动失败')
+        tasks = [(i, db_file, WRITER_ADDRESS if writer else None, args.threads, args.duration, args.busy_timeout)
+                 for i in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(_run_process, tasks)
+    finally:
+        batches = None
+        if writer is not None:
+            writer.terminate()
+            output = writer.communicate(timeout=15)[0].strip().splitlines()
+            batches = output[-1] if output else None
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [latency for result in results for latency in result[0]]
+    errors = {}
+    for _, process_errors in results:
+        for key, count in process_errors.items():
+            errors[key] = errors.get(key, 0) + count
+    # 每次循环是两个写操作
+    return {
+        'throughput': len(latencies) * 2 / args.duration,
+        'p50_ms': _percentile(latencies, 0.5) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'busy': errors.pop('busy', 0),
+        'errors': errors,
+        'writer': batches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程直接写库与单写进程吞吐量对比')
+    parser.add_argument('--db', required=True, help='测试数据库（bench.datagen 生成）')
+    parser.add_argument('--processes', default='1,2,4,8', help='逗号分隔的进程数')
+    parser.add_argument('--threads', type=int, default=4, help='每个进程的线程数')
+    parser.add_argument('--duration', type=float, default=10, help='每轮压测时长（秒）')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='direct 方式的 SQLite busy_timeout（毫秒）')
+    args = parser.parse_args()
+
+    print(f"每个进程 {args.threads} 个线程，每轮 {args.duration:.0f} 秒，CPU 核数 {os.cpu_count()}")
+    print(f"\n{'方式':<8}{'进程数':>6}{'写/秒':>10}{'p50':>9}{'p99':>9}{'锁失败':>8}")
+    failed = False
+    for processes in [int(n) for n in args.processes.split(',')]:
+        for mode in ('direct', 'writer'):
+            result = measure(mode, args, processes)
+            print(f"{mode:<10}{processes:>6}{result['throughput']:>10.0f}{result['p50_ms']:>9.2f}"
+                  f"{result['p99_ms']:>9.2f}{result['busy']:>8}")
+            if result['errors']:
+                failed = True
+                print(f"  其他错误: {result['errors']}")
+            if result['writer']:
+                print(f"  {result['writer']}")
+    print("\n写/秒为每秒完成的写操作数（每次循环登记 + 缴费两个写操作），延迟单位 ms，为一次循环的耗时")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+预约挂号
+
+预约占用医生排班 doctor_schedule 的号源：
+
+- 指定医生时，占用该医生在预约时间所在时段的排班
+- 未指定医生时，在本科室预约时间所在时段的排班中选剩余号源最多的一个；
+  科室当天没有任何排班时按原方式登记预约，不占用号源
+
+占号是一条带条件的 UPDATE（current_patients < max_patients），与插入预约记录
+在同一个 BEGIN IMMEDIATE 事务中执行，并发预约不会超出 max_patients。
+MySQL 没有 UPDATE ... RETURNING，先用 SELECT ... FOR UPDATE 锁住选中的排班再加一。
+取消预约时归还号源。
+"""
+
+from backends import dialect
+from db import WriteError, write_transaction
+
+
+class BookingError(WriteError):
+    """预约失败，消息直接返回给前端"""
+
+
+# 占用一个号源，返回排班编号和医生；号源已满时不更新任何行
+# MySQL 只选出并锁住排班，由 _reserve 再加一
+_RESERVE_DOCTOR_SQL = {
+    'sqlite': """
+        UPDATE doctor_schedule
+        SET current_patients = current_patients + 1
+        WHERE schedule_id = (
+            SELECT schedule_id FROM doctor_schedule
+            WHERE doctor_id = ? AND work_date = ?
+              AND start_time <= ? AND end_time > ?
+              AND current_patients < max_patients
+            ORDER BY start_time DESC
+            LIMIT 1
+        )
+        RETURNING schedule_id, doctor_id
+    """,
+    'mysql': """
+        SELECT schedule_id, doctor_id FROM doctor_schedule
+        WHERE doctor_id = ? AND work_date = ?
+          AND start_time <= ? AND end_time > ?
+          AND current_patients < max_patients
+        ORDER BY start_time DESC
+        LIMIT 1
+        FOR UPDATE
+    """,
+}
+
+_RESERVE_DEPT_SQL = {
+    'sqlite': """
+        UPDATE doctor_schedule
+        SET current_patients = current_patients + 1
+        WHERE schedule_id = (
+            SELECT ds.schedule_id FROM doctor_schedule ds
+            JOIN clinic_room cr ON ds.room_id = cr.room_id
+            WHERE cr.dept_id = ? AND ds.work_date = ?
+              AND ds.start_time <= ? AND ds.end_time > ?
+              AND ds.current_patients < ds.max_patients
+            ORDER BY ds.max_patients - ds.current_patients DESC, ds.schedule_id
+            LIMIT 1
+        )
+        RETURNING schedule_id, doctor_id
+    """,
+    'mysql': """
+        SELECT ds.schedule_id, ds.doctor_id FROM doctor_schedule ds
+        JOIN clinic_room cr ON ds.room_id = cr.room_id
+        WHERE cr.dept_id = ? AND ds.work_date = ?
+          AND ds.start_time <= ? AND ds.end_time > ?
+          AND ds.current_patients < ds.max_patients
+        ORDER BY ds.max_patients - ds.current_patients DESC, ds.schedule_id
+        LIMIT 1
+        FOR UPDATE
+    """,
+}
+
+
+def _reserve(cursor, sql, params):
+    cursor.execute(sql[dialect(cursor)], params)
+    reserved = cursor.fetchone()
+    if reserved and dialect(cursor) == 'mysql':
+        cursor.execute("""
+            UPDATE doctor_schedule SET current_patients = current_patients + 1
+            WHERE schedule_id = ?
+        """, (reserved[0],))
+    return reserved
+
+
+def _normalize_time(value):
+    # 页面上的 <input type="time"> 提交 HH:MM，排班表存的是 HH:MM:SS
+    return value + ':00' if len(value) == 5 else value
+
+
+def _find_schedules(cursor, dept_id, doctor_id, work_date, appt_time=None):
+    """是否有符合条件的排班（不论号源是否已满）；appt_time 为空时只看日期"""
+    if doctor_id:
+        query = "SELECT 1 FROM doctor_schedule ds WHERE ds.doctor_id = ? AND ds.work_date = ?"
+        params = [doctor_id, work_date]
+    else:
+        query = """
+            SELECT 1 FROM doctor_schedule ds
+            JOIN clinic_room cr ON ds.room_id = cr.room_id
+            WHERE cr.dept_id = ? AND ds.work_date = ?
+        """
+        params = [dept_id, work_date]
+    if appt_time:
+        query += " AND ds.start_time <= ? AND ds.end_time > ?"
+        params += [appt_time, appt_time]
+    cursor.execute(query + " LIMIT 1", params)
+    return cursor.fetchone() is not None
+
+
+def book(cursor, data):
+    """在当前事务中占号并写入预约，返回 {'appt_id', 'schedule_id', 'doctor_id'}
+
+    必须在 BEGIN IMMEDIATE 事务中调用（见 create_appointment）。
+    """
+    dept_id = data['dept_id']
+    doctor_id = data.get('doctor_id') or None
+    appt_date = data['appt_date']
+    appt_time = _normalize_time(data['appt_time'])
+
+    if doctor_id:
+        reserved = _reserve(cursor, _RESERVE_DOCTOR_SQL, (doctor_id, appt_date, appt_time, appt_time))
+    else:
+        reserved = _reserve(cursor, _RESERVE_DEPT_SQL, (dept_id, appt_date, appt_time, appt_time))
+
+    if reserved:
+        schedule_id, doctor_id = reserved[0], reserved[1]
+    elif _find_schedules(cursor, dept_id, doctor_id, appt_date, appt_time):
+        raise BookingError('所选时段号源已满，请选择其他时间')
+    elif _find_schedules(cursor, dept_id, doctor_id, appt_date):
+        raise BookingError('所选时间不在出诊时段内，请选择其他时间')
+    elif doctor_id:
+        raise BookingError('该医生所选日期没有排班')
+    else:
+        schedule_id = None
+
+    cursor.execute("""
+        INSERT INTO appointment (patient_name, phone, dept_id, doctor_id, schedule_id, appt_date, appt_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, '待到院')
+    """, (
+        data['patient_name'],
+        data['phone'],
+        dept_id,
+        doctor_id,
+        schedule_id,
+        appt_date,
+        appt_time
+    ))
+    return {'appt_id': cursor.lastrowid, 'schedule_id': schedule_id, 'doctor_id': doctor_id}
+
+
+def cancel(cursor, appt_id, phone):
+    """在当前事务中取消待到院的预约并归还号源，phone 须与预约时登记的手机号一致"""
+    if not phone:
+        raise BookingError('请填写预约时登记的手机号')
+    params = [appt_id, phone]
+    condition = " WHERE appt_id = ? AND status = '待到院' AND phone = ?"
+    if dialect(cursor) == 'mysql':
+        cursor.execute("SELECT schedule_id FROM appointment" + condition + " FOR UPDATE", params)
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.execute("UPDATE appointment SET status = '已取消' WHERE appt_id = ?", (appt_id,))
+    else:
+        cursor.execute("UPDATE appointment SET status = '已取消'" + condition + " RETURNING schedule_id", params)
+        row = cursor.fetchone()
+    if row is None:
+        raise BookingError('预约不存在或已不能取消')
+    if row[0] is not None:
+        cursor.execute("""
+            UPDATE doctor_schedule SET current_patients = current_patients - 1
+            WHERE schedule_id = ? AND current_patients > 0
+        """, (row[0],))
+    return row[0]
+
+
+def create_appointment(conn, data):
+    return write_transaction(conn, lambda cursor: book(cursor, data))
+
+
+def cancel_appointment(conn, appt_id, phone):
+    return write_transaction(conn, lambda cursor: cancel(cursor, appt_id, phone))
+
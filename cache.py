@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+参考数据缓存
+
+科室、医生、诊室、员工、排班这类很少变化的数据，接口响应直接缓存在进程内存中：
+
+- 每条缓存记录依赖若干张表，写入这些表的接口调用 invalidate() 提升表版本号，
+  依赖该表的缓存随即失效
+- 缓存记录超过 TTL 后重新查询，用来兜底其他进程或脚本对数据库的修改
+- 响应带 ETag / Last-Modified，浏览器用 If-None-Match 重新验证时返回无响应体的 304
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import wraps
+
+from flask import Response, request
+
+from db import utc_today
+
+# 缓存有效期（秒）
+DEFAULT_TTL = 300
+
+# 最多缓存的响应数（不同查询参数各占一条）
+MAX_ENTRIES = 256
+
+
+class _Entry:
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', 'versions', 'expires_at')
+
+    def __init__(self, body, mimetype, versions, ttl):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = time.time()
+        self.versions = versions
+        self.expires_at = time.monotonic() + ttl
+
+
+class ReferenceCache:
+    """带TTL和表版本号失效的响应缓存"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def _snapshot(self, tables):
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def get(self, key, tables):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.versions == self._snapshot(tables) \
+                    and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, tables, body, mimetype, versions):
+        """versions 为查询数据库之前取得的版本快照，查询期间发生的写入不会被缓存"""
+        entry = _Entry(body, mimetype, versions, self.ttl)
+        with self._lock:
+            if versions != self._snapshot(tables):
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def versions(self, tables):
+        with self._lock:
+            return self._snapshot(tables)
+
+    def invalidate(self, *tables):
+        """写入表后调用，依赖这些表的缓存全部失效"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self.invalidations += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'not_modified': self.not_modified,
+                'invalidations': self.invalidations,
+                'table_versions': dict(self._versions),
+            }
+
+
+reference_cache = ReferenceCache()
+
+
+def _not_modified(entry):
+    if request.if_none_match:
+        return request.if_none_match.contains(entry.etag)
+    since = request.if_modified_since
+    return since is not None and int(entry.last_modified) <= since.timestamp()
+
+
+def _conditional_response(entry):
+    if _not_modified(entry):
+        reference_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.headers['Last-Modified'] = formatdate(entry.last_modified, usegmt=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def cached_response(*tables):
+    """缓存接口的JSON响应，tables 为响应所依赖的表
+
+    只缓存 success 为真的响应；缓存键包含查询参数。
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # 部分接口的日期参数默认取当天（UTC，与数据库一致），键中带上日期避免跨天后仍返回前一天的缓存
+            key = (f.__name__, request.full_path, utc_today())
+            entry = reference_cache.get(key, tables)
+            if entry is None:
+                versions = reference_cache.versions(tables)
+                response = f(*args, **kwargs)
+                if response.status_code != 200 or not (response.get_json(silent=True) or {}).get('success'):
+                    return response
+                entry = reference_cache.put(key, tables, response.get_data(), response.mimetype, versions)
+            return _conditional_response(entry)
+        return decorated_function
+    return decorator
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+取消预约检查
+
+在 hospital.db 的临时副本上给一个排班预约一个号，然后调用
+/api/patient/appointment/<id>/cancel：
+
+- 请求体没有手机号、手机号为空、手机号不对时拒绝，预约仍是待到院，号源不归还
+- 手机号与预约时登记的一致时取消成功，号源归还；再次取消时拒绝
+
+    python check_appointments.py [数据库文件]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import db
+
+APPT_DATE = '2099-03-01'
+PHONE = '13900000001'
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else 'hospital.db'
+    workdir = tempfile.mkdtemp()
+    db_copy = os.path.join(workdir, 'hospital.db')
+    shutil.copy(source, db_copy)
+    db.configure(db_copy)
+
+    from app import app
+    client = app.test_client()
+
+    print("=" * 80)
+    print("取消预约检查")
+    print("=" * 80)
+
+    with db.get_db() as conn:
+        doctor_id, dept_id, room_id = conn.execute("""
+            SELECT e.emp_id, e.dept_id, MIN(cr.room_id)
+            FROM employee e
+            JOIN clinic_room cr ON cr.dept_id = e.dept_id
+            WHERE e.emp_type = '医生'
+            GROUP BY e.emp_id
+            ORDER BY e.emp_id
+        """).fetchone()
+        schedule_id = conn.execute("""
+            INSERT INTO doctor_schedule (doctor_id, room_id, work_date, start_time, end_time, max_patients)
+            VALUES (?, ?, ?, '08:00:00', '12:00:00', 5)
+        """, (doctor_id, room_id, APPT_DATE)).lastrowid
+        conn.commit()
+
+    def state(appt_id):
+        with db.get_db() as conn:
+            status = conn.execute("SELECT status FROM appointment WHERE appt_id = ?", (appt_id,)).fetchone()[0]
+            booked = conn.execute("SELECT current_patients FROM doctor_schedule WHERE schedule_id = ?",
+                                  (schedule_id,)).fetchone()[0]
+        return status, booked
+
+    result = client.post('/api/patient/appointment', json={
+        'patient_name': '取消检查', 'phone': PHONE, 'dept_id': dept_id, 'doctor_id': doctor_id,
+        'appt_date': APPT_DATE, 'appt_time': '09:00',
+    }).get_json()
+    if not result.get('success'):
+        print(f"✗ 预约失败：{result.get('message')}")
+        sys.exit(1)
+    appt_id = result['appt_id']
+    print(f"预约 {appt_id}：{state(appt_id)}")
+
+    failures = 0
+    cases = [
+        ('没有请求体', None, False, ('待到院', 1)),
+        ('没有手机号', {}, False, ('待到院', 1)),
+        ('手机号为空', {'phone': ''}, False, ('待到院', 1)),
+        ('手机号不对', {'phone': '13900000002'}, False, ('待到院', 1)),
+        ('手机号正确', {'phone': PHONE}, True, ('已取消', 0)),
+        ('再次取消', {'phone': PHONE}, False, ('已取消', 0)),
+    ]
+    for label, body, success, expected in cases:
+        url = f'/api/patient/appointment/{appt_id}/cancel'
+        response = client.post(url, json=body) if body is not None else client.post(url)
+        result = response.get_json()
+        actual = state(appt_id)
+        if result.get('success') == success and actual == expected:
+            print(f"✓ {label}: {result.get('message')}，{actual}")
+        else:
+            failures += 1
+            print(f"✗ {label}: {result}，预约和号源 {actual}，应为 {expected}")
+
+    db.get_pool().close_all()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 80)
+    if failures:
+        print(f"✗ {failures} 项检查失败")
+        sys.exit(1)
+    print("✓ 只有登记的手机号能取消预约")
+
+
+if __name__ == '__main__':
+    main()
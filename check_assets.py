@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+页面构建检查
+
+assets.py 构建时去掉页面和 JS 的缩进、空行和整行注释，检查构建结果与模板行为一致：
+
+- 样例页面：模板字符串中缩进的行和 // 开头的行、含 // 和引号的字符串和正则、
+  <pre>/<textarea> 的内容。用 node 分别执行模板中的 JS 和构建后的 JS，比较结果；
+  构建后的页面中 <pre>/<textarea> 的内容与模板相同
+- templates/ 下的全部页面：构建后的 JS 能被 node 解析，在模拟的浏览器环境中
+  执行后定义的全局函数（名称和参数个数）与模板中的 JS（连同引用的 static/ 脚本）相同
+- 修改页面引用的 static/ 文件后，构建好的页面不再使用，改为渲染模板
+
+需要 node（没有时只检查 <pre>/<textarea>）。
+
+    python check_assets.py
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import assets
+
+SAMPLE_PAGE = r'''<!DOCTYPE html>
+<html>
+<body>
+    <pre>
+    缩进的
+        预格式文本
+    </pre>
+    <textarea>
+  第一行
+
+  // 第三行</textarea>
+    <script>
+        // 整行注释，don't
+        const rows = [{name: '张三', fee: 12.5}, {name: '李四', fee: 3}];
+        const table = `<table>
+            ${rows.map(row => `<tr>
+                // 模板字符串中的这一行不是注释
+                <td>${row.name}</td><td>${row.fee / 2}</td>
+            </tr>`).join('')}
+        </table>`;
+        const url = "http://example.com//path";   // 行尾注释
+        const quote = /['"`]/g;
+        const slashes = '\\//'.replace(/\/\//g, '-');
+        const half = rows.length / 2 / 1;
+        /* 块注释
+           // 中的行 */
+        function describe(value) {
+            return typeof value + ':' + String(value).replace(quote, '_');
+        }
+        result = {table, url, slashes, half, quoted: describe(`a"b'c`), lines: `
+            第一行
+            // 第二行
+        `.split('\n')};
+    </script>
+</body>
+</html>
+'''
+
+# 在 node 中执行页面 JS：浏览器对象用可以任意访问、调用的代理代替
+NODE_RUNNER = r'''
+const vm = require('vm');
+const fs = require('fs');
+const stub = new Proxy(function () {}, {
+    get: (target, key) => key === Symbol.toPrimitive ? () => '' : key === 'then' ? undefined : stub,
+    set: () => true,
+    apply: () => stub,
+    construct: () => stub,
+});
+const output = {};
+for (const [label, path] of Object.entries(JSON.parse(process.argv[1]))) {
+    const context = {result: null, console};
+    for (const name of ['document', 'window', 'localStorage', 'sessionStorage', 'location', 'navigator',
+                        'history', 'fetch', 'alert', 'confirm', 'EventSource', 'setTimeout', 'setInterval',
+                        'clearTimeout', 'clearInterval', 'URLSearchParams', 'FormData']) {
+        context[name] = stub;
+    }
+    const before = new Set(Object.keys(vm.createContext(context)));
+    try {
+        new vm.Script(fs.readFileSync(path, 'utf8'), {filename: path}).runInContext(context);
+    } catch (e) {
+        output[label] = {error: String(e)};
+        continue;
+    }
+    const functions = {};
+    for (const name of Object.keys(context)) {
+        if (!before.has(name) && typeof context[name] === 'function') {
+            functions[name] = context[name].length;
+        }
+    }
+    output[label] = {result: context.result, functions};
+}
+console.log(JSON.stringify(output));
+'''
+
+_PRESERVED_RE = re.compile(r'<(pre|textarea)>.*?</\1>', re.S)
+
+
+def run_node(scripts):
+    """在 node 中分别执行 {名称: 文件}，返回 {名称: {result, functions} 或 {error}}"""
+    completed = subprocess.run(['node', '-e', NODE_RUNNER, json.dumps(scripts)],
+                               capture_output=True, text=True, encoding='utf-8', timeout=60)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip())
+    return json.loads(completed.stdout)
+
+
+def source_script(source, static_dir):
+    """页面引用的 static/ 脚本和内联脚本，按页面中的顺序"""
+    parts = []
+    for match in assets._STATIC_SCRIPT_RE.finditer(source):
+        with open(os.path.join(static_dir, match.group(1)), encoding='utf-8') as f:
+            parts.append(f.read())
+    parts += [match.group(1) for match in assets._SCRIPT_RE.finditer(source)]
+    return '\n'.join(parts)
+
+
+def built_script(build_dir, names):
+    parts = []
+    for name in names:
+        if name.endswith('.js'):
+            with open(os.path.join(build_dir, 'assets', name), encoding='utf-8') as f:
+                parts.append(f.read())
+    return '\n'.join(parts)
+
+
+def main():
+    node = shutil.which('node') is not None
+    workdir = tempfile.mkdtemp()
+    failures = 0
+
+    print("=" * 80)
+    print("页面构建检查")
+    print("=" * 80)
+
+    def check(ok, message):
+        nonlocal failures
+        if not ok:
+            failures += 1
+        print(f"{'✓' if ok else '✗'} {message}")
+
+    try:
+        template_dir = os.path.join(workdir, 'templates')
+        static_dir = os.path.join(workdir, 'static')
+        build_dir = os.path.join(workdir, 'build')
+        os.makedirs(template_dir)
+        shutil.copytree(assets.STATIC_DIR, static_dir)
+        with open(os.path.join(template_dir, 'sample.html'), 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_PAGE)
+        pages = ('sample.html',) + assets.PAGES
+        for template in assets.PAGES:
+            shutil.copy(os.path.join(assets.TEMPLATE_DIR, template), template_dir)
+        manifest = assets.build(build_dir, template_dir, pages, static_dir)
+
+        with open(os.path.join(build_dir, 'pages', 'sample.html'), encoding='utf-8') as f:
+            built_page = f.read()
+        preserved = [match.group() for match in _PRESERVED_RE.finditer(built_page)]
+        check(len(preserved) == 2 and preserved == [match.group() for match in _PRESERVED_RE.finditer(SAMPLE_PAGE)],
+              "样例页面: <pre>/<textarea> 内容不变")
+
+        store = assets.PrebuiltStore(build_dir, template_dir, static_dir)
+        for template in assets.PAGES:
+            with open(os.path.join(template_dir, template), encoding='utf-8') as f:
+                static_names = [match.group(1) for match in assets._STATIC_SCRIPT_RE.finditer(f.read())]
+            if not static_names:
+                continue
+            fresh = store.page(template) is not None
+            with open(os.path.join(static_dir, static_names[0]), 'a', encoding='utf-8') as f:
+                f.write('\n// 修改\n')
+            stale = store.page(template) is None
+            shutil.copy(os.path.join(assets.STATIC_DIR, static_names[0]), static_dir)
+            check(fresh and stale and store.page(template) is not None,
+                  f"{template}: 修改 static/{static_names[0]} 后不再使用构建好的页面")
+
+        if not node:
+            print("没有找到 node，跳过 JS 执行检查")
+            return
+
+        scripts = {}
+        for template in pages:
+            with open(os.path.join(template_dir, template), encoding='utf-8') as f:
+                source = source_script(f.read(), static_dir)
+            built = built_script(build_dir, manifest['pages'][template]['assets'])
+            if not source:
+                continue
+            for kind, script in (('source', source), ('built', built)):
+                path = os.path.join(workdir, f'{template}.{kind}.js')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(script)
+                scripts[f'{template}:{kind}'] = path
+
+        results = run_node(scripts)
+        sample_source, sample_built = results['sample.html:source'], results['sample.html:built']
+        check(sample_source.get('result') is not None and sample_source == sample_built,
+              f"样例页面: 执行结果相同 {json.dumps(sample_built, ensure_ascii=False)[:100]}")
+        for template in assets.PAGES:
+            if f'{template}:source' not in results:
+                continue
+            source, built = results[f'{template}:source'], results[f'{template}:built']
+            if 'error' in source:
+                check(False, f"{template}: 模板中的 JS 无法执行 {source['error']}")
+            elif 'error' in built:
+                check(False, f"{template}: 构建后的 JS 无法执行 {built['error']}")
+            else:
+                check(source['functions'] == built['functions'],
+                      f"{template}: {len(built['functions'])} 个全局函数相同")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        print("=" * 80)
+        if failures:
+            print(f"✗ {failures} 项检查失败")
+            sys.exit(1)
+        print("✓ 构建后的页面与模板一致")
+
+
+if __name__ == '__main__':
+    main()
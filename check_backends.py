@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL 语句转换检查
+
+业务代码按 sqlite3 的写法使用 ? 占位符，MySQL 后端执行前用 backends.translate()
+转成 pymysql 的 %s。pymysql 用 % 把参数格式化进整条语句，检查字符串、标识符、
+注释中的 ? 和 % 在格式化之后保持原样，只有真正的占位符被替换成参数。
+不需要 MySQL 服务器和 pymysql。
+
+    python check_backends.py
+"""
+
+import sys
+
+from backends import translate
+
+# (sqlite3 写法, 参数, pymysql 格式化后的语句)
+CASES = [
+    ("SELECT * FROM patient WHERE phone = ?", ("'138'",),
+     "SELECT * FROM patient WHERE phone = '138'"),
+    ("SELECT * FROM patient WHERE patient_name LIKE ? || '%'", ("'王'",),
+     "SELECT * FROM patient WHERE patient_name LIKE '王' || '%'"),
+    ("SELECT '?', '50%' FROM t WHERE a = ?", ('1',),
+     "SELECT '?', '50%' FROM t WHERE a = 1"),
+    ("SELECT 'it''s ?' FROM t WHERE a = ? AND b = ?", ('1', '2'),
+     "SELECT 'it''s ?' FROM t WHERE a = 1 AND b = 2"),
+    ("SELECT 'a\\'?%' FROM t WHERE a = ?", ('1',),
+     "SELECT 'a\\'?%' FROM t WHERE a = 1"),
+    ("SELECT \"x?\", `y?` FROM t WHERE a = ?", ('1',),
+     "SELECT \"x?\", `y?` FROM t WHERE a = 1"),
+    ("SELECT a -- 是否?\nFROM t /* ? 100% */ WHERE a = ?", ('1',),
+     "SELECT a -- 是否?\nFROM t /* ? 100% */ WHERE a = 1"),
+    ("UPDATE t SET note = '?' WHERE id IN (?, ?)", ('1', '2'),
+     "UPDATE t SET note = '?' WHERE id IN (1, 2)"),
+]
+
+
+def main():
+    print("=" * 80)
+    print("MySQL 语句转换检查")
+    print("=" * 80)
+
+    failures = 0
+    for sql, params, expected in CASES:
+        translated = translate(sql)
+        try:
+            actual = translated % params
+        except (TypeError, ValueError) as e:
+            actual = f'格式化失败：{e}'
+        if actual == expected:
+            print(f"✓ {sql!r}")
+        else:
+            failures += 1
+            print(f"✗ {sql!r}")
+            print(f"    转换为 {translated!r}")
+            print(f"    格式化 {actual!r}，应为 {expected!r}")
+
+    print("=" * 80)
+    if failures:
+        print(f"✗ {failures} 条语句转换错误")
+        sys.exit(1)
+    print("✓ 全部语句转换正确")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+查询计划检查
+
+在 hospital.db 的临时副本上依次调用各个API，记录每个接口实际执行的SQL，
+再对每条SQL执行 EXPLAIN QUERY PLAN。只要有接口对持续增长的业务表做了
+全表扫描（SCAN），脚本就以非0状态退出。
+
+    python check_query_plans.py [数据库文件]
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import db
+
+# 随业务持续增长的表，不允许全表扫描
+GROWING_TABLES = {'patient', 'appointment', 'visit', 'billing', 'doctor_schedule', 'revenue_summary',
+                  'revenue_visit'}
+
+# 已知且暂时接受的扫描：(接口, 表)
+KNOWN_SCANS = set()
+
+# 需要检查的接口：(方法, 路径, 请求体)
+API_CALLS = [
+    ('GET', '/api/departments', None),
+    ('GET', '/api/doctors', None),
+    ('GET', '/api/doctors?dept_id=1', None),
+    ('GET', '/api/rooms?dept_id=1', None),
+    ('POST', '/api/patient/appointment', {
+        'patient_name': '计划检查', 'phone': '13900000000', 'dept_id': 1,
+        'appt_date': '2099-01-01', 'appt_time': '09:00'}),
+    ('GET', '/api/patient/appointments?phone=13900000000', None),
+    ('POST', '/api/receptionist/register', {
+        'patient_name': '计划检查', 'phone': '13900000000', 'dept_id': 1,
+        'room_id': 1, 'doctor_id': 1}),
+    ('GET', '/api/receptionist/patients', None),
+    ('GET', '/api/receptionist/patients?keyword=王', None),
+    ('GET', '/api/receptionist/patients?keyword=王建国', None),
+    ('GET', '/api/receptionist/patients?keyword=1380013', None),
+    ('GET', '/api/receptionist/patients?keyword=440100198001011234', None),
+    ('GET', '/api/receptionist/patient/1/visits', None),
+    ('GET', '/api/receptionist/visits', None),
+    ('GET', '/api/receptionist/visits?status=等待就诊', None),
+    ('GET', '/api/receptionist/visit_info?visit_id=1', None),
+    ('POST', '/api/receptionist/billing', {
+        'visit_id': 1, 'patient_id': 1, 'total_fee': 100,
+        'insurance_fee': 0, 'payment_method': '现金'}),
+    ('POST', '/api/receptionist/billing/1/refund', {}),
+    ('GET', '/api/admin/dashboard', None),
+    ('GET', '/api/admin/dashboard/breakdown', None),
+    ('GET', '/api/admin/statistics?type=daily&start_date=2026-01-01&end_date=2026-01-31', None),
+    ('GET', '/api/admin/statistics?type=department&start_date=2026-01-01&end_date=2026-01-31', None),
+    ('GET', '/api/admin/statistics?type=doctor&start_date=2026-01-01&end_date=2026-01-31', None),
+    ('GET', '/api/admin/patients?keyword=', None),
+    ('GET', '/api/admin/patients?keyword=138', None),
+    ('GET', '/api/admin/doctors', None),
+    ('POST', '/api/admin/schedule', {
+        'doctor_id': 1, 'room_id': 1, 'work_date': '2099-01-01',
+        'start_time': '08:00:00', 'end_time': '12:00:00'}),
+    ('GET', '/api/admin/schedules?date=2099-01-01', None),
+    # 分页接口：返回 next_cursor 时会接着检查下一页的查询
+    ('GET', '/api/patient/appointments?phone=13986754206&limit=1', None),
+    ('GET', '/api/receptionist/patients?limit=10', None),
+    ('GET', '/api/receptionist/patients?keyword=王&limit=1', None),
+    ('GET', '/api/receptionist/patient/23/visits?limit=5', None),
+    ('GET', '/api/receptionist/visits?date=2026-01-14&limit=20', None),
+    ('GET', '/api/receptionist/visits?date=2026-01-14&status=已离院&limit=20', None),
+    ('GET', '/api/admin/patients?keyword=&limit=10', None),
+    ('GET', '/api/admin/patients?keyword=138&limit=5', None),
+    ('GET', '/api/admin/employees?limit=5', None),
+    ('GET', '/api/receptionist/appointments?start_date=2026-01-01&end_date=2026-01-31&limit=5', None),
+    ('GET', '/api/receptionist/appointments?start_date=2026-01-20&dept_id=1&status=待到院&limit=1', None),
+    ('GET', '/api/receptionist/appointments?phone=13986754206&limit=1', None),
+]
+
+SKIP_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+                 'ATTACH', 'DETACH', 'CREATE TEMP VIEW', 'DROP VIEW')
+
+TABLE_ALIAS_RE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.I)
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'ON', 'ORDER', 'GROUP', 'LIMIT', 'SET', 'VALUES'}
+
+
+def table_aliases(sql):
+    """返回 {别名或表名: 表名}"""
+    aliases = {}
+    for table, alias in TABLE_ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def find_scans(conn, sql):
+    """返回SQL执行计划中被全表扫描的业务表"""
+    aliases = table_aliases(sql)
+    has_limit = re.search(r'\bLIMIT\b', sql, re.I) is not None
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        detail = row[3]
+        # 归档视图展开后的表带库名，如 main.visit、arch_2025.visit
+        match = re.match(r'SCAN (?:\w+\.)?(\w+)', detail)
+        if not match:
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if table not in GROWING_TABLES:
+            continue
+        # 按索引顺序读取并带LIMIT的Top-N查询只会读取少量行
+        if 'USING' in detail and 'INDEX' in detail and has_limit:
+            continue
+        scans.append((table, detail))
+    return scans
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else 'hospital.db'
+    workdir = tempfile.mkdtemp()
+    db_copy = os.path.join(workdir, 'hospital.db')
+    shutil.copy(source, db_copy)
+
+    # 连接池只保留1个连接，所有接口的SQL都经过同一个trace回调
+    db.configure(db_copy, pool_size=1)
+    statements = []
+    with db.get_db() as conn:
+        conn.set_trace_callback(statements.append)
+
+    from app import app
+    client = app.test_client()
+
+    print("=" * 80)
+    print("查询计划检查")
+    print("=" * 80)
+
+    failures = 0
+    calls = list(API_CALLS)
+    while calls:
+        method, path, body = calls.pop(0)
+        del statements[:]
+        if method == 'GET':
+            response = client.get(path)
+        else:
+            response = client.post(path, json=body)
+        result = response.get_json() or {}
+        if not result.get('success'):
+            print(f"✗ {method} {path}: 接口调用失败 {result.get('message', '')}")
+            failures += 1
+            continue
+        if result.get('next_cursor') and 'cursor=' not in path:
+            separator = '&' if '?' in path else '?'
+            calls.insert(0, (method, f"{path}{separator}cursor={result['next_cursor']}", body))
+
+        with db.get_db() as conn:
+            conn.set_trace_callback(None)
+            problems = []
+            for sql in dict.fromkeys(statements):
+                # 以 "--" 开头的是SQLite内部（触发器、FTS）执行的语句，跳过
+                if sql.lstrip().upper().startswith(SKIP_PREFIXES) or sql.lstrip().startswith('--') \
+                        or sql.strip() == 'SELECT 1':
+                    continue
+                for table, detail in find_scans(conn, sql):
+                    problems.append((table, detail, sql))
+            conn.set_trace_callback(statements.append)
+
+        known = [p for p in problems if (path, p[0]) in KNOWN_SCANS]
+        unexpected = [p for p in problems if (path, p[0]) not in KNOWN_SCANS]
+        if unexpected:
+            failures += 1
+            print(f"✗ {method} {path}")
+            for table, detail, sql in unexpected:
+                print(f"    {detail}")
+                print(f"      {' '.join(sql.split())}")
+        elif known:
+            print(f"○ {method} {path} (已知扫描: {', '.join(sorted({p[0] for p in known}))})")
+        else:
+            print(f"✓ {method} {path}")
+
+    db.get_pool().close_all()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 80)
+    if failures:
+        print(f"✗ {failures} 个接口存在全表扫描或调用失败")
+        sys.exit(1)
+    print("✓ 所有接口查询均使用索引")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+收入统计检查
+
+在 hospital.db 的临时副本上构造几种汇总表容易算错的情况，每一步之后把
+/api/admin/statistics 的三种统计与直接从账单计算的结果（按就诊去重人次）比较，
+并用 summary.py 核对 revenue_summary、revenue_visit 与原始数据；安装了 numpy 和
+pyarrow 时再导出列式文件，用 analytics.check 核对多维统计的人次和收入：
+
+- 同一次就诊的账单在两天分别缴费（多日统计只算1人次）
+- 其中一笔退款
+- 就诊改科室、改医生
+
+    python check_revenue_summary.py [数据库文件]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import analytics
+import db
+import summary
+
+START, END = '2099-03-01', '2099-03-02'
+
+# 与汇总表无关、直接从账单计算的统计（/api/admin/statistics 原来的查询）
+EXPECTED = {
+    'daily': """
+        SELECT date(b.payment_time) as stat_date,
+               COUNT(DISTINCT v.visit_id) as visit_count,
+               SUM(b.total_fee) as total_revenue
+        FROM billing b
+        JOIN visit v ON b.visit_id = v.visit_id
+        WHERE b.payment_status = '已支付'
+          AND date(b.payment_time) BETWEEN ? AND ?
+        GROUP BY date(b.payment_time)
+    """,
+    'department': """
+        SELECT d.dept_name,
+               COUNT(DISTINCT v.visit_id) as visit_count,
+               SUM(b.total_fee) as total_revenue
+        FROM billing b
+        JOIN visit v ON b.visit_id = v.visit_id
+        JOIN department d ON v.dept_id = d.dept_id
+        WHERE b.payment_status = '已支付'
+          AND date(b.payment_time) BETWEEN ? AND ?
+        GROUP BY d.dept_id, d.dept_name
+    """,
+    'doctor': """
+        SELECT e.emp_name,
+               d.dept_name,
+               COUNT(DISTINCT v.visit_id) as visit_count,
+               SUM(b.total_fee) as total_revenue
+        FROM billing b
+        JOIN visit v ON b.visit_id = v.visit_id
+        JOIN employee e ON v.doctor_id = e.emp_id
+        JOIN department d ON v.dept_id = d.dept_id
+        WHERE b.payment_status = '已支付'
+          AND date(b.payment_time) BETWEEN ? AND ?
+        GROUP BY e.emp_id, e.emp_name, d.dept_name
+    """,
+}
+
+
+def normalize(rows):
+    return sorted(tuple(round(value, 2) if isinstance(value, float) else value for value in row)
+                  for row in rows)
+
+
+def compare(client, step):
+    """比较三种统计和汇总表核对结果，返回失败数"""
+    failures = 0
+    for stat_type, sql in EXPECTED.items():
+        result = client.get(f'/api/admin/statistics?type={stat_type}&start_date={START}&end_date={END}').get_json()
+        actual = normalize(tuple(row.values()) for row in result.get('data', []))
+        with db.get_db() as conn:
+            expected = normalize(tuple(row) for row in conn.execute(sql, (START, END)))
+        if result.get('success') and actual == expected:
+            print(f"✓ {step}: {stat_type} {actual}")
+        else:
+            failures += 1
+            print(f"✗ {step}: {stat_type} 接口 {actual or result.get('message')}，实际 {expected}")
+
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+        mismatches = summary.check_revenue_summary(cursor) + summary.check_revenue_visits(cursor)
+        if mismatches:
+            failures += 1
+            print(f"✗ {step}: 汇总表与原始数据不一致 {mismatches[:5]}")
+
+        facts_path = db.get_pool().db_file + analytics.FACTS_SUFFIX
+        try:
+            analytics.export(conn, facts_path)
+            mismatches = analytics.check(conn, analytics.FactTable.load(facts_path))
+        except analytics.AnalyticsError as e:
+            print(f"  {step}: 跳过多维统计核对（{e}）")
+        else:
+            if mismatches:
+                failures += 1
+                print(f"✗ {step}: 多维统计与汇总表不一致 {mismatches[:5]}")
+            else:
+                print(f"✓ {step}: 多维统计与汇总表一致")
+    return failures
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else 'hospital.db'
+    workdir = tempfile.mkdtemp()
+    db_copy = os.path.join(workdir, 'hospital.db')
+    shutil.copy(source, db_copy)
+    db.configure(db_copy)
+
+    from app import app
+    client = app.test_client()
+
+    print("=" * 80)
+    print("收入统计检查")
+    print("=" * 80)
+
+    with db.get_db() as conn:
+        doctors = conn.execute("""
+            SELECT e.emp_id, e.dept_id, MIN(cr.room_id)
+            FROM employee e
+            JOIN clinic_room cr ON cr.dept_id = e.dept_id
+            WHERE e.emp_type = '医生'
+            GROUP BY e.emp_id
+            ORDER BY e.dept_id, e.emp_id
+        """).fetchall()
+        # 两个不同科室的医生
+        first = doctors[0]
+        second = next(row for row in doctors if row[1] != first[1])
+        patient_id = conn.execute("SELECT MIN(patient_id) FROM patient").fetchone()[0]
+
+        def add_visit(doctor):
+            cursor = conn.execute("""
+                INSERT INTO visit (patient_id, dept_id, room_id, doctor_id, visit_date, visit_time, status)
+                VALUES (?, ?, ?, ?, ?, '09:00:00', '已完成')
+            """, (patient_id, doctor[1], doctor[2], doctor[0], START))
+            return cursor.lastrowid
+
+        def pay(visit_id, fee, paid_at):
+            cursor = conn.execute("""
+                INSERT INTO billing (visit_id, patient_id, total_fee, self_fee, payment_method,
+                                     payment_status, payment_time)
+                VALUES (?, ?, ?, ?, '现金', '已支付', ?)
+            """, (visit_id, patient_id, fee, fee, paid_at))
+            return cursor.lastrowid
+
+        # 同一次就诊两天各缴一笔，当天还有第二笔；另一个就诊只在第一天缴费
+        visit_id = add_visit(first)
+        pay(visit_id, 50.0, f'{START} 10:00:00')
+        pay(visit_id, 20.0, f'{START} 11:00:00')
+        second_day_bill = pay(visit_id, 30.0, f'{END} 09:30:00')
+        pay(add_visit(first), 15.0, f'{START} 14:00:00')
+        conn.commit()
+
+    failures = compare(client, '两天缴费')
+
+    with db.get_db() as conn:
+        conn.execute("UPDATE billing SET payment_status = '已退款' WHERE bill_id = ?", (second_day_bill,))
+        conn.commit()
+    failures += compare(client, '第二天退款')
+
+    with db.get_db() as conn:
+        conn.execute("UPDATE billing SET payment_status = '已支付' WHERE bill_id = ?", (second_day_bill,))
+        conn.execute("UPDATE visit SET dept_id = ?, room_id = ?, doctor_id = ? WHERE visit_id = ?",
+                     (second[1], second[2], second[0], visit_id))
+        conn.commit()
+    failures += compare(client, '改科室和医生')
+
+    with db.get_db() as conn:
+        conn.execute("UPDATE visit SET doctor_id = NULL WHERE visit_id = ?", (visit_id,))
+        conn.commit()
+    failures += compare(client, '取消指定医生')
+
+    db.get_pool().close_all()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 80)
+    if failures:
+        print(f"✗ {failures} 项统计与原始数据不一致")
+        sys.exit(1)
+    print("✓ 收入统计与原始数据一致")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+响应压缩与条件请求
+
+患者的全部就诊记录、一天的就诊列表等接口的JSON可能有几百KB，诊室网络差时
+加载很慢；前台定时刷新候诊列表，数据没有变化也要整个重新下载。install(app)
+注册的 after_request 钩子处理所有 GET 请求的JSON、HTML、文本响应：
+
+- ETag：响应没有 ETag 时按响应体内容计算强 ETag（cached_response 缓存的参考数据
+  已经带有 ETag，沿用）。请求的 If-None-Match 匹配时返回无响应体的 304，数据没有
+  变化的轮询只传回响应头。
+- 压缩：响应体不小于 MIN_SIZE 字节、客户端 Accept-Encoding 接受时压缩，优先
+  br（需要安装 brotli），其次 gzip。同一数据的不同编码各有自己的强 ETag
+  （"<内容ETag>-br"、"<内容ETag>-gzip"），响应带 Vary: Accept-Encoding。
+- 流式响应（format=ndjson 导出、候诊队列推送）、静态文件、已经压缩过的响应和
+  非 200 响应原样返回。
+
+构建好的页面和静态资源（assets.py）内容不变，加载时用 precompress() 以最高级别
+压缩一次，每次请求由 prebuilt_response() 直接选用对应编码的响应体。
+
+压缩、304 的次数和节省的字节数见 /metrics。
+"""
+
+import gzip
+import hashlib
+import threading
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于这个字节数的响应不压缩（压缩后也省不了一个网络包）
+MIN_SIZE = 1024
+
+# 动态响应每次都要压缩，用压缩率和速度比较均衡的级别；预先压缩的内容用最高级别
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 11
+
+COMPRESSIBLE_TYPES = frozenset((
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'application/javascript',
+))
+
+
+def _gzip(body, level=GZIP_LEVEL):
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body, level=BROTLI_QUALITY):
+    return brotli.compress(body, quality=level)
+
+
+# 按优先顺序排列的编码
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS['br'] = _brotli
+ENCODINGS['gzip'] = _gzip
+
+_PRECOMPRESS_LEVELS = {'br': PRECOMPRESS_BROTLI_QUALITY, 'gzip': PRECOMPRESS_GZIP_LEVEL}
+
+
+class CompressionStats:
+    """压缩和条件请求的计数（/metrics）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compressed = {encoding: 0 for encoding in ENCODINGS}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.not_modified = 0
+
+    def record_compressed(self, encoding, size, compressed_size):
+        with self._lock:
+            self.compressed[encoding] += 1
+            self.bytes_in += size
+            self.bytes_out += compressed_size
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def render_metrics(self):
+        with self._lock:
+            lines = [
+                '# HELP hms_http_compressed_responses_total 压缩后返回的响应数',
+                '# TYPE hms_http_compressed_responses_total counter',
+            ]
+            lines += [f'hms_http_compressed_responses_total{{encoding="{encoding}"}} {count}'
+                      for encoding, count in self.compressed.items()]
+            lines += [
+                '# HELP hms_http_compression_saved_bytes_total 压缩节省的响应体字节数',
+                '# TYPE hms_http_compression_saved_bytes_total counter',
+                f'hms_http_compression_saved_bytes_total {self.bytes_in - self.bytes_out}',
+                '# HELP hms_http_not_modified_total If-None-Match 匹配、返回 304 的响应数',
+                '# TYPE hms_http_not_modified_total counter',
+                f'hms_http_not_modified_total {self.not_modified}',
+            ]
+            return lines
+
+
+compression_stats = CompressionStats()
+
+
+def choose_encoding(size, available=ENCODINGS):
+    """按请求的 Accept-Encoding 选择编码，不压缩时返回 None"""
+    if size < MIN_SIZE:
+        return None
+    encoding = request.accept_encodings.best_match(list(available))
+    return encoding if encoding in available else None
+
+
+def _not_modified(response, etag):
+    if request.if_none_match and request.if_none_match.contains(etag):
+        compression_stats.record_not_modified()
+        response.status_code = 304
+        response.set_data(b'')
+        del response.headers['Content-Length']
+        return True
+    return False
+
+
+def _after_request(response):
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+            or response.is_streamed or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    etag, weak = response.get_etag()
+    if etag is None or weak:
+        etag = hashlib.sha1(body).hexdigest()
+    encoding = choose_encoding(len(body))
+    if encoding is not None:
+        etag = f'{etag}-{encoding}'
+    if len(body) >= MIN_SIZE:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    if 'Cache-Control' not in response.headers:
+        # 浏览器每次使用前都用 If-None-Match 重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+
+    if _not_modified(response, etag):
+        return response
+
+    if encoding is not None:
+        compressed = ENCODINGS[encoding](body)
+        compression_stats.record_compressed(encoding, len(body), len(compressed))
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def precompress(body):
+    """预先压缩的响应体 {编码: 字节}，不含 None（不压缩）"""
+    if len(body) < MIN_SIZE:
+        return {}
+    return {encoding: compress(body, _PRECOMPRESS_LEVELS[encoding]) for encoding, compress in ENCODINGS.items()}
+
+
+def prebuilt_response(body, encoded, etag, mimetype, cache_control):
+    """返回预先构建、压缩好的内容：按 Accept-Encoding 选用 encoded 中的响应体，
+    If-None-Match 匹配时返回 304；etag 为未压缩内容的 ETag"""
+    encoding = choose_encoding(len(body), encoded)
+    response = Response(encoded[encoding] if encoding else body, mimetype=mimetype)
+    if encoded:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        etag = f'{etag}-{encoding}'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if _not_modified(response, etag):
+        return response
+    if encoding is not None:
+        compression_stats.record_compressed(encoding, len(body), len(encoded[encoding]))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def install(app):
+    """为 app 注册压缩和条件请求钩子"""
+    app.after_request(_after_request)
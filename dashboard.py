@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+今日运营计数
+
+管理员首页的今日就诊人次、收入、候诊人数，以及按科室、诊室的分项统计，
+由 DashboardCounters 在内存中维护，接口直接返回，不再每次汇总查询：
+
+- 到院登记、状态变更、缴费通过 queue_hub 的监听器实时计入，退款由接口调用
+  record_refund() 扣除
+- 从数据库加载当天的就诊记录和已支付账单重新计算（核对），吸收其他进程或脚本
+  写入的数据：第一次访问时在请求中核对，之后由后台线程（Reconciler）每隔
+  RECONCILE_SECONDS 秒、以及UTC零点跨天时核对，请求不等待核对
+- 计数按就诊ID、账单ID记录，同一事件重复计入不会重复计数；核对期间收到的
+  事件在核对结果上重放，不会丢失
+
+"今日"与数据库的 date('now') 一致（UTC）。多进程部署时每个进程只能实时看到
+本进程处理的写操作，其他进程的写入在下次核对时计入，最多晚 RECONCILE_SECONDS
+秒；接口响应的 counted_from（describe()）给出上次核对的时间和距今秒数。
+"""
+
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import get_db, utc_today
+
+# 与数据库核对的间隔（秒）
+RECONCILE_SECONDS = 30
+
+WAITING_STATUS = '等待就诊'
+
+
+def _seconds_to_midnight():
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return (midnight - now).total_seconds()
+
+
+class _DayCounters:
+    """某一天的计数，visits/bills 记录已计入的就诊和账单"""
+
+    def __init__(self, day):
+        self.day = day
+        self.visits = {}        # visit_id -> [dept_id, room_id, status]
+        self.bills = {}         # bill_id -> (dept_id, total_fee)
+        self.departments = {}   # dept_id -> {'visits', 'waiting', 'revenue'}
+        self.rooms = {}         # room_id -> {'visits', 'waiting'}
+        self.total_visits = 0
+        self.waiting = 0
+        self.revenue = 0.0
+
+    def _department(self, dept_id):
+        counts = self.departments.get(dept_id)
+        if counts is None:
+            counts = self.departments[dept_id] = {'visits': 0, 'waiting': 0, 'revenue': 0.0}
+        return counts
+
+    def _room(self, room_id):
+        counts = self.rooms.get(room_id)
+        if counts is None:
+            counts = self.rooms[room_id] = {'visits': 0, 'waiting': 0}
+        return counts
+
+    def add_visit(self, visit_id, dept_id, room_id, status):
+        if visit_id in self.visits:
+            self.set_status(visit_id, status)
+            return
+        self.visits[visit_id] = [dept_id, room_id, status]
+        waiting = int(status == WAITING_STATUS)
+        self.total_visits += 1
+        self.waiting += waiting
+        for counts in (self._department(dept_id), self._room(room_id)):
+            counts['visits'] += 1
+            counts['waiting'] += waiting
+
+    def set_status(self, visit_id, status):
+        visit = self.visits.get(visit_id)
+        if visit is None:
+            return
+        delta = (status == WAITING_STATUS) - (visit[2] == WAITING_STATUS)
+        visit[2] = status
+        if delta:
+            self.waiting += delta
+            self._department(visit[0])['waiting'] += delta
+            self._room(visit[1])['waiting'] += delta
+
+    def add_bill(self, bill_id, dept_id, total_fee):
+        if bill_id in self.bills:
+            return
+        self.bills[bill_id] = (dept_id, total_fee)
+        self.revenue += total_fee
+        self._department(dept_id)['revenue'] += total_fee
+
+    def remove_bill(self, bill_id):
+        bill = self.bills.pop(bill_id, None)
+        if bill is None:
+            return
+        dept_id, total_fee = bill
+        self.revenue -= total_fee
+        self._department(dept_id)['revenue'] -= total_fee
+
+    def totals(self):
+        return self.total_visits, self.waiting, round(self.revenue, 2)
+
+
+class DashboardCounters:
+    def __init__(self):
+        self._counters = None
+        self._reconciled_at = None
+        self._reconciler = None
+        self._replay = None
+        self._departments = {}   # dept_id -> dept_name
+        self._rooms = {}         # room_id -> (room_name, dept_id)
+        self._active_doctors = 0
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+        self.reconciles = 0
+        self.corrections = 0
+
+    # ---------- 事件 ----------
+
+    def _apply(self, change):
+        """计入一项变更（需持有锁）；核对进行中时同时记下，核对完成后重放"""
+        if self._replay is not None:
+            self._replay.append(change)
+        if self._counters is not None:
+            _apply_change(self._counters, change)
+
+    def on_queue_event(self, event):
+        """queue_hub 监听器"""
+        data = event['data']
+        with self._lock:
+            if event['type'] == 'registered':
+                self._departments.setdefault(data['dept_id'], data['dept_name'])
+                self._rooms.setdefault(data['room_id'], (data['room_name'], data['dept_id']))
+                self._apply(('visit', event['date'], data['visit_id'], data['dept_id'],
+                             data['room_id'], data['status']))
+            elif event['type'] in ('status', 'billed'):
+                self._apply(('status', event['date'], data['visit_id'], data['status']))
+            if event['type'] == 'billed' and data.get('dept_id') is not None:
+                # 账单的支付时间是现在，不一定是就诊当天
+                self._apply(('bill', utc_today(), data['bill_id'], data['dept_id'], data['total_fee']))
+
+    def record_refund(self, bill_id):
+        with self._lock:
+            self._apply(('refund', None, bill_id))
+
+    # ---------- 核对 ----------
+
+    def _load(self, cursor, day):
+        counters = _DayCounters(day)
+        cursor.execute("""
+            SELECT visit_id, dept_id, room_id, status FROM visit WHERE visit_date = ?
+        """, (day,))
+        for row in cursor.fetchall():
+            counters.add_visit(row[0], row[1], row[2], row[3])
+
+        start = datetime.strptime(day, '%Y-%m-%d').date()
+        cursor.execute("""
+            SELECT b.bill_id, v.dept_id, b.total_fee
+            FROM billing b
+            JOIN visit v ON b.visit_id = v.visit_id
+            WHERE b.payment_status = '已支付'
+              AND b.payment_time >= ? AND b.payment_time < ?
+        """, (start.isoformat(), (start + timedelta(days=1)).isoformat()))
+        for row in cursor.fetchall():
+            counters.add_bill(row[0], row[1], row[2])
+
+        cursor.execute("SELECT dept_id, dept_name FROM department")
+        departments = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("SELECT room_id, room_name, dept_id FROM clinic_room")
+        rooms = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT COUNT(*) FROM employee WHERE emp_type = '医生' AND work_status = '在职'
+        """)
+        active_doctors = cursor.fetchone()[0]
+        return counters, departments, rooms, active_doctors
+
+    def reconcile(self, day=None, blocking=True):
+        """从数据库重新计算 day（默认今天）的计数
+
+        blocking 为 False 时，如果已有其他线程在核对则直接返回。
+        """
+        day = day or utc_today()
+        if not self._reconcile_lock.acquire(blocking=blocking):
+            return
+        try:
+            with self._lock:
+                self._replay = []
+            try:
+                with get_db() as conn:
+                    counters, departments, rooms, active_doctors = self._load(conn.cursor(), day)
+            except BaseException:
+                with self._lock:
+                    self._replay = None
+                raise
+            with self._lock:
+                for change in self._replay:
+                    _apply_change(counters, change)
+                self._replay = None
+                old = self._counters
+                if old is not None and old.day == day and old.totals() != counters.totals():
+                    self.corrections += 1
+                self._counters = counters
+                self._departments = departments
+                self._rooms = rooms
+                self._active_doctors = active_doctors
+                self._reconciled_at = time.time()
+                self.reconciles += 1
+        finally:
+            self._reconcile_lock.release()
+
+    def _current(self):
+        """返回今天的计数；还没有今天的计数时先核对，并启动定时核对的后台线程"""
+        today = utc_today()
+        with self._lock:
+            counters = self._counters
+            if self._reconciler is None:
+                self._reconciler = Reconciler(self)
+                self._reconciler.start()
+        if counters is None or counters.day != today:
+            self.reconcile(today)
+        return self._counters
+
+    def describe(self):
+        """上次核对的时间（UTC）和距今秒数，其他进程的写入最多晚 RECONCILE_SECONDS 秒计入"""
+        with self._lock:
+            reconciled_at = self._reconciled_at
+        if reconciled_at is None:
+            return {'reconcile_interval_seconds': RECONCILE_SECONDS}
+        return {
+            'reconciled_at': datetime.fromtimestamp(reconciled_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'staleness_seconds': round(time.time() - reconciled_at, 1),
+            'reconcile_interval_seconds': RECONCILE_SECONDS,
+        }
+
+    def stop(self):
+        with self._lock:
+            reconciler, self._reconciler = self._reconciler, None
+        if reconciler is not None:
+            reconciler.stop()
+
+    # ---------- 查询 ----------
+
+    def summary(self):
+        """今日就诊人次、收入、候诊人数、在职医生数"""
+        counters = self._current()
+        with self._lock:
+            return {
+                'today_visits': counters.total_visits,
+                'today_revenue': round(counters.revenue, 2),
+                'waiting_patients': counters.waiting,
+                'active_doctors': self._active_doctors,
+            }
+
+    def breakdown(self):
+        """按科室、诊室的今日就诊人次、候诊人数（科室另有收入），包含没有就诊的科室和诊室"""
+        counters = self._current()
+        with self._lock:
+            departments = []
+            for dept_id in sorted(set(self._departments) | set(counters.departments)):
+                counts = counters.departments.get(dept_id, {'visits': 0, 'waiting': 0, 'revenue': 0.0})
+                departments.append({
+                    'dept_id': dept_id,
+                    'dept_name': self._departments.get(dept_id),
+                    'visits': counts['visits'],
+                    'waiting': counts['waiting'],
+                    'revenue': round(counts['revenue'], 2),
+                })
+            rooms = []
+            for room_id in sorted(set(self._rooms) | set(counters.rooms)):
+                counts = counters.rooms.get(room_id, {'visits': 0, 'waiting': 0})
+                room_name, dept_id = self._rooms.get(room_id, (None, None))
+                rooms.append({
+                    'room_id': room_id,
+                    'room_name': room_name,
+                    'dept_id': dept_id,
+                    'visits': counts['visits'],
+                    'waiting': counts['waiting'],
+                })
+            return {'date': counters.day, 'departments': departments, 'rooms': rooms}
+
+    def render_metrics(self):
+        """metrics.add_collector 使用的指标输出"""
+        return [
+            '# HELP hms_dashboard_reconciles_total 今日计数与数据库核对的次数',
+            '# TYPE hms_dashboard_reconciles_total counter',
+            f'hms_dashboard_reconciles_total {self.reconciles}',
+            '# HELP hms_dashboard_corrections_total 核对时内存计数与数据库不一致的次数（含核对时刚提交、尚未计入的写操作）',
+            '# TYPE hms_dashboard_corrections_total counter',
+            f'hms_dashboard_corrections_total {self.corrections}',
+        ]
+
+
+class Reconciler(threading.Thread):
+    """后台线程，每隔 interval 秒、以及UTC零点跨天时核对今日计数"""
+
+    def __init__(self, counters, interval=RECONCILE_SECONDS):
+        super().__init__(name='hms-dashboard', daemon=True)
+        self.counters = counters
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(min(self.interval, _seconds_to_midnight() + 0.5)):
+            try:
+                # 请求中正在核对时跳过这一次
+                self.counters.reconcile(blocking=False)
+            except Exception as e:
+                print(f"核对今日计数失败：{e}", file=sys.stderr)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _apply_change(counters, change):
+    kind, day = change[0], change[1]
+    if kind == 'visit' and day == counters.day:
+        counters.add_visit(*change[2:])
+    elif kind == 'status' and day == counters.day:
+        counters.set_status(*change[2:])
+    elif kind == 'bill' and day == counters.day:
+        counters.add_bill(*change[2:])
+    elif kind == 'refund':
+        counters.remove_bill(change[2])
+
+
+dashboard_counters = DashboardCounters()
@@ -1,4 +1,5 @@
--- 社区医院门诊管理系统数据库设计
+-- 社区医院门诊管理系统数据库设计（MySQL 8.0）
+-- 与 SQLite 迁移（migrations.py）版本 10 的结构一致，连接方式见 backends.py
 -- 创建数据库
 CREATE DATABASE IF NOT EXISTS hospital_management CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 USE hospital_management;
@@ -21,7 +22,8 @@ CREATE TABLE employee (
     phone VARCHAR(20) COMMENT '联系电话',
     work_status ENUM('在职', '休假', '离职') DEFAULT '在职' COMMENT '工作状态',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id)
+    FOREIGN KEY (dept_id) REFERENCES department(dept_id),
+    INDEX idx_employee_type_dept (emp_type, dept_id, emp_name)
 ) COMMENT='员工信息表';
 
 -- 3. 诊室表
@@ -31,7 +33,8 @@ CREATE TABLE clinic_room (
     dept_id INT NOT NULL COMMENT '所属科室',
     status ENUM('开放', '关闭', '维护中') DEFAULT '开放' COMMENT '诊室状态',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id)
+    FOREIGN KEY (dept_id) REFERENCES department(dept_id),
+    INDEX idx_room_dept_status (dept_id, status)
 ) COMMENT='诊室信息表';
 
 -- 4. 医生排班表
@@ -47,7 +50,8 @@ CREATE TABLE doctor_schedule (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     FOREIGN KEY (doctor_id) REFERENCES employee(emp_id),
     FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
-    UNIQUE KEY unique_schedule (doctor_id, work_date, start_time)
+    UNIQUE KEY unique_schedule (doctor_id, work_date, start_time),
+    INDEX idx_schedule_date_time (work_date, start_time)
 ) COMMENT='医生排班表';
 
 -- 5. 患者信息表
@@ -60,8 +64,12 @@ CREATE TABLE patient (
     address TEXT COMMENT '住址',
     medical_history TEXT COMMENT '病史',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-    INDEX idx_phone (phone),
-    INDEX idx_id_card (id_card)
+    visit_count INT NOT NULL DEFAULT 0 COMMENT '就诊次数（触发器维护）',
+    last_visit_date DATE COMMENT '最近就诊日期（触发器维护）',
+    INDEX idx_patient_phone (phone),
+    INDEX idx_patient_created (created_at),
+    INDEX idx_patient_name (patient_name),
+    INDEX idx_patient_last_visit (last_visit_date, patient_id)
 ) COMMENT='患者信息表';
 
 -- 6. 预约信息表
@@ -71,14 +79,19 @@ CREATE TABLE appointment (
     patient_name VARCHAR(50) NOT NULL COMMENT '患者姓名',
     phone VARCHAR(20) NOT NULL COMMENT '联系电话',
     dept_id INT NOT NULL COMMENT '就诊科室',
+    doctor_id INT COMMENT '预约医生',
+    schedule_id INT COMMENT '占用的排班号源',
     appt_date DATE NOT NULL COMMENT '预约日期',
     appt_time TIME NOT NULL COMMENT '预计到达时间',
     status ENUM('待到院', '已到院', '已取消') DEFAULT '待到院' COMMENT '预约状态',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '预约时间',
     FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
     FOREIGN KEY (dept_id) REFERENCES department(dept_id),
-    INDEX idx_appt_date (appt_date),
-    INDEX idx_phone (phone)
+    FOREIGN KEY (doctor_id) REFERENCES employee(emp_id),
+    FOREIGN KEY (schedule_id) REFERENCES doctor_schedule(schedule_id),
+    INDEX idx_appointment_phone_date (phone, appt_date, appt_time),
+    INDEX idx_appointment_schedule (schedule_id, status),
+    INDEX idx_appointment_date_dept_status (appt_date, dept_id, status, appt_time)
 ) COMMENT='预约信息表';
 
 -- 7. 就诊信息表
@@ -98,8 +111,9 @@ CREATE TABLE visit (
     FOREIGN KEY (dept_id) REFERENCES department(dept_id),
     FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
     FOREIGN KEY (doctor_id) REFERENCES employee(emp_id),
-    INDEX idx_visit_date (visit_date),
-    INDEX idx_status (status)
+    INDEX idx_visit_date_status_time (visit_date, status, visit_time),
+    INDEX idx_visit_patient_date (patient_id, visit_date, visit_time),
+    INDEX idx_visit_date_time (visit_date, visit_time)
 ) COMMENT='就诊信息表';
 
 -- 8. 费用结算表
@@ -112,29 +126,38 @@ CREATE TABLE billing (
     self_fee DECIMAL(10, 2) NOT NULL COMMENT '自费金额',
     payment_method ENUM('现金', '微信', '支付宝', '银行卡', '医保卡') COMMENT '支付方式',
     payment_status ENUM('未支付', '已支付', '已退款') DEFAULT '未支付' COMMENT '支付状态',
-    payment_time TIMESTAMP NULL COMMENT '支付时间',
+    payment_time DATETIME NULL COMMENT '支付时间（UTC）',
     operator_id INT COMMENT '收费员工号',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    payment_date DATE AS (DATE(payment_time)) STORED COMMENT '支付日期，供按日分组统计',
     FOREIGN KEY (visit_id) REFERENCES visit(visit_id),
     FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
     FOREIGN KEY (operator_id) REFERENCES employee(emp_id),
-    INDEX idx_payment_time (payment_time)
+    INDEX idx_billing_status_time (payment_status, payment_time, payment_date, visit_id, total_fee),
+    INDEX idx_billing_visit (visit_id, payment_status, payment_date)
 ) COMMENT='费用结算表';
 
--- 9. 收入统计表（冗余表，用于快速统计）
+-- 9. 收入统计表（冗余表，用于快速统计，由 billing 表的触发器维护）
 CREATE TABLE revenue_summary (
-    summary_id INT PRIMARY KEY AUTO_INCREMENT COMMENT '统计ID',
     stat_date DATE NOT NULL COMMENT '统计日期',
-    dept_id INT COMMENT '科室ID',
-    doctor_id INT COMMENT '医生ID',
-    total_visits INT DEFAULT 0 COMMENT '就诊人次',
-    total_revenue DECIMAL(10, 2) DEFAULT 0.00 COMMENT '总收入',
+    dept_id INT NOT NULL COMMENT '科室ID',
+    doctor_id INT NOT NULL DEFAULT 0 COMMENT '医生ID，0表示未指定医生',
+    total_visits INT NOT NULL DEFAULT 0 COMMENT '就诊人次',
+    total_revenue DECIMAL(12, 2) NOT NULL DEFAULT 0.00 COMMENT '总收入',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
-    UNIQUE KEY unique_stat (stat_date, dept_id, doctor_id),
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id),
-    FOREIGN KEY (doctor_id) REFERENCES employee(emp_id)
+    PRIMARY KEY (stat_date, dept_id, doctor_id)
 ) COMMENT='收入统计表';
 
+-- 每天有已支付账单的就诊（多日统计按就诊去重计算人次，由 billing 表的触发器维护）
+CREATE TABLE revenue_visit (
+    stat_date DATE NOT NULL COMMENT '统计日期',
+    visit_id INT NOT NULL COMMENT '就诊ID',
+    dept_id INT NOT NULL COMMENT '科室ID',
+    doctor_id INT NOT NULL DEFAULT 0 COMMENT '医生ID，0表示未指定医生',
+    PRIMARY KEY (stat_date, visit_id),
+    INDEX idx_revenue_visit_visit (visit_id)
+) COMMENT='收入统计就诊表';
+
 -- 10. 系统用户表（登录管理）
 CREATE TABLE system_user (
     user_id INT PRIMARY KEY AUTO_INCREMENT COMMENT '用户ID',
@@ -149,6 +172,150 @@ CREATE TABLE system_user (
     FOREIGN KEY (patient_id) REFERENCES patient(patient_id)
 ) COMMENT='系统用户表';
 
+-- 11. 数据库结构版本（backends.py 连接时检查）
+CREATE TABLE schema_version (
+    version INT PRIMARY KEY COMMENT '结构版本',
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间'
+) COMMENT='数据库结构版本';
+
+INSERT INTO schema_version (version) VALUES (11);
+
+-- 姓名/电话/身份证号任意位置匹配（ngram 分词，MySQL 5.7.6+）
+-- MariaDB 不支持 ngram，这条语句失败时患者搜索退回到 LIKE 查询
+CREATE FULLTEXT INDEX ft_patient ON patient (patient_name, phone, id_card) WITH PARSER ngram;
+
+-- 与 SQLite 归档后的临时视图同名，查询语句两边通用（MySQL 不归档）
+CREATE VIEW all_visit AS SELECT * FROM visit;
+CREATE VIEW all_billing AS SELECT * FROM billing;
+
+-- 触发器（init_db.py 按 DELIMITER 分割语句）
+DELIMITER $$
+
+-- 一笔已支付账单计入收入汇总：收入计入账单金额；同一就诊当天的第一笔已支付账单计1人次
+CREATE TRIGGER trg_revenue_summary_insert
+AFTER INSERT ON billing
+FOR EACH ROW
+BEGIN
+    IF NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL THEN
+        INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+        SELECT DATE(NEW.payment_time), v.dept_id, COALESCE(v.doctor_id, 0),
+               NOT EXISTS (
+                   SELECT 1 FROM billing b
+                   WHERE b.visit_id = NEW.visit_id AND b.bill_id != NEW.bill_id
+                     AND b.payment_status = '已支付' AND b.payment_date = DATE(NEW.payment_time)
+               ),
+               NEW.total_fee
+        FROM visit v
+        WHERE v.visit_id = NEW.visit_id
+        ON DUPLICATE KEY UPDATE
+            total_visits = total_visits + VALUES(total_visits),
+            total_revenue = total_revenue + VALUES(total_revenue);
+        INSERT IGNORE INTO revenue_visit (stat_date, visit_id, dept_id, doctor_id)
+        SELECT DATE(NEW.payment_time), v.visit_id, v.dept_id, COALESCE(v.doctor_id, 0)
+        FROM visit v
+        WHERE v.visit_id = NEW.visit_id;
+    END IF;
+END$$
+
+-- 退款、改金额等修改：先扣除原账单的贡献，再计入修改后的账单
+CREATE TRIGGER trg_revenue_summary_update
+AFTER UPDATE ON billing
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.payment_status <=> NEW.payment_status AND OLD.payment_time <=> NEW.payment_time
+            AND OLD.total_fee <=> NEW.total_fee AND OLD.visit_id <=> NEW.visit_id) THEN
+        IF OLD.payment_status = '已支付' AND OLD.payment_time IS NOT NULL THEN
+            UPDATE revenue_summary SET
+                total_visits = total_visits - NOT EXISTS (
+                    SELECT 1 FROM billing b
+                    WHERE b.visit_id = OLD.visit_id AND b.bill_id != OLD.bill_id
+                      AND b.payment_status = '已支付' AND b.payment_date = DATE(OLD.payment_time)
+                ),
+                total_revenue = total_revenue - OLD.total_fee
+            WHERE stat_date = DATE(OLD.payment_time)
+              AND (dept_id, doctor_id) = (
+                  SELECT v.dept_id, COALESCE(v.doctor_id, 0) FROM visit v WHERE v.visit_id = OLD.visit_id
+              );
+            DELETE FROM revenue_summary
+            WHERE stat_date = DATE(OLD.payment_time) AND total_visits <= 0;
+            DELETE FROM revenue_visit
+            WHERE stat_date = DATE(OLD.payment_time) AND visit_id = OLD.visit_id
+              AND NOT EXISTS (
+                  SELECT 1 FROM billing b
+                  WHERE b.visit_id = OLD.visit_id AND b.bill_id != OLD.bill_id
+                    AND b.payment_status = '已支付' AND b.payment_date = DATE(OLD.payment_time)
+              );
+        END IF;
+        IF NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL THEN
+            INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+            SELECT DATE(NEW.payment_time), v.dept_id, COALESCE(v.doctor_id, 0),
+                   NOT EXISTS (
+                       SELECT 1 FROM billing b
+                       WHERE b.visit_id = NEW.visit_id AND b.bill_id != NEW.bill_id
+                         AND b.payment_status = '已支付' AND b.payment_date = DATE(NEW.payment_time)
+                   ),
+                   NEW.total_fee
+            FROM visit v
+            WHERE v.visit_id = NEW.visit_id
+            ON DUPLICATE KEY UPDATE
+                total_visits = total_visits + VALUES(total_visits),
+                total_revenue = total_revenue + VALUES(total_revenue);
+            INSERT IGNORE INTO revenue_visit (stat_date, visit_id, dept_id, doctor_id)
+            SELECT DATE(NEW.payment_time), v.visit_id, v.dept_id, COALESCE(v.doctor_id, 0)
+            FROM visit v
+            WHERE v.visit_id = NEW.visit_id;
+        END IF;
+    END IF;
+END$$
+
+-- 就诊改科室、改医生：把它各天的人次和收入从原来的汇总行移到新的汇总行
+CREATE TRIGGER trg_revenue_summary_visit_update
+AFTER UPDATE ON visit
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.dept_id <=> NEW.dept_id AND COALESCE(OLD.doctor_id, 0) = COALESCE(NEW.doctor_id, 0)) THEN
+        UPDATE revenue_summary SET
+            total_visits = total_visits - 1,
+            total_revenue = total_revenue - (
+                SELECT SUM(b.total_fee) FROM billing b
+                WHERE b.visit_id = OLD.visit_id AND b.payment_status = '已支付'
+                  AND b.payment_date = revenue_summary.stat_date
+            )
+        WHERE dept_id = OLD.dept_id AND doctor_id = COALESCE(OLD.doctor_id, 0)
+          AND stat_date IN (SELECT stat_date FROM revenue_visit WHERE visit_id = OLD.visit_id);
+        DELETE FROM revenue_summary
+        WHERE dept_id = OLD.dept_id AND doctor_id = COALESCE(OLD.doctor_id, 0)
+          AND stat_date IN (SELECT stat_date FROM revenue_visit WHERE visit_id = OLD.visit_id)
+          AND total_visits <= 0;
+        INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+        SELECT b.payment_date, NEW.dept_id, COALESCE(NEW.doctor_id, 0), 1, SUM(b.total_fee)
+        FROM billing b
+        WHERE b.visit_id = NEW.visit_id AND b.payment_status = '已支付'
+          AND b.payment_date IS NOT NULL
+        GROUP BY b.payment_date
+        ON DUPLICATE KEY UPDATE
+            total_visits = total_visits + VALUES(total_visits),
+            total_revenue = total_revenue + VALUES(total_revenue);
+        UPDATE revenue_visit SET dept_id = NEW.dept_id, doctor_id = COALESCE(NEW.doctor_id, 0)
+        WHERE visit_id = NEW.visit_id;
+    END IF;
+END$$
+
+-- 患者就诊次数、最近就诊日期
+CREATE TRIGGER trg_patient_visit_stats_insert
+AFTER INSERT ON visit
+FOR EACH ROW
+BEGIN
+    UPDATE patient SET
+        visit_count = visit_count + 1,
+        last_visit_date = CASE
+            WHEN last_visit_date IS NULL OR NEW.visit_date > last_visit_date
+            THEN NEW.visit_date ELSE last_visit_date END
+    WHERE patient_id = NEW.patient_id;
+END$$
+
+DELIMITER ;
+
 -- 插入示例数据
 
 -- 插入科室
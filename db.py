@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+数据库连接管理 - 连接池
+
+默认使用 SQLite 数据库文件；configure() 也可以传入 MySQL 地址，
+见 backends.py。
+"""
+
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import backends
+
+# 数据库：SQLite数据库文件路径，或 backends.py 中说明的地址
+DB_FILE = 'hospital.db'
+
+# 连接池大小（同时持有连接的请求数上限）
+POOL_SIZE = 8
+
+# 获取连接的最长等待时间（秒）
+ACQUIRE_TIMEOUT = 10
+
+# 写事务遇到 SQLITE_BUSY（MySQL 锁等待超时、死锁）时的最多重试次数和初始退避时间（秒）
+WRITE_RETRIES = 5
+WRITE_BACKOFF = 0.02
+
+
+class PoolExhausted(Exception):
+    """连接池已耗尽"""
+
+
+class WriteError(Exception):
+    """写操作的业务错误（如号源已满、记录不存在），事务回滚，消息直接返回给前端"""
+
+
+class ConnectionPool:
+    """有界数据库连接池
+
+    连接在请求之间复用，避免每次请求都重新打开数据库文件、解析表结构。
+    空闲连接被取出时先做健康检查，失效的连接直接丢弃重建。
+    SQLite 第一次建立连接时执行未完成的结构迁移。
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE, timeout=ACQUIRE_TIMEOUT, readonly=False):
+        self.backend = backends.from_url(db_file, readonly)
+        self.db_file = self.backend.db_file
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _connect(self):
+        return self.backend.connect(_connection_factory)
+
+    def _is_healthy(self, conn):
+        return self.backend.is_healthy(conn)
+
+    def acquire(self):
+        """取出一个连接，池满时最多等待timeout秒"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhausted('数据库连接池已耗尽，请稍后重试')
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._is_healthy(conn):
+                return conn
+            conn.close()
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """归还连接，未提交的事务一律回滚"""
+        try:
+            if not discard:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except self.backend.errors:
+                    discard = True
+            if discard:
+                conn.close()
+            else:
+                self._idle.put_nowait(conn)
+                # close() 之后归还的连接不再复用
+                if self._closed:
+                    self.close_all()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except self.backend.database_errors:
+            self.release(conn, discard=not self._is_healthy(conn))
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def idle_count(self):
+        return self._idle.qsize()
+
+    def health_check(self):
+        """检查数据库是否可用，返回状态字典"""
+        try:
+            with self.connection() as conn:
+                conn.execute("SELECT 1").fetchone()
+                status = self.backend.describe(conn)
+            return {
+                'ok': True,
+                **status,
+                'pool_size': self.size,
+                'idle_connections': self.idle_count(),
+            }
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def close(self):
+        """停用连接池：关闭空闲连接，正在使用的连接归还时关闭"""
+        self._closed = True
+        self.close_all()
+
+
+_pool = ConnectionPool(DB_FILE)
+
+# 新建 SQLite 连接使用的连接类（metrics 用它统计SQL耗时）
+_connection_factory = sqlite3.Connection
+
+
+def set_connection_factory(factory):
+    """设置之后新建的 SQLite 连接使用的 sqlite3.Connection 子类"""
+    global _connection_factory
+    _connection_factory = factory
+
+
+def configure(db_file=DB_FILE, pool_size=POOL_SIZE):
+    """切换数据库或连接池大小（用于脚本和测试，db_file=':memory:' 为内存数据库）"""
+    global _pool
+    _pool.close_all()
+    _pool = ConnectionPool(db_file, pool_size)
+    return _pool
+
+
+def get_pool():
+    return _pool
+
+
+def get_db():
+    """获取数据库连接的上下文管理器
+
+    用法::
+
+        with get_db() as conn:
+            cursor = conn.cursor()
+            ...
+
+    无论路由正常返回还是抛出异常，连接都会归还连接池。
+    """
+    return _pool.connection()
+
+
+def utc_today():
+    """当天日期（YYYY-MM-DD），与数据库的 date('now')（MySQL 为 UTC_DATE()）一致，按 UTC 计算"""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _backend_of(conn):
+    # 只有 MySQL 连接带 backend 属性，sqlite3 连接（包括迁移、批量导入等脚本直接打开的）按 SQLite 处理
+    return getattr(conn, 'backend', backends.SQLiteBackend)
+
+
+def is_busy_error(error, conn=None):
+    """数据库被其他连接锁住（SQLITE_BUSY / SQLITE_LOCKED，MySQL 锁等待超时、死锁）"""
+    backend = _backend_of(conn) if conn is not None else _pool.backend
+    return backend.is_busy_error(error)
+
+
+def write_transaction(conn, work, retries=WRITE_RETRIES, backoff=WRITE_BACKOFF):
+    """在写事务中执行 work(cursor) 并提交，返回 work 的返回值
+
+    SQLite 用 BEGIN IMMEDIATE 在事务开始时就取得写锁，事务内先读后写的检查
+    不会被其他连接插入的写入打断（MySQL 上由 SELECT ... FOR UPDATE 锁住要修改
+    的行）。取锁超时（SQLITE_BUSY）或死锁时回滚并按指数退避加随机抖动重试；
+    work 抛出的其他异常回滚后原样抛出。
+    """
+    backend = _backend_of(conn)
+    for attempt in range(retries + 1):
+        try:
+            backend.begin(conn)
+            result = work(conn.cursor())
+            conn.commit()
+            return result
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not backend.is_busy_error(e) or attempt == retries:
+                raise
+        time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
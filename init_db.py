@@ -6,6 +6,29 @@
 
 import pymysql
 import getpass
+from urllib.parse import quote
+
+
+def split_statements(sql_script):
+    """按分号分割SQL脚本；DELIMITER $$ ... DELIMITER ; 之间（触发器）按 $$ 分割"""
+    statements = []
+    delimiter = ';'
+    current = []
+    for line in sql_script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split()[1]
+            continue
+        if stripped.startswith('--'):
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(current).strip()
+            statements.append(statement[:-len(delimiter)])
+            current = []
+    if '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
 
 def init_database():
     print("=" * 50)
@@ -34,7 +57,7 @@ def init_database():
         
         # 执行SQL脚本（分割成单条语句）
         print("正在创建数据库和表...")
-        statements = sql_script.split(';')
+        statements = split_statements(sql_script)
         
         for i, statement in enumerate(statements):
             statement = statement.strip()
@@ -61,17 +84,13 @@ def init_database():
         print("    * 患者: patient_demo / 123456")
         
         print("\n接下来的步骤：")
-        print("1. 修改 app.py 文件第20行的数据库密码")
-        print(f"   'password': '{mysql_password}',")
-        print("2. 运行: python app.py")
-        print("3. 访问: http://localhost:5000")
+        print("1. 用MySQL数据库启动服务:")
+        print(f"   python asgi.py --db mysql://root:{quote(mysql_password, safe='')}@localhost:3306/hospital_management")
+        print("2. 访问: http://localhost:5000")
         
         cursor.close()
         conn.close()
         
-        # 自动修改app.py中的密码
-        update_app_password(mysql_password)
-        
         return True
         
     except Exception as e:
@@ -82,27 +101,6 @@ def init_database():
         print("3. 是否有创建数据库的权限")
         return False
 
-def update_app_password(password):
-    """自动更新app.py中的数据库密码"""
-    try:
-        with open('app.py', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 查找并替换密码
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            if "'password':" in line and "'password': ''" in line:
-                lines[i] = f"    'password': '{password}',  # MySQL密码"
-                print(f"\n✓ 已自动更新 app.py 中的数据库密码")
-                break
-        
-        # 写回文件
-        with open('app.py', 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
-            
-    except Exception as e:
-        print(f"\n提示: 请手动修改 app.py 中的密码: {str(e)}")
-
 if __name__ == '__main__':
     init_database()
     print("\n按任意键退出...")
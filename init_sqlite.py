@@ -5,6 +5,8 @@ SQLite数据库初始化脚本（无需MySQL）
 import sqlite3
 import os
 
+import migrations
+
 print("=" * 60)
 print("社区医院门诊管理系统 - SQLite数据库初始化")
 print("=" * 60)
@@ -18,152 +20,10 @@ if os.path.exists('hospital.db'):
 # 创建新数据库
 print("正在创建SQLite数据库...")
 conn = sqlite3.connect('hospital.db')
-cursor = conn.cursor()
-
-print("正在创建数据表...")
-
-# 1. 科室表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS department (
-    dept_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    dept_name TEXT NOT NULL UNIQUE,
-    description TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-# 2. 员工表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS employee (
-    emp_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    emp_name TEXT NOT NULL,
-    emp_type TEXT CHECK(emp_type IN ('医生', '护士', '行政人员')) NOT NULL,
-    dept_id INTEGER,
-    title TEXT,
-    phone TEXT,
-    work_status TEXT CHECK(work_status IN ('在职', '休假', '离职')) DEFAULT '在职',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id)
-)
-""")
-
-# 3. 诊室表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS clinic_room (
-    room_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    room_name TEXT NOT NULL,
-    dept_id INTEGER NOT NULL,
-    status TEXT CHECK(status IN ('开放', '关闭', '维护中')) DEFAULT '开放',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id)
-)
-""")
 
-# 4. 患者表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS patient (
-    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    patient_name TEXT NOT NULL,
-    gender TEXT CHECK(gender IN ('男', '女', '其他')),
-    id_card TEXT UNIQUE,
-    phone TEXT NOT NULL,
-    address TEXT,
-    medical_history TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-# 5. 预约表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS appointment (
-    appt_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    patient_id INTEGER,
-    patient_name TEXT NOT NULL,
-    phone TEXT NOT NULL,
-    dept_id INTEGER NOT NULL,
-    appt_date DATE NOT NULL,
-    appt_time TIME NOT NULL,
-    status TEXT CHECK(status IN ('待到院', '已到院', '已取消')) DEFAULT '待到院',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id)
-)
-""")
-
-# 6. 就诊表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS visit (
-    visit_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    patient_id INTEGER NOT NULL,
-    dept_id INTEGER NOT NULL,
-    room_id INTEGER NOT NULL,
-    doctor_id INTEGER,
-    visit_date DATE NOT NULL,
-    visit_time TIME NOT NULL,
-    diagnosis TEXT,
-    prescription TEXT,
-    status TEXT CHECK(status IN ('等待就诊', '就诊中', '已完成', '已离院')) DEFAULT '等待就诊',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
-    FOREIGN KEY (dept_id) REFERENCES department(dept_id),
-    FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
-    FOREIGN KEY (doctor_id) REFERENCES employee(emp_id)
-)
-""")
-
-# 7. 费用表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS billing (
-    bill_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    visit_id INTEGER NOT NULL,
-    patient_id INTEGER NOT NULL,
-    total_fee REAL NOT NULL,
-    insurance_fee REAL DEFAULT 0.00,
-    self_fee REAL NOT NULL,
-    payment_method TEXT CHECK(payment_method IN ('现金', '微信', '支付宝', '银行卡', '医保卡')),
-    payment_status TEXT CHECK(payment_status IN ('未支付', '已支付', '已退款')) DEFAULT '未支付',
-    payment_time TIMESTAMP,
-    operator_id INTEGER,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (visit_id) REFERENCES visit(visit_id),
-    FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
-    FOREIGN KEY (operator_id) REFERENCES employee(emp_id)
-)
-""")
-
-# 8. 排班表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS doctor_schedule (
-    schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    doctor_id INTEGER NOT NULL,
-    room_id INTEGER NOT NULL,
-    work_date DATE NOT NULL,
-    start_time TIME NOT NULL,
-    end_time TIME NOT NULL,
-    max_patients INTEGER DEFAULT 30,
-    current_patients INTEGER DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (doctor_id) REFERENCES employee(emp_id),
-    FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
-    UNIQUE (doctor_id, work_date, start_time)
-)
-""")
-
-# 9. 系统用户表
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS system_user (
-    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT NOT NULL UNIQUE,
-    password TEXT NOT NULL,
-    user_role TEXT CHECK(user_role IN ('患者', '前台', '管理员')) NOT NULL,
-    emp_id INTEGER,
-    patient_id INTEGER,
-    status TEXT CHECK(status IN ('启用', '禁用')) DEFAULT '启用',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (emp_id) REFERENCES employee(emp_id),
-    FOREIGN KEY (patient_id) REFERENCES patient(patient_id)
-)
-""")
+print("正在创建数据表和索引...")
+migrations.upgrade(conn)
+cursor = conn.cursor()
 
 print("正在插入示例数据...")
 
@@ -228,7 +88,7 @@ print("=" * 60)
 print()
 print("数据库文件: hospital.db")
 print("已创建:")
-print("  - 9张数据表")
+print("  - 9张数据表及查询索引")
 print("  - 示例数据（科室、员工、诊室等）")
 print()
 print("测试账号（密码都是 123456）:")
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+请求耗时和SQL性能统计
+
+- 每个请求按 (方法, 路由, 状态码) 记录耗时直方图
+- 抽样的请求（SQL_SAMPLE_RATE）记录执行的每条SQL：次数、耗时（含取结果的时间），
+  超过 SLOW_QUERY_SECONDS 的慢查询连同 EXPLAIN QUERY PLAN 保存在最近慢查询列表中
+- render() 输出 Prometheus 文本格式，由 /metrics 接口返回
+
+SQL统计通过连接池的连接类 ProfiledConnection 实现：未抽样的请求和请求之外
+（迁移、脚本）执行的SQL只多一次线程局部变量检查，几乎没有额外开销。
+"""
+
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, request
+
+# 记录SQL明细的请求比例（0 关闭，1 全部记录）
+SQL_SAMPLE_RATE = 0.1
+
+# 慢查询阈值（秒）
+SLOW_QUERY_SECONDS = 0.1
+
+# 保留的最近慢查询条数、SQL统计的最多语句数
+MAX_SLOW_QUERIES = 50
+MAX_STATEMENTS = 500
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# 不统计的语句（事务控制、PRAGMA）
+_SKIP_SQL = re.compile(r'^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.I)
+_WHITESPACE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+class Histogram:
+    """Prometheus 风格的累计直方图，按标签分组"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, count, total) in items:
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le=bound)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{base} {total:.6f}')
+            lines.append(f'{self.name}_count{base} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def normalize_sql(sql):
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class _Statement:
+    __slots__ = ('sql', 'count', 'total', 'max', 'endpoints')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.endpoints = set()
+
+
+class QueryStats:
+    """按语句汇总的SQL耗时和最近的慢查询"""
+
+    def __init__(self):
+        self._statements = {}
+        self._slow = deque(maxlen=MAX_SLOW_QUERIES)
+        self._lock = threading.Lock()
+
+    def record(self, sql, elapsed, endpoint):
+        with self._lock:
+            statement = self._statements.get(sql)
+            if statement is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    return
+                statement = self._statements[sql] = _Statement(sql)
+            statement.count += 1
+            statement.total += elapsed
+            statement.max = max(statement.max, elapsed)
+            statement.endpoints.add(endpoint)
+
+    def record_slow(self, entry):
+        with self._lock:
+            self._slow.append(entry)
+
+    def top(self, limit=20):
+        with self._lock:
+            statements = sorted(self._statements.values(), key=lambda s: s.total, reverse=True)[:limit]
+            return [{
+                'sql': s.sql,
+                'count': s.count,
+                'total_ms': round(s.total * 1000, 3),
+                'avg_ms': round(s.total / s.count * 1000, 3),
+                'max_ms': round(s.max * 1000, 3),
+                'endpoints': sorted(s.endpoints),
+            } for s in statements]
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+
+
+request_latency = Histogram('hms_request_duration_seconds', '请求处理耗时',
+                            ('method', 'endpoint', 'status'), REQUEST_BUCKETS)
+query_latency = Histogram('hms_sql_query_duration_seconds', '抽样请求中单条SQL耗时（含取结果）',
+                          ('endpoint',), QUERY_BUCKETS)
+queries_per_request = Histogram('hms_sql_queries_per_request', '抽样请求执行的SQL条数',
+                                ('endpoint',), QUERY_COUNT_BUCKETS)
+query_stats = QueryStats()
+
+_collectors = []
+
+
+def add_collector(func):
+    """注册额外的指标输出函数，func() 返回 Prometheus 文本行列表"""
+    _collectors.append(func)
+
+
+# ==================== SQL 计时 ====================
+
+class _Timing:
+    """一条语句从执行到取完结果的累计耗时"""
+    __slots__ = ('sql', 'params', 'elapsed', 'reported')
+
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+        self.elapsed = 0.0
+        self.reported = False
+
+
+def _profiling():
+    return getattr(_local, 'sample', False)
+
+
+def _describe_params(params):
+    if isinstance(params, dict):
+        return {key: str(value)[:100] for key, value in params.items()}
+    return [str(value)[:100] for value in params][:20]
+
+
+def _explain(conn, sql, params):
+    try:
+        # 用普通游标执行，不计入统计
+        rows = conn.cursor(sqlite3.Cursor).execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        return [row[3] for row in rows]
+    except sqlite3.Error as e:
+        return [f'无法获取执行计划: {e}']
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _timing = None
+
+    def _finish(self):
+        timing = self._timing
+        if timing is None or timing.reported:
+            return
+        timing.reported = True
+        endpoint = _local.endpoint
+        _local.queries += 1
+        query_latency.observe((endpoint,), timing.elapsed)
+        sql = normalize_sql(timing.sql)
+        query_stats.record(sql, timing.elapsed, endpoint)
+        if timing.elapsed >= SLOW_QUERY_SECONDS:
+            query_stats.record_slow({
+                'sql': sql,
+                'params': _describe_params(timing.params),
+                'ms': round(timing.elapsed * 1000, 3),
+                'endpoint': endpoint,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'plan': _explain(self.connection, timing.sql, timing.params),
+            })
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._timing.elapsed += time.perf_counter() - start
+
+    def execute(self, sql, params=()):
+        if not _profiling():
+            return super().execute(sql, params)
+        self._finish()
+        if _SKIP_SQL.match(sql):
+            self._timing = None
+            return super().execute(sql, params)
+        self._timing = _Timing(sql, params)
+        _local.cursors.append(self)
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        if not _profiling():
+            return super().executemany(sql, seq_of_params)
+        self._finish()
+        self._timing = _Timing(sql, ())
+        _local.cursors.append(self)
+        return self._timed(super().executemany, sql, seq_of_params)
+
+    def fetchone(self):
+        if self._timing is None or self._timing.reported:
+            return super().fetchone()
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        if self._timing is None or self._timing.reported:
+            return super().fetchmany(*args)
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        if self._timing is None or self._timing.reported:
+            return super().fetchall()
+        return self._timed(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """连接池使用的连接类，抽样请求中的SQL经 ProfiledCursor 计时"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        if not _profiling():
+            return super().execute(sql, params)
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        if not _profiling():
+            return super().executemany(sql, seq_of_params)
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+# ==================== Flask 集成 ====================
+
+def _endpoint_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    if SQL_SAMPLE_RATE and random.random() < SQL_SAMPLE_RATE:
+        _local.sample = True
+        _local.endpoint = _endpoint_label()
+        _local.queries = 0
+        _local.cursors = []
+
+
+def _finish_sampling():
+    if not getattr(_local, 'sample', False):
+        return
+    for cursor in _local.cursors:
+        cursor._finish()
+    queries_per_request.observe((_local.endpoint,), _local.queries)
+    _local.sample = False
+    _local.cursors = []
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        request_latency.observe((request.method, _endpoint_label(), str(response.status_code)),
+                                time.perf_counter() - start)
+    _finish_sampling()
+    return response
+
+
+def _teardown_request(exc):
+    # 出现未处理异常时 after_request 不会执行，这里关闭抽样
+    _finish_sampling()
+
+
+def install(app):
+    """为 app 注册请求计时钩子"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def render():
+    lines = []
+    for histogram in (request_latency, query_latency, queries_per_request):
+        lines += histogram.render()
+    for collector in _collectors:
+        lines += collector()
+    return '\n'.join(lines) + '\n'
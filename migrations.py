@@ -0,0 +1,621 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite数据库结构迁移
+
+每个迁移有一个递增的版本号，已执行到的版本记录在 PRAGMA user_version 中。
+新建数据库和已有的 hospital.db 都通过 upgrade() 升级到最新结构：
+
+    python migrations.py [数据库文件]
+"""
+
+import sqlite3
+import sys
+
+import summary
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """注册一个迁移，版本号必须严格递增"""
+    def decorator(func):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f'迁移版本号必须递增: {version}')
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(conn, verbose=False):
+    """执行所有未执行的迁移，返回执行过的版本号列表
+
+    每个迁移在独立的 BEGIN IMMEDIATE 事务中执行，多个进程同时启动时
+    只有一个会真正执行迁移，其余进程看到新版本号后直接跳过。
+    """
+    applied = []
+    if current_version(conn) >= latest_version():
+        return applied
+    for version, description, func in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            if verbose:
+                print(f"  执行迁移 {version}: {description}")
+            func(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+# ==================== 迁移定义 ====================
+
+@migration(1, '基础表结构')
+def create_base_tables(cursor):
+    # 1. 科室表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS department (
+        dept_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dept_name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # 2. 员工表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS employee (
+        emp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_name TEXT NOT NULL,
+        emp_type TEXT CHECK(emp_type IN ('医生', '护士', '行政人员')) NOT NULL,
+        dept_id INTEGER,
+        title TEXT,
+        phone TEXT,
+        work_status TEXT CHECK(work_status IN ('在职', '休假', '离职')) DEFAULT '在职',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (dept_id) REFERENCES department(dept_id)
+    )
+    """)
+
+    # 3. 诊室表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS clinic_room (
+        room_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_name TEXT NOT NULL,
+        dept_id INTEGER NOT NULL,
+        status TEXT CHECK(status IN ('开放', '关闭', '维护中')) DEFAULT '开放',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (dept_id) REFERENCES department(dept_id)
+    )
+    """)
+
+    # 4. 患者表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS patient (
+        patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_name TEXT NOT NULL,
+        gender TEXT CHECK(gender IN ('男', '女', '其他')),
+        id_card TEXT UNIQUE,
+        phone TEXT NOT NULL,
+        address TEXT,
+        medical_history TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # 5. 预约表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS appointment (
+        appt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        patient_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        dept_id INTEGER NOT NULL,
+        appt_date DATE NOT NULL,
+        appt_time TIME NOT NULL,
+        status TEXT CHECK(status IN ('待到院', '已到院', '已取消')) DEFAULT '待到院',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
+        FOREIGN KEY (dept_id) REFERENCES department(dept_id)
+    )
+    """)
+
+    # 6. 就诊表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS visit (
+        visit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        dept_id INTEGER NOT NULL,
+        room_id INTEGER NOT NULL,
+        doctor_id INTEGER,
+        visit_date DATE NOT NULL,
+        visit_time TIME NOT NULL,
+        diagnosis TEXT,
+        prescription TEXT,
+        status TEXT CHECK(status IN ('等待就诊', '就诊中', '已完成', '已离院')) DEFAULT '等待就诊',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
+        FOREIGN KEY (dept_id) REFERENCES department(dept_id),
+        FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
+        FOREIGN KEY (doctor_id) REFERENCES employee(emp_id)
+    )
+    """)
+
+    # 7. 费用表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS billing (
+        bill_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        visit_id INTEGER NOT NULL,
+        patient_id INTEGER NOT NULL,
+        total_fee REAL NOT NULL,
+        insurance_fee REAL DEFAULT 0.00,
+        self_fee REAL NOT NULL,
+        payment_method TEXT CHECK(payment_method IN ('现金', '微信', '支付宝', '银行卡', '医保卡')),
+        payment_status TEXT CHECK(payment_status IN ('未支付', '已支付', '已退款')) DEFAULT '未支付',
+        payment_time TIMESTAMP,
+        operator_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (visit_id) REFERENCES visit(visit_id),
+        FOREIGN KEY (patient_id) REFERENCES patient(patient_id),
+        FOREIGN KEY (operator_id) REFERENCES employee(emp_id)
+    )
+    """)
+
+    # 8. 排班表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS doctor_schedule (
+        schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        doctor_id INTEGER NOT NULL,
+        room_id INTEGER NOT NULL,
+        work_date DATE NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        max_patients INTEGER DEFAULT 30,
+        current_patients INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (doctor_id) REFERENCES employee(emp_id),
+        FOREIGN KEY (room_id) REFERENCES clinic_room(room_id),
+        UNIQUE (doctor_id, work_date, start_time)
+    )
+    """)
+
+    # 9. 系统用户表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS system_user (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        user_role TEXT CHECK(user_role IN ('患者', '前台', '管理员')) NOT NULL,
+        emp_id INTEGER,
+        patient_id INTEGER,
+        status TEXT CHECK(status IN ('启用', '禁用')) DEFAULT '启用',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (emp_id) REFERENCES employee(emp_id),
+        FOREIGN KEY (patient_id) REFERENCES patient(patient_id)
+    )
+    """)
+
+
+@migration(2, '查询索引')
+def create_query_indexes(cursor):
+    # 前台按电话查找患者（到院登记）、患者列表按登记时间倒序
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patient_phone ON patient(phone)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patient_created ON patient(created_at)")
+
+    # 患者按电话查询预约，按预约日期时间倒序
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_appointment_phone_date
+        ON appointment(phone, appt_date, appt_time)
+    """)
+
+    # 前台当日就诊队列（visit_date + status，按visit_time排序）、仪表板计数
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_visit_date_status_time
+        ON visit(visit_date, status, visit_time)
+    """)
+
+    # 患者就诊记录
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_visit_patient_date
+        ON visit(patient_id, visit_date, visit_time)
+    """)
+
+    # 收入统计、仪表板今日收入
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_billing_status_time
+        ON billing(payment_status, payment_time)
+    """)
+
+    # 排班查询
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedule_date_time
+        ON doctor_schedule(work_date, start_time)
+    """)
+
+    # 科室医生下拉框、诊室下拉框
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_employee_type_dept
+        ON employee(emp_type, dept_id, emp_name)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_room_dept_status
+        ON clinic_room(dept_id, status)
+    """)
+
+
+@migration(3, '账单支付日期字段')
+def add_billing_payment_date(cursor):
+    # payment_date = date(payment_time)，由触发器维护，供按日分组统计使用
+    if not column_exists(cursor, 'billing', 'payment_date'):
+        cursor.execute("ALTER TABLE billing ADD COLUMN payment_date DATE")
+    cursor.execute("UPDATE billing SET payment_date = date(payment_time)")
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_billing_payment_date_insert
+        AFTER INSERT ON billing
+        WHEN NEW.payment_time IS NOT NULL
+        BEGIN
+            UPDATE billing SET payment_date = date(NEW.payment_time)
+            WHERE bill_id = NEW.bill_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_billing_payment_date_update
+        AFTER UPDATE OF payment_time ON billing
+        BEGIN
+            UPDATE billing SET payment_date = date(NEW.payment_time)
+            WHERE bill_id = NEW.bill_id;
+        END
+    """)
+
+    # 按支付时间范围统计时直接从索引取出分组和汇总所需字段
+    cursor.execute("DROP INDEX IF EXISTS idx_billing_status_time")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_billing_status_time
+        ON billing(payment_status, payment_time, payment_date, visit_id, total_fee)
+    """)
+
+
+# 一笔已支付账单对汇总表的贡献：收入计入账单金额；同一就诊当天的第一笔已支付账单计1人次
+_REVENUE_SUMMARY_ADD = """
+    INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+    SELECT date(NEW.payment_time), v.dept_id, COALESCE(v.doctor_id, 0),
+           NOT EXISTS (
+               SELECT 1 FROM billing b
+               WHERE b.visit_id = NEW.visit_id AND b.bill_id != NEW.bill_id
+                 AND b.payment_status = '已支付' AND b.payment_date = date(NEW.payment_time)
+           ),
+           NEW.total_fee
+    FROM visit v
+    WHERE v.visit_id = NEW.visit_id
+    ON CONFLICT (stat_date, dept_id, doctor_id) DO UPDATE SET
+        total_visits = total_visits + excluded.total_visits,
+        total_revenue = total_revenue + excluded.total_revenue,
+        updated_at = CURRENT_TIMESTAMP;
+"""
+
+_REVENUE_SUMMARY_REMOVE = """
+    UPDATE revenue_summary SET
+        total_visits = total_visits - NOT EXISTS (
+            SELECT 1 FROM billing b
+            WHERE b.visit_id = OLD.visit_id AND b.bill_id != OLD.bill_id
+              AND b.payment_status = '已支付' AND b.payment_date = date(OLD.payment_time)
+        ),
+        total_revenue = total_revenue - OLD.total_fee,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE stat_date = date(OLD.payment_time)
+      AND (dept_id, doctor_id) = (
+          SELECT v.dept_id, COALESCE(v.doctor_id, 0) FROM visit v WHERE v.visit_id = OLD.visit_id
+      );
+    DELETE FROM revenue_summary
+    WHERE stat_date = date(OLD.payment_time) AND total_visits <= 0;
+"""
+
+# 就诊当天有已支付账单时记一行 (统计日期, 就诊)，多日范围按就诊去重计算人次
+_REVENUE_VISIT_ADD = """
+    INSERT OR IGNORE INTO revenue_visit (stat_date, visit_id, dept_id, doctor_id)
+    SELECT date(NEW.payment_time), v.visit_id, v.dept_id, COALESCE(v.doctor_id, 0)
+    FROM visit v
+    WHERE v.visit_id = NEW.visit_id;
+"""
+
+_REVENUE_VISIT_REMOVE = """
+    DELETE FROM revenue_visit
+    WHERE stat_date = date(OLD.payment_time) AND visit_id = OLD.visit_id
+      AND NOT EXISTS (
+          SELECT 1 FROM billing b
+          WHERE b.visit_id = OLD.visit_id AND b.bill_id != OLD.bill_id
+            AND b.payment_status = '已支付' AND b.payment_date = date(OLD.payment_time)
+      );
+"""
+
+
+@migration(4, '收入汇总表')
+def create_revenue_summary(cursor):
+    # doctor_id 为 0 表示未指定医生
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS revenue_summary (
+            stat_date DATE NOT NULL,
+            dept_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL DEFAULT 0,
+            total_visits INTEGER NOT NULL DEFAULT 0,
+            total_revenue REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (stat_date, dept_id, doctor_id)
+        ) WITHOUT ROWID
+    """)
+
+    # 触发器按就诊查找同一天的其他已支付账单
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_billing_visit
+        ON billing(visit_id, payment_status, payment_date)
+    """)
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_revenue_summary_insert
+        AFTER INSERT ON billing
+        WHEN NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_ADD} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_revenue_summary_update_old
+        AFTER UPDATE OF payment_status, payment_time, total_fee, visit_id ON billing
+        WHEN OLD.payment_status = '已支付' AND OLD.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_REMOVE} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_revenue_summary_update_new
+        AFTER UPDATE OF payment_status, payment_time, total_fee, visit_id ON billing
+        WHEN NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_ADD} END
+    """)
+
+    summary.rebuild_revenue_summary(cursor)
+
+
+@migration(5, '患者搜索索引')
+def create_patient_search_index(cursor):
+    # 姓名完全匹配和前缀匹配
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_patient_name ON patient(patient_name)")
+
+    # 姓名/电话/身份证号任意位置匹配：FTS5 三元组索引（SQLite 3.34+）
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS patient_fts USING fts5(
+                patient_name, phone, id_card,
+                content='patient', content_rowid='patient_id',
+                tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # 不支持FTS5或三元组分词器时，patient_search 退回到 LIKE 查询
+        return
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patient_fts_insert
+        AFTER INSERT ON patient
+        BEGIN
+            INSERT INTO patient_fts (rowid, patient_name, phone, id_card)
+            VALUES (NEW.patient_id, NEW.patient_name, NEW.phone, NEW.id_card);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patient_fts_delete
+        AFTER DELETE ON patient
+        BEGIN
+            INSERT INTO patient_fts (patient_fts, rowid, patient_name, phone, id_card)
+            VALUES ('delete', OLD.patient_id, OLD.patient_name, OLD.phone, OLD.id_card);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patient_fts_update
+        AFTER UPDATE OF patient_name, phone, id_card ON patient
+        BEGIN
+            INSERT INTO patient_fts (patient_fts, rowid, patient_name, phone, id_card)
+            VALUES ('delete', OLD.patient_id, OLD.patient_name, OLD.phone, OLD.id_card);
+            INSERT INTO patient_fts (rowid, patient_name, phone, id_card)
+            VALUES (NEW.patient_id, NEW.patient_name, NEW.phone, NEW.id_card);
+        END
+    """)
+    cursor.execute("INSERT INTO patient_fts (patient_fts) VALUES ('rebuild')")
+
+
+@migration(6, '患者就诊次数冗余字段')
+def add_patient_visit_stats(cursor):
+    # 由 visit 表插入触发器维护，管理端患者列表无需再汇总全部就诊记录
+    if not column_exists(cursor, 'patient', 'visit_count'):
+        cursor.execute("ALTER TABLE patient ADD COLUMN visit_count INTEGER NOT NULL DEFAULT 0")
+    if not column_exists(cursor, 'patient', 'last_visit_date'):
+        cursor.execute("ALTER TABLE patient ADD COLUMN last_visit_date DATE")
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_patient_visit_stats_insert
+        AFTER INSERT ON visit
+        BEGIN
+            UPDATE patient SET
+                visit_count = visit_count + 1,
+                last_visit_date = CASE
+                    WHEN last_visit_date IS NULL OR NEW.visit_date > last_visit_date
+                    THEN NEW.visit_date ELSE last_visit_date END
+            WHERE patient_id = NEW.patient_id;
+        END
+    """)
+
+    # 管理端患者列表按最近就诊日期倒序取前N个
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_patient_last_visit
+        ON patient(last_visit_date, patient_id)
+    """)
+
+    summary.rebuild_patient_visit_stats(cursor)
+
+
+@migration(7, '预约关联排班')
+def add_appointment_schedule(cursor):
+    # 早期建库脚本的预约表没有 doctor_id，已有数据库可能是手工加过的
+    if not column_exists(cursor, 'appointment', 'doctor_id'):
+        cursor.execute("ALTER TABLE appointment ADD COLUMN doctor_id INTEGER REFERENCES employee(emp_id)")
+    # 预约占用的排班号源，取消预约时据此归还
+    if not column_exists(cursor, 'appointment', 'schedule_id'):
+        cursor.execute("ALTER TABLE appointment ADD COLUMN schedule_id INTEGER REFERENCES doctor_schedule(schedule_id)")
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_appointment_schedule
+        ON appointment(schedule_id, status)
+    """)
+
+
+@migration(8, '批量导入状态表')
+def create_import_state_tables(cursor):
+    # bulk_import 导入期间暂时删除的索引和触发器，导入完成（或中断后重新运行）时据此重建
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_deferred_ddl (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL
+        )
+    """)
+    # 每个导入文件已处理到的记录数，与该批数据在同一事务中提交，中断后从这里继续
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoint (
+            source TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            records INTEGER NOT NULL DEFAULT 0,
+            imported INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(9, '就诊列表分页索引')
+def create_visit_page_index(cursor):
+    # 前台当日就诊列表不按状态过滤时按 (visit_time, visit_id) 倒序分页
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_visit_date_time
+        ON visit(visit_date, visit_time)
+    """)
+
+
+@migration(10, '前台预约列表索引')
+def create_appointment_list_index(cursor):
+    # 前台按预约日期（范围）+ 科室 + 状态筛选预约；带上 appt_time，
+    # 单日按科室、状态筛选时可以直接按时间顺序分页
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_appointment_date_dept_status
+        ON appointment(appt_date, dept_id, status, appt_time)
+    """)
+
+
+@migration(11, '收入统计就诊去重')
+def create_revenue_visit(cursor):
+    # revenue_summary 的人次按天计算，一次就诊在两天都有缴费时多日合计会重复计算；
+    # revenue_visit 记录每天有已支付账单的就诊，科室、医生的多日人次按就诊去重
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS revenue_visit (
+            stat_date DATE NOT NULL,
+            visit_id INTEGER NOT NULL,
+            dept_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stat_date, visit_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_revenue_visit_visit
+        ON revenue_visit(visit_id)
+    """)
+
+    # 账单触发器同时维护 revenue_visit
+    for name in ('trg_revenue_summary_insert', 'trg_revenue_summary_update_old',
+                 'trg_revenue_summary_update_new'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    cursor.execute(f"""
+        CREATE TRIGGER trg_revenue_summary_insert
+        AFTER INSERT ON billing
+        WHEN NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_ADD} {_REVENUE_VISIT_ADD} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_revenue_summary_update_old
+        AFTER UPDATE OF payment_status, payment_time, total_fee, visit_id ON billing
+        WHEN OLD.payment_status = '已支付' AND OLD.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_REMOVE} {_REVENUE_VISIT_REMOVE} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_revenue_summary_update_new
+        AFTER UPDATE OF payment_status, payment_time, total_fee, visit_id ON billing
+        WHEN NEW.payment_status = '已支付' AND NEW.payment_time IS NOT NULL
+        BEGIN {_REVENUE_SUMMARY_ADD} {_REVENUE_VISIT_ADD} END
+    """)
+
+    # 就诊改科室、改医生时，把它各天的人次和收入从原来的汇总行移到新的汇总行
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_revenue_summary_visit_update
+        AFTER UPDATE OF dept_id, doctor_id ON visit
+        WHEN OLD.dept_id IS NOT NEW.dept_id
+          OR COALESCE(OLD.doctor_id, 0) != COALESCE(NEW.doctor_id, 0)
+        BEGIN
+            UPDATE revenue_summary SET
+                total_visits = total_visits - 1,
+                total_revenue = total_revenue - (
+                    SELECT SUM(b.total_fee) FROM billing b
+                    WHERE b.visit_id = OLD.visit_id AND b.payment_status = '已支付'
+                      AND b.payment_date = revenue_summary.stat_date
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE dept_id = OLD.dept_id AND doctor_id = COALESCE(OLD.doctor_id, 0)
+              AND stat_date IN (SELECT stat_date FROM revenue_visit WHERE visit_id = OLD.visit_id);
+            DELETE FROM revenue_summary
+            WHERE dept_id = OLD.dept_id AND doctor_id = COALESCE(OLD.doctor_id, 0)
+              AND stat_date IN (SELECT stat_date FROM revenue_visit WHERE visit_id = OLD.visit_id)
+              AND total_visits <= 0;
+            INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+            SELECT b.payment_date, NEW.dept_id, COALESCE(NEW.doctor_id, 0), 1, SUM(b.total_fee)
+            FROM billing b
+            WHERE b.visit_id = NEW.visit_id AND b.payment_status = '已支付'
+              AND b.payment_date IS NOT NULL
+            GROUP BY b.payment_date
+            ON CONFLICT (stat_date, dept_id, doctor_id) DO UPDATE SET
+                total_visits = total_visits + excluded.total_visits,
+                total_revenue = total_revenue + excluded.total_revenue,
+                updated_at = CURRENT_TIMESTAMP;
+            UPDATE revenue_visit SET dept_id = NEW.dept_id, doctor_id = COALESCE(NEW.doctor_id, 0)
+            WHERE visit_id = NEW.visit_id;
+        END
+    """)
+
+    summary.rebuild_revenue_summary(cursor)
+    summary.rebuild_revenue_visits(cursor)
+
+
+if __name__ == '__main__':
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'hospital.db'
+    conn = sqlite3.connect(db_file)
+    before = current_version(conn)
+    print(f"数据库: {db_file}")
+    print(f"当前版本: {before}，最新版本: {latest_version()}")
+    applied = upgrade(conn, verbose=True)
+    if applied:
+        print(f"✓ 已升级到版本 {current_version(conn)}")
+    else:
+        print("✓ 已是最新版本，无需升级")
+    conn.close()
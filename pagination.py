@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+列表接口分页
+
+列表接口按索引列做键集分页（keyset pagination）：每页返回 next_cursor，
+取下一页时带上 ?cursor=...，查询条件变成 (排序列...) < (上一页最后一行的值...)，
+直接在索引上定位，不用 OFFSET 跳过前面的行，翻到第几页都一样快。
+
+    GET /api/receptionist/patients?limit=50
+      → {"success": true, "data": [...], "next_cursor": "WyIyMDI2LTAx..."}
+    GET /api/receptionist/patients?limit=50&cursor=WyIyMDI2LTAx...
+
+next_cursor 为 null 表示没有更多数据。
+
+带 ?format=ndjson 时以 application/x-ndjson 流式返回（cursor 之后的）全部记录，
+每行一个JSON对象，用于导出。导出每 EXPORT_CHUNK 行查询一次，每次单独从连接池
+取连接，内存占用与总行数无关，也不会在客户端慢慢接收时一直占着连接。
+"""
+
+import base64
+import binascii
+import json
+
+from flask import Response, request, stream_with_context
+
+import serializer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# 导出时每次查询的行数
+EXPORT_CHUNK = 500
+
+
+class PaginationError(ValueError):
+    """分页参数无效"""
+
+
+def encode_cursor(values):
+    """把上一页最后一行的排序键编码成 cursor，values 为 None 时返回 None"""
+    if values is None:
+        return None
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, ValueError):
+        raise PaginationError('分页参数无效')
+    if not isinstance(values, list):
+        raise PaginationError('分页参数无效')
+    return values
+
+
+class Keyset:
+    """键集分页的排序键
+
+    columns 为 ORDER BY 的列，最后一列必须唯一（一般是主键），并且应有
+    (过滤列..., columns...) 顺序的索引；fields 为结果行中对应的字段名，
+    默认去掉列名的表别名。nullable 表示第一列可能为 NULL（只支持降序，
+    NULL 排在最后）。
+    """
+
+    def __init__(self, columns, fields=None, descending=True, nullable=False):
+        self.columns = tuple(columns)
+        self.fields = tuple(fields or (column.split('.')[-1] for column in self.columns))
+        self.descending = descending
+        self.nullable = nullable
+        direction = 'DESC' if descending else 'ASC'
+        self.order_by = ', '.join(f'{column} {direction}' for column in self.columns)
+
+    def _query(self, cursor, select, where, params, after, limit):
+        conditions = list(where)
+        params = list(params)
+        if after is not None:
+            columns, values = self.columns, after
+            if self.nullable and after[0] is None:
+                conditions.append(f'{columns[0]} IS NULL')
+                columns, values = columns[1:], after[1:]
+            placeholders = ', '.join('?' * len(values))
+            conditions.append(f"({', '.join(columns)}) {'<' if self.descending else '>'} ({placeholders})")
+            params += values
+        sql = select
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {self.order_by} LIMIT ?'
+        return serializer.rows(cursor, sql, params + [limit])
+
+    def fetch(self, cursor, select, where, params, limit, after=None):
+        """查询一页，返回 (行字典列表, 下一页的排序键或 None)
+
+        select 为不含 WHERE/ORDER BY/LIMIT 的查询，where 为条件列表，
+        params 为条件参数，after 为 decode_cursor() 得到的上一页排序键。
+        """
+        if after is not None and len(after) != len(self.columns):
+            raise PaginationError('分页参数无效')
+        rows = self._query(cursor, select, where, params, after, limit + 1)
+        if self.nullable and after is not None and after[0] is not None and len(rows) <= limit:
+            # 非 NULL 的行取完后接着取排在最后的 NULL 行
+            rows += self._query(cursor, select, list(where) + [f'{self.columns[0]} IS NULL'],
+                                params, None, limit + 1 - len(rows))
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = [rows[-1][field] for field in self.fields]
+        return rows, next_after
+
+
+def ranked_page(find_ids, after, limit, max_results):
+    """按相关度排序的搜索结果分页
+
+    相关度不是索引列，不能做键集分页；cursor 记录已返回的条数，
+    每页重新取前 offset + limit + 1 个结果，总数不超过 max_results。
+    find_ids(n) 返回前n个结果的ID列表。
+    """
+    offset = 0
+    if after is not None:
+        if len(after) != 1 or not isinstance(after[0], int) or after[0] < 0:
+            raise PaginationError('分页参数无效')
+        offset = after[0]
+    ids = find_ids(min(offset + limit + 1, max_results))
+    next_after = [offset + limit] if len(ids) > offset + limit else None
+    return ids[offset:offset + limit], next_after
+
+
+def page_args(default=DEFAULT_PAGE_SIZE):
+    """从查询参数读取 (limit, after)"""
+    limit = request.args.get('limit', default, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    token = request.args.get('cursor')
+    return limit, decode_cursor(token) if token else None
+
+
+def wants_ndjson():
+    return request.args.get('format') == 'ndjson'
+
+
+def ndjson_response(load_page, after=None):
+    """流式导出，load_page(after, limit) 返回 (行字典列表, 下一页的排序键或 None)"""
+    def generate(after):
+        while True:
+            rows, after = load_page(after, EXPORT_CHUNK)
+            for row in rows:
+                yield serializer.dumps(row) + b'\n'
+            if after is None:
+                break
+
+    response = Response(stream_with_context(generate(after)), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
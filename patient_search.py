@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+患者搜索
+
+按关键词查找患者，结果按匹配程度排序：
+  1. 身份证号完全匹配
+  2. 电话完全匹配
+  3. 姓名完全匹配
+  4. 电话前缀匹配
+  5. 姓名前缀匹配
+  6. 姓名/电话/身份证号任意位置包含关键词（patient_fts 三元组全文索引，按相关度排序）
+
+完整身份证号或11位电话完全匹配时直接返回，不再做模糊匹配。
+三元组索引只能匹配不少于3个字符的关键词。1~2个字的关键词（如姓氏）
+只做完全匹配和前缀匹配；数据库不支持FTS5时退回到 LIKE 查询。
+
+MySQL 上前缀匹配用 LIKE '关键词%'（同样使用B树索引），任意位置匹配用
+ft_patient 全文索引（ngram 分词，database/schema.sql）。
+"""
+
+import re
+
+from backends import dialect
+
+# 三元组分词器能匹配的最短关键词长度
+TRIGRAM_MIN_LENGTH = 3
+
+# 分页浏览搜索结果时最多返回的患者数
+MAX_SEARCH_RESULTS = 500
+
+ID_CARD_RE = re.compile(r'^\d{15}$|^\d{17}[\dXx]$')
+DIGITS_RE = re.compile(r'^\d+$')
+
+
+_FTS_AVAILABLE_SQL = {
+    'sqlite': "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_fts'",
+    'mysql': """
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = 'patient' AND index_name = 'ft_patient'
+        LIMIT 1
+    """,
+}
+
+# 前缀匹配：SQLite 用区间比较（LIKE 默认不区分大小写，用不上索引），MySQL 用 LIKE
+_PREFIX_SQL = {
+    'sqlite': """
+        SELECT patient_id FROM patient
+        WHERE {column} >= ? AND {column} < ?
+        ORDER BY {column} LIMIT ?
+    """,
+    'mysql': """
+        SELECT patient_id FROM patient
+        WHERE {column} LIKE ?
+        ORDER BY {column} LIMIT ?
+    """,
+}
+
+_FTS_SQL = {
+    'sqlite': """
+        SELECT rowid FROM patient_fts
+        WHERE patient_fts MATCH ?
+        ORDER BY rank LIMIT ?
+    """,
+    'mysql': """
+        SELECT patient_id FROM patient
+        WHERE MATCH(patient_name, phone, id_card) AGAINST (? IN BOOLEAN MODE)
+        ORDER BY MATCH(patient_name, phone, id_card) AGAINST (? IN BOOLEAN MODE) DESC LIMIT ?
+    """,
+}
+
+
+def fts_available(cursor):
+    cursor.execute(_FTS_AVAILABLE_SQL[dialect(cursor)])
+    return cursor.fetchone() is not None
+
+
+def _prefix_upper_bound(prefix):
+    # 前缀区间 [prefix, prefix + U+10FFFF)，可以直接使用B树索引
+    return prefix + '\U0010ffff'
+
+
+def _like_prefix(prefix):
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _fts_phrase(keyword):
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def search_patient_ids(cursor, keyword, limit=50):
+    """返回按匹配程度排序的 patient_id 列表"""
+    keyword = keyword.strip()
+    if not keyword:
+        return []
+
+    ids = []
+    seen = set()
+
+    def collect(sql, params):
+        if len(ids) >= limit:
+            return
+        cursor.execute(sql, params + (limit,))
+        for (patient_id,) in cursor.fetchall():
+            if patient_id not in seen:
+                seen.add(patient_id)
+                ids.append(patient_id)
+
+    if ID_CARD_RE.match(keyword):
+        collect("SELECT patient_id FROM patient WHERE id_card = ? LIMIT ?", (keyword.upper(),))
+    if DIGITS_RE.match(keyword):
+        collect("SELECT patient_id FROM patient WHERE phone = ? LIMIT ?", (keyword,))
+    else:
+        collect("SELECT patient_id FROM patient WHERE patient_name = ? LIMIT ?", (keyword,))
+
+    # 完整的身份证号或电话号码命中时就是要找的人，不再做模糊匹配
+    if ids and (ID_CARD_RE.match(keyword) or (DIGITS_RE.match(keyword) and len(keyword) == 11)):
+        return ids[:limit]
+
+    column = 'phone' if DIGITS_RE.match(keyword) else 'patient_name'
+    if dialect(cursor) == 'mysql':
+        collect(_PREFIX_SQL['mysql'].format(column=column), (_like_prefix(keyword),))
+    else:
+        collect(_PREFIX_SQL['sqlite'].format(column=column), (keyword, _prefix_upper_bound(keyword)))
+
+    if not fts_available(cursor):
+        pattern = f'%{keyword}%'
+        collect("""
+            SELECT patient_id FROM patient
+            WHERE patient_name LIKE ? OR phone LIKE ? OR id_card LIKE ?
+            ORDER BY created_at DESC LIMIT ?
+        """, (pattern, pattern, pattern))
+    elif len(keyword) >= TRIGRAM_MIN_LENGTH:
+        if dialect(cursor) == 'mysql':
+            # 布尔模式的短语不能转义双引号，直接去掉
+            phrase = '"' + keyword.replace('"', '') + '"'
+            collect(_FTS_SQL['mysql'], (phrase, phrase))
+        else:
+            collect(_FTS_SQL['sqlite'], (_fts_phrase(keyword),))
+
+    return ids[:limit]
+
+
+def in_placeholders(ids):
+    """IN (...) 中的占位符；ids 不能为空，MySQL 不接受 IN ()，调用方先处理没有结果的情况"""
+    if not ids:
+        raise ValueError('in_placeholders() 的 ids 不能为空')
+    return ','.join('?' * len(ids))
+
+
+def order_by_ids(rows, patient_ids):
+    """把按 patient_id IN (...) 查出的行（serializer.rows() 的行字典）恢复成搜索结果的顺序"""
+    by_id = {row['patient_id']: row for row in rows}
+    return [by_id[patient_id] for patient_id in patient_ids if patient_id in by_id]
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+候诊队列实时推送
+
+进程内为每个就诊日期维护一份队列快照（visit_id -> 队列行）。到院登记、
+状态变更、缴费等写操作提交后调用 queue_hub.publish_*()，快照随之更新，
+同时把增量事件推送给订阅该日期的所有客户端。
+
+新订阅者直接从内存快照拿到当前队列，不需要再做多表联查；快照只在首次
+订阅某个日期、或距上次加载超过 SNAPSHOT_MAX_AGE 秒时从数据库重新加载一次，
+用来吸收其他进程或脚本写入的数据。
+
+queue_hub 在进程内存中，只有 asgi.py 单进程部署时提供推送（见 asgi.py）。
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# 快照最长复用时间（秒）
+SNAPSHOT_MAX_AGE = 60
+
+# 同时保留快照的日期数
+MAX_DAYS = 3
+
+# 单个订阅者最多积压的事件数，超过后断开连接，由客户端重连取快照
+MAX_PENDING_EVENTS = 1000
+
+# 队列行：与 /api/receptionist/visits 返回的字段一致
+QUEUE_ROW_SQL = """
+    SELECT v.visit_id, v.visit_date, p.patient_name, v.dept_id, d.dept_name,
+           v.room_id, cr.room_name, v.visit_time, v.status,
+           e.emp_name as doctor_name
+    FROM visit v
+    JOIN patient p ON v.patient_id = p.patient_id
+    JOIN department d ON v.dept_id = d.dept_id
+    JOIN clinic_room cr ON v.room_id = cr.room_id
+    LEFT JOIN employee e ON v.doctor_id = e.emp_id
+"""
+
+
+def fetch_queue_row(cursor, visit_id):
+    cursor.execute(QUEUE_ROW_SQL + " WHERE v.visit_id = ?", (visit_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def fetch_queue_rows(cursor, day):
+    cursor.execute(QUEUE_ROW_SQL + " WHERE v.visit_date = ?", (day,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+class Subscriber:
+    """一个订阅连接的待发送事件队列
+
+    同步模式下由 wait() 阻塞等待；异步服务器可以设置 waker 回调，
+    在有新事件时被唤醒，不需要为每个连接占用一个线程。
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.closed = False
+        self.waker = None
+        self._events = deque()
+        self._cond = threading.Condition()
+
+    def push(self, event):
+        with self._cond:
+            if self.closed:
+                return
+            if len(self._events) >= MAX_PENDING_EVENTS:
+                self.closed = True
+                self._events.clear()
+            else:
+                self._events.append(event)
+            self._cond.notify()
+        if self.waker is not None:
+            self.waker()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        if self.waker is not None:
+            self.waker()
+
+    def drain(self):
+        with self._cond:
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def wait(self, timeout):
+        """等待新事件，超时返回空列表"""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class _DaySnapshot:
+    def __init__(self, rows):
+        self.rows = {row['visit_id']: row for row in rows}
+        self.loaded_at = time.monotonic()
+
+
+class QueueHub:
+    def __init__(self):
+        self._days = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """注册进程内监听器，每个事件都会以 callback(event) 的形式通知"""
+        self._listeners.append(callback)
+
+    def _event(self, event_type, day, data):
+        return {'id': next(self._seq), 'type': event_type, 'date': day, 'data': data}
+
+    def _dispatch(self, event):
+        for subscriber in list(self._subscribers.get(event['date'], ())):
+            subscriber.push(event)
+        for listener in self._listeners:
+            listener(event)
+
+    def _load(self, day, loader):
+        """加载或刷新某天的快照，返回与旧快照相比的差异事件（需持有锁）"""
+        rows = loader(day)
+        old = self._days.get(day)
+        self._days[day] = snapshot = _DaySnapshot(rows)
+        while len(self._days) > MAX_DAYS:
+            oldest = min(self._days, key=lambda d: self._days[d].loaded_at)
+            if oldest == day:
+                break
+            del self._days[oldest]
+
+        if old is None:
+            return []
+        events = []
+        for visit_id, row in snapshot.rows.items():
+            previous = old.rows.get(visit_id)
+            if previous is None:
+                events.append(self._event('registered', day, row))
+            elif previous['status'] != row['status']:
+                events.append(self._event('status', day, {'visit_id': visit_id, 'status': row['status']}))
+        return events
+
+    def subscribe(self, day, loader):
+        """订阅某天的队列，返回 (订阅者, 当前快照行列表)
+
+        loader(day) 返回该天的全部队列行，仅在快照不存在或已过期时调用。
+        """
+        with self._lock:
+            events = []
+            snapshot = self._days.get(day)
+            if snapshot is None or time.monotonic() - snapshot.loaded_at > SNAPSHOT_MAX_AGE:
+                events = self._load(day, loader)
+            subscriber = Subscriber(day)
+            rows = sorted(self._days[day].rows.values(), key=lambda r: r['visit_time'], reverse=True)
+            for event in events:
+                self._dispatch(event)
+            self._subscribers.setdefault(day, set()).add(subscriber)
+        return subscriber, [dict(row) for row in rows]
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.day)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.day]
+
+    def snapshot_event(self, day, rows):
+        return self._event('snapshot', day, rows)
+
+    def publish_registered(self, row):
+        """新登记的就诊，row 为 fetch_queue_row() 的结果"""
+        with self._lock:
+            day = row['visit_date']
+            snapshot = self._days.get(day)
+            if snapshot is not None:
+                snapshot.rows[row['visit_id']] = dict(row)
+            self._dispatch(self._event('registered', day, row))
+
+    def publish_status(self, day, visit_id, status, event_type='status', **extra):
+        """就诊状态变更；extra 附加到事件数据中（如缴费的 bill_id、total_fee）"""
+        with self._lock:
+            snapshot = self._days.get(day)
+            if snapshot is not None and visit_id in snapshot.rows:
+                snapshot.rows[visit_id]['status'] = status
+            data = {'visit_id': visit_id, 'status': status}
+            data.update(extra)
+            self._dispatch(self._event(event_type, day, data))
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+queue_hub = QueueHub()
+
+
+def format_sse(event):
+    payload = json.dumps(event['data'], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+只读副本（报表查询读快照）
+
+管理端的收入统计、患者查询等报表查询扫描的数据多，与前台挂号、缴费在同一个
+hospital.db 上执行时会争抢页缓存。开启只读副本后，这些查询改读主库的快照：
+
+- 刷新：每隔 interval 秒用 SQLite 在线备份 API 把主库复制成数据库同目录下
+  replica/ 中的一个新文件（hospital_<快照时间毫秒>.db），写完后才改成正式文件名，
+  只保留最近 KEEP_SNAPSHOTS 个。备份在 WAL 模式下不阻塞写入。
+- 读取：报表接口通过 choose() 取最新的快照，用只读、不加锁（immutable）的连接
+  查询；快照生成后不再修改，同一请求的各页（包括 format=ndjson 导出）读同一个快照。
+- 读自己的写：会话（登录用户）最近一次写操作晚于最新快照时，报表改读主库；
+  快照比 MAX_AGE 秒还旧（刷新停止了）时也读主库。
+- 响应头 X-Read-Source（replica/primary）和 X-Replica-Age（快照距今秒数）说明
+  数据来自哪里，JSON 响应同时带 read_from 字段。
+- 带响应缓存（cache.cached_response）的接口不读快照：缓存按主库写操作提升的
+  表版本号失效，旧快照的结果会以当前版本缓存下来，命中时也没有数据来源。
+
+启动方式：python asgi.py --replica-refresh 60（服务进程内刷新，多进程时所有
+工作进程共用同一组快照），或单独运行刷新进程，服务端设置环境变量
+HMS_REPLICA=1 只负责读取：
+
+    python replica.py run --db hospital.db --interval 60
+    python replica.py refresh --db hospital.db
+    python replica.py list --db hospital.db
+
+只支持 SQLite 主库。快照不附加归档库，报表接口只读主库中的表（revenue_summary、
+revenue_visit、patient 等），不受影响。
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import db
+import migrations
+
+# 开启副本读取的环境变量；HMS_REPLICA_MAX_AGE 为快照最大可用时间（秒）
+REPLICA_ENV = 'HMS_REPLICA'
+MAX_AGE_ENV = 'HMS_REPLICA_MAX_AGE'
+
+# 快照目录（数据库同目录下）
+REPLICA_DIR = 'replica'
+
+# 默认刷新间隔（秒）
+DEFAULT_INTERVAL = 60
+
+# 快照超过这个时间（秒）没有刷新时改读主库
+MAX_AGE = 600
+
+# 保留的快照数：刷新后上一个快照上进行中的查询（导出）还能读完
+KEEP_SNAPSHOTS = 2
+
+# 每个快照的连接池大小
+POOL_SIZE = 4
+
+# 会话中记录最近一次写操作时间的键
+SESSION_KEY = 'last_write_at'
+
+
+class ReplicaError(Exception):
+    """快照刷新失败"""
+
+
+def replica_dir(db_file):
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), REPLICA_DIR)
+
+
+def _prefix(db_file):
+    return os.path.splitext(os.path.basename(db_file))[0] + '_'
+
+
+def list_snapshots(db_file):
+    """返回主库的快照 [(快照时间, 文件路径)]，按时间排序"""
+    directory = replica_dir(db_file)
+    prefix = _prefix(db_file)
+    snapshots = []
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return []
+    with entries:
+        for entry in entries:
+            stamp = entry.name[len(prefix):-len('.db')]
+            if entry.name.startswith(prefix) and entry.name.endswith('.db') and stamp.isdigit():
+                snapshots.append((int(stamp) / 1000, entry.path))
+    return sorted(snapshots)
+
+
+def refresh(db_file, keep=KEEP_SNAPSHOTS):
+    """复制一个新快照并删除多余的旧快照，返回 (快照时间, 文件路径)"""
+    directory = replica_dir(db_file)
+    os.makedirs(directory, exist_ok=True)
+    # 备份读到的是开始备份之后的数据，快照时间取开始前，只会把数据算得更旧
+    as_of = time.time()
+    path = os.path.join(directory, f'{_prefix(db_file)}{int(as_of * 1000)}.db')
+    temp = path + '.tmp'
+
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(temp)
+    try:
+        # 快照不执行迁移，复制前先保证主库是最新结构
+        migrations.upgrade(source)
+        source.backup(target)
+        # 快照以只读、不加锁方式打开，不能依赖 -wal 文件
+        target.execute("PRAGMA journal_mode = DELETE")
+    except sqlite3.Error as e:
+        target.close()
+        os.remove(temp)
+        raise ReplicaError(f'复制快照失败：{e}')
+    finally:
+        source.close()
+    target.close()
+    os.replace(temp, path)
+
+    for _, old in list_snapshots(db_file)[:-keep]:
+        try:
+            os.remove(old)
+        except OSError:
+            # Windows 上还有查询打开着的快照删不掉，下次刷新再删
+            pass
+    return as_of, path
+
+
+class Source:
+    """报表查询的数据来源：主库，或某个快照"""
+
+    def __init__(self, name, as_of=None, pool=None):
+        self.name = name
+        self.as_of = as_of
+        self._pool = pool
+
+    def connection(self):
+        return (self._pool or db.get_pool()).connection()
+
+    def age(self):
+        return None if self.as_of is None else max(0.0, time.time() - self.as_of)
+
+    def describe(self):
+        if self.as_of is None:
+            return {'source': self.name}
+        return {
+            'source': self.name,
+            'as_of': datetime.fromtimestamp(self.as_of, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'staleness_seconds': round(self.age(), 1),
+        }
+
+
+PRIMARY = Source('primary')
+
+
+class SnapshotReader:
+    """找出最新的快照，为它建立只读连接池；新快照出现后切换，旧连接池停用，
+    仍在使用旧快照的请求结束归还连接时关闭连接"""
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._key = None
+        self._current = None
+
+    def latest(self):
+        db_file = db.get_pool().db_file
+        directory = replica_dir(db_file)
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._key == (db_file, mtime):
+                return self._current
+        snapshots = list_snapshots(db_file)
+        current = None
+        if snapshots:
+            as_of, path = snapshots[-1]
+            with self._lock:
+                if self._current is not None and self._current.as_of == as_of:
+                    current = self._current
+            if current is None:
+                current = Source('replica', as_of, db.ConnectionPool(path, POOL_SIZE, readonly=True))
+        with self._lock:
+            previous, self._current = self._current, current
+            self._key = (db_file, mtime)
+        if previous is not None and previous is not current:
+            previous._pool.close()
+        return current
+
+
+_reader = None
+
+
+def configure(enabled=True, max_age=MAX_AGE):
+    """开启或关闭本进程的副本读取"""
+    global _reader
+    _reader = SnapshotReader(max_age) if enabled else None
+
+
+def configure_from_env():
+    """按环境变量 HMS_REPLICA、HMS_REPLICA_MAX_AGE 开启副本读取"""
+    configure(bool(os.environ.get(REPLICA_ENV)), float(os.environ.get(MAX_AGE_ENV, MAX_AGE)))
+
+
+configure_from_env()
+
+
+def enabled():
+    return _reader is not None
+
+
+def choose(last_write_at=None):
+    """报表查询的数据来源：最新快照，快照早于 last_write_at 或已过期时为主库"""
+    reader = _reader
+    if reader is None:
+        return PRIMARY
+    source = reader.latest()
+    if source is None or source.age() > reader.max_age:
+        return PRIMARY
+    if last_write_at is not None and source.as_of < last_write_at:
+        return PRIMARY
+    return source
+
+
+def current_age():
+    """最新快照距今秒数，没有快照时为 None（/metrics 使用）"""
+    source = _reader.latest() if _reader is not None else None
+    return source.age() if source is not None else None
+
+
+class Refresher(threading.Thread):
+    """后台线程，每隔 interval 秒刷新一次快照"""
+
+    def __init__(self, db_file, interval=DEFAULT_INTERVAL):
+        super().__init__(name='hms-replica', daemon=True)
+        self.db_file = db_file
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                refresh(self.db_file)
+            except Exception as e:
+                print(f"刷新只读副本失败：{e}", file=sys.stderr)
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# ==================== 命令行 ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='报表查询的只读快照')
+    parser.add_argument('command', choices=['run', 'refresh', 'list'],
+                        help='run 持续定时刷新，refresh 刷新一次，list 列出现有快照')
+    parser.add_argument('--db', default=db.DB_FILE, help='主库文件')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='刷新间隔（秒）')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for as_of, path in list_snapshots(args.db):
+            age = time.time() - as_of
+            print(f"{path}  {os.path.getsize(path) / 1024 / 1024:.1f}MB  {age:.0f} 秒前")
+        return
+
+    if args.command == 'refresh':
+        start = time.perf_counter()
+        _, path = refresh(args.db)
+        print(f"已生成快照 {path}，用时 {time.perf_counter() - start:.2f}s")
+        return
+
+    print(f"每 {args.interval:g} 秒刷新 {args.db} 的只读快照，按 Ctrl+C 退出")
+    refresher = Refresher(args.db, args.interval)
+    refresher.start()
+    try:
+        while refresher.is_alive():
+            refresher.join(1)
+    except KeyboardInterrupt:
+        refresher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果序列化
+
+列表接口的响应时间有相当一部分花在把查询结果变成JSON上：sqlite3.Row 逐行
+dict(row)（每列按列名再查一次）、jsonify 排序字典键后编码，统计接口还要再遍历
+一遍把金额转成 float。接口改用这里的快速路径：
+
+- rows()：执行查询，按元组取出结果，用缓存的列名直接组成字典；需要转换类型的列
+  （coerce，如 {'total_revenue': float}）在同一遍中转换。列名按SQL缓存，同一查询
+  只从 cursor.description 取一次。
+- json_response()：把响应直接编码成 JSON 字节。安装了 orjson 时用 orjson，
+  否则用标准库 json（不排序字典键，紧凑格式）。
+- 已编译的语句保留在连接上：SQLite 连接的语句缓存（sqlite3 按SQL文本缓存已编译
+  的语句）调大到 backends.STATEMENT_CACHE_SIZE，分页查询带不同条件时的各种SQL
+  都不用重新编译；MySQL 连接按原语句缓存转换后的SQL文本（pymysql 在客户端拼接
+  参数，没有服务端预编译）。
+
+python -m bench.serialization --db bench.db 对比原来的 dict(row) + jsonify 与
+快速路径的耗时。
+"""
+
+import json
+
+from flask import Response
+
+from backends import STATEMENT_CACHE_SIZE, dialect
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(payload):
+    return orjson.dumps(payload, default=str)
+
+
+def _json_dumps(payload):
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('ascii')
+
+
+# 可用的编码器，dumps 为当前使用的一个
+ENCODERS = {'json': _json_dumps}
+if orjson is not None:
+    ENCODERS['orjson'] = _orjson_dumps
+
+ENCODER = 'orjson' if orjson is not None else 'json'
+dumps = ENCODERS[ENCODER]
+
+# SQL -> 结果列名
+_columns = {}
+
+
+def _column_names(cursor, sql):
+    columns = _columns.get(sql)
+    if columns is None:
+        columns = tuple(column[0] for column in cursor.description)
+        if len(_columns) >= STATEMENT_CACHE_SIZE:
+            _columns.clear()
+        _columns[sql] = columns
+    return columns
+
+
+def _fetch_tuples(cursor, sql, params):
+    if dialect(cursor) != 'sqlite':
+        # MySQL 结果行（backends.Row）可以直接按列迭代
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    # 只在这次查询中按元组取结果，调用方的游标之后照常返回 sqlite3.Row
+    row_factory = cursor.row_factory
+    cursor.row_factory = None
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.row_factory = row_factory
+
+
+def rows(cursor, sql, params=(), coerce=None):
+    """执行查询，返回行字典列表
+
+    coerce 为 {列名: 转换函数}，对这些列中不为 NULL 的值做类型转换。
+    """
+    values = _fetch_tuples(cursor, sql, params)
+    columns = _column_names(cursor, sql)
+    if not coerce:
+        return [dict(zip(columns, row)) for row in values]
+
+    converters = [(name, convert) for name, convert in coerce.items() if name in columns]
+    result = []
+    for row in values:
+        item = dict(zip(columns, row))
+        for name, convert in converters:
+            value = item[name]
+            if value is not None:
+                item[name] = convert(value)
+        result.append(item)
+    return result
+
+
+def json_response(payload, status=200):
+    """与 jsonify(payload) 相同的JSON响应，直接编码成字节"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
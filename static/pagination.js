@@ -0,0 +1,26 @@
+// 分页接口（见 pagination.py）的前端公共函数，患者、前台、管理后台页面共用
+
+// 分页接口的下一页地址，没有下一页时返回 null
+function nextPageUrl(url, result) {
+    if (!result.next_cursor) {
+        return null;
+    }
+    const base = url.replace(/[?&]cursor=[^&]*/, '');
+    return `${base}${base.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(result.next_cursor)}`;
+}
+
+// 依次请求分页接口的每一页，field 字段合并为全部记录
+async function fetchAllPages(url, field = 'data') {
+    const response = await fetch(url);
+    const result = await response.json();
+    let next = result;
+    while (next.success && next.next_cursor) {
+        const pageUrl = nextPageUrl(url, next);
+        next = await (await fetch(pageUrl)).json();
+        if (!next.success) {
+            return next;
+        }
+        result[field] = result[field].concat(next[field]);
+    }
+    return result;
+}
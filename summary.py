@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+汇总数据维护
+
+- revenue_summary 按 (统计日期, 科室, 医生) 汇总已支付账单的就诊人次和收入，
+  revenue_visit 记录每天有已支付账单的就诊（多日统计按就诊去重人次），
+  由 billing 表上的触发器在同一事务内增量维护，就诊改科室、医生时由 visit 表上的
+  触发器移到新的汇总行
+- patient.visit_count / last_visit_date 记录每个患者的就诊次数和最近就诊日期，
+  由 visit 表上的触发器维护
+- doctor_schedule.current_patients 记录排班已被预约的号源数，由 booking 模块
+  在预约、取消时维护
+
+本脚本用于从历史数据重建这些汇总数据，以及核对它们与原始表是否一致。
+连接上已有 archive.attach() 创建的 all_visit、all_billing 视图时，
+原始数据包括已归档的就诊和账单：
+
+    python summary.py rebuild [--start 2026-01-01 --end 2026-01-31] [--db hospital.db]
+    python summary.py check [--db hospital.db]
+"""
+
+import argparse
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+# 从原始账单计算汇总值；doctor_id 为空的就诊记为 0
+REVENUE_FROM_BILLING = """
+    SELECT b.payment_date AS stat_date,
+           v.dept_id AS dept_id,
+           COALESCE(v.doctor_id, 0) AS doctor_id,
+           COUNT(DISTINCT v.visit_id) AS total_visits,
+           SUM(b.total_fee) AS total_revenue
+    FROM {billing} b
+    JOIN {visit} v ON b.visit_id = v.visit_id
+    WHERE b.payment_status = '已支付'
+      AND b.payment_time >= ? AND b.payment_time < ?
+    GROUP BY b.payment_date, v.dept_id, COALESCE(v.doctor_id, 0)
+"""
+
+# 每天有已支付账单的就诊
+REVENUE_VISITS_FROM_BILLING = """
+    SELECT DISTINCT b.payment_date AS stat_date,
+           v.visit_id AS visit_id,
+           v.dept_id AS dept_id,
+           COALESCE(v.doctor_id, 0) AS doctor_id
+    FROM {billing} b
+    JOIN {visit} v ON b.visit_id = v.visit_id
+    WHERE b.payment_status = '已支付'
+      AND b.payment_time >= ? AND b.payment_time < ?
+"""
+
+# 不限日期时使用的时间范围
+ALL_TIME = ('0000-01-01', '9999-12-31')
+
+
+def _sources(cursor):
+    """原始就诊、账单数据的来源：有归档视图时使用视图"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM temp.sqlite_master WHERE type = 'view' AND name IN ('all_visit', 'all_billing')
+    """)
+    if cursor.fetchone()[0] == 2:
+        return {'visit': 'all_visit', 'billing': 'all_billing'}
+    return {'visit': 'visit', 'billing': 'billing'}
+
+
+def _time_range(start_date, end_date):
+    if start_date is None and end_date is None:
+        return ALL_TIME
+    start = start_date or ALL_TIME[0]
+    end = ALL_TIME[1]
+    if end_date:
+        end = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start, end
+
+
+def rebuild_revenue_summary(cursor, start_date=None, end_date=None):
+    """按原始账单重建 [start_date, end_date] 范围内的汇总行，返回写入的行数"""
+    range_start, range_end = _time_range(start_date, end_date)
+    cursor.execute("""
+        DELETE FROM revenue_summary WHERE stat_date >= ? AND stat_date < ?
+    """, (range_start, range_end))
+    cursor.execute("""
+        INSERT INTO revenue_summary (stat_date, dept_id, doctor_id, total_visits, total_revenue)
+    """ + REVENUE_FROM_BILLING.format(**_sources(cursor)), (range_start, range_end))
+    return cursor.rowcount
+
+
+def rebuild_revenue_visits(cursor, start_date=None, end_date=None):
+    """按原始账单重建 [start_date, end_date] 范围内每天有缴费的就诊，返回写入的行数"""
+    range_start, range_end = _time_range(start_date, end_date)
+    cursor.execute("""
+        DELETE FROM revenue_visit WHERE stat_date >= ? AND stat_date < ?
+    """, (range_start, range_end))
+    cursor.execute("""
+        INSERT INTO revenue_visit (stat_date, visit_id, dept_id, doctor_id)
+    """ + REVENUE_VISITS_FROM_BILLING.format(**_sources(cursor)), (range_start, range_end))
+    return cursor.rowcount
+
+
+def check_revenue_summary(cursor, tolerance=0.005):
+    """核对汇总表与原始表，返回不一致的 (stat_date, dept_id, doctor_id, 汇总值, 实际值) 列表"""
+    cursor.execute(REVENUE_FROM_BILLING.format(**_sources(cursor)), ALL_TIME)
+    expected = {(row[0], row[1], row[2]): (row[3], row[4]) for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT stat_date, dept_id, doctor_id, total_visits, total_revenue FROM revenue_summary
+    """)
+    actual = {(row[0], row[1], row[2]): (row[3], row[4]) for row in cursor.fetchall()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, (0, 0.0))
+        got = actual.get(key, (0, 0.0))
+        if want[0] != got[0] or abs((want[1] or 0) - (got[1] or 0)) > tolerance:
+            mismatches.append(key + (got, want))
+    return mismatches
+
+
+def check_revenue_visits(cursor):
+    """核对每天有缴费的就诊，返回不一致的 (stat_date, visit_id, 记录的科室和医生, 实际的科室和医生) 列表，
+    缺少或多出的行对应的一边为 None"""
+    cursor.execute(REVENUE_VISITS_FROM_BILLING.format(**_sources(cursor)), ALL_TIME)
+    expected = {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+    cursor.execute("SELECT stat_date, visit_id, dept_id, doctor_id FROM revenue_visit")
+    actual = {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
+    return [key + (actual.get(key), expected.get(key))
+            for key in sorted(set(expected) | set(actual), key=str)
+            if actual.get(key) != expected.get(key)]
+
+
+def rebuild_patient_visit_stats(cursor):
+    """按就诊记录重新计算每个患者的就诊次数和最近就诊日期，返回更新的患者数"""
+    cursor.execute("""
+        UPDATE patient SET
+            visit_count = (SELECT COUNT(*) FROM {visit} v WHERE v.patient_id = patient.patient_id),
+            last_visit_date = (SELECT MAX(v.visit_date) FROM {visit} v WHERE v.patient_id = patient.patient_id)
+    """.format(**_sources(cursor)))
+    return cursor.rowcount
+
+
+def check_patient_visit_stats(cursor):
+    """核对患者就诊次数，返回不一致的 (patient_id, 记录值, 实际值) 列表"""
+    cursor.execute("""
+        SELECT p.patient_id, p.visit_count, p.last_visit_date,
+               COUNT(v.visit_id), MAX(v.visit_date)
+        FROM patient p
+        LEFT JOIN {visit} v ON v.patient_id = p.patient_id
+        GROUP BY p.patient_id
+        HAVING p.visit_count != COUNT(v.visit_id) OR p.last_visit_date IS NOT MAX(v.visit_date)
+    """.format(**_sources(cursor)))
+    return [(row[0], (row[1], row[2]), (row[3], row[4])) for row in cursor.fetchall()]
+
+
+def check_schedule_counts(cursor):
+    """核对排班的已约人数与预约记录，返回不一致的 (schedule_id, 记录值, 实际值) 列表"""
+    cursor.execute("""
+        SELECT ds.schedule_id, ds.current_patients, COUNT(a.appt_id)
+        FROM doctor_schedule ds
+        LEFT JOIN appointment a ON a.schedule_id = ds.schedule_id AND a.status != '已取消'
+        GROUP BY ds.schedule_id
+        HAVING ds.current_patients != COUNT(a.appt_id) OR ds.current_patients > ds.max_patients
+    """)
+    return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='汇总数据维护')
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--db', default='hospital.db', help='数据库文件')
+    parser.add_argument('--start', help='重建起始日期 YYYY-MM-DD')
+    parser.add_argument('--end', help='重建结束日期 YYYY-MM-DD')
+    args = parser.parse_args()
+
+    import archive
+    import migrations
+    conn = sqlite3.connect(args.db)
+    migrations.upgrade(conn)
+    archive.attach(conn)
+    cursor = conn.cursor()
+
+    if args.command == 'rebuild':
+        count = rebuild_revenue_summary(cursor, args.start, args.end)
+        print(f"✓ 收入汇总表已重建，写入 {count} 行")
+        count = rebuild_revenue_visits(cursor, args.start, args.end)
+        print(f"✓ 收入统计就诊记录已重建，写入 {count} 行")
+        count = rebuild_patient_visit_stats(cursor)
+        print(f"✓ 患者就诊次数已重新计算，更新 {count} 个患者")
+        conn.commit()
+    else:
+        failed = False
+        mismatches = check_revenue_summary(cursor)
+        if mismatches:
+            failed = True
+            print(f"✗ 收入汇总表有 {len(mismatches)} 处与原始数据不一致:")
+            for stat_date, dept_id, doctor_id, got, want in mismatches[:20]:
+                print(f"  {stat_date} 科室{dept_id} 医生{doctor_id}: "
+                      f"汇总 {got[0]}人次/¥{got[1]:.2f}，实际 {want[0]}人次/¥{want[1]:.2f}")
+        else:
+            print("✓ 收入汇总表与原始数据一致")
+
+        mismatches = check_revenue_visits(cursor)
+        if mismatches:
+            failed = True
+            print(f"✗ 收入统计就诊记录有 {len(mismatches)} 处与原始数据不一致:")
+            for stat_date, visit_id, got, want in mismatches[:20]:
+                print(f"  {stat_date} 就诊{visit_id}: 记录 {got}，实际 {want}")
+        else:
+            print("✓ 收入统计就诊记录与原始数据一致")
+
+        mismatches = check_patient_visit_stats(cursor)
+        if mismatches:
+            failed = True
+            print(f"✗ 有 {len(mismatches)} 个患者的就诊次数与就诊记录不一致:")
+            for patient_id, got, want in mismatches[:20]:
+                print(f"  患者{patient_id}: 记录 {got[0]}次/{got[1]}，实际 {want[0]}次/{want[1]}")
+        else:
+            print("✓ 患者就诊次数与就诊记录一致")
+
+        mismatches = check_schedule_counts(cursor)
+        if mismatches:
+            failed = True
+            print(f"✗ 有 {len(mismatches)} 个排班的已约人数与预约记录不一致:")
+            for schedule_id, got, want in mismatches[:20]:
+                print(f"  排班{schedule_id}: 记录 {got}人，实际 {want}人")
+        else:
+            print("✓ 排班已约人数与预约记录一致")
+
+        if failed:
+            conn.close()
+            sys.exit(1)
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+"""
+写操作、合并提交与单写进程
+
+所有修改数据的接口都通过 submit(操作名, 参数) 执行，操作是注册在 OPERATIONS 中、
+在写事务里运行的函数 op(cursor, params)，返回可序列化的结果（新记录编号等）；
+业务错误抛出 db.WriteError，事务回滚，消息原样返回给前端。
+
+有三种执行方式：
+
+- 单进程（默认）：在本进程的连接上用 BEGIN IMMEDIATE 事务执行，每个写操作
+  提交一次
+- 单进程合并提交：设置环境变量 HMS_GROUP_COMMIT_MS=等待窗口毫秒数（或调用
+  configure_group_commit）后，写操作交给本进程的一个提交线程，收到第一个
+  写操作后最多再等窗口时间，把这期间到达的写操作放进同一个事务，用一次提交
+  代替多次提交。窗口为0时不等待，只合并已经在排队的写操作；请求零散到达时
+  窗口越长每批越大、提交次数越少，但每个写操作都要多等这段时间，并发请求数
+  已经全部在排队时再等只会增加延迟（见 bench/group_commit.py）。MAX_BATCH
+  限制每批的大小
+- 多进程部署：设置环境变量 HMS_WRITER=host:port 后，各工作进程把写操作
+  发给唯一的写进程执行（python asgi.py --workers N 会自动启动写进程）：
+
+      python writes.py --db hospital.db --address 127.0.0.1:5100
+
+  工作进程与写进程用环境变量 HMS_WRITER_KEY 的值认证，没有默认值；自动启动
+  写进程时 asgi.py 生成随机密钥传给写进程和各工作进程。
+
+  写进程只有一个数据库连接，把同时到达的写操作合并到一个事务中（--window-ms
+  为等待窗口，默认不等待，只合并已经排队的写操作）。负载越高每批越大，多个
+  进程不再争抢写锁、反复 SQLITE_BUSY 重试。读操作仍由各工作进程并行执行。
+
+合并提交时每个操作在自己的 SAVEPOINT 中执行，失败时只回滚这个操作，
+不影响同一批的其他操作；整批只 COMMIT 一次。
+"""
+
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import booking
+import db
+from backends import dialect
+from db import WriteError, write_transaction
+
+# 写进程地址（host:port），未设置时在本进程内执行写操作
+WRITER_ENV = 'HMS_WRITER'
+DEFAULT_WRITER_ADDRESS = '127.0.0.1:5100'
+
+# 工作进程与写进程之间的认证密钥，没有默认值：asgi.py 自动启动写进程时生成随机密钥，
+# 单独启动写进程时写进程和各工作进程要设置同一个值
+WRITER_KEY_ENV = 'HMS_WRITER_KEY'
+
+# 开启进程内合并提交的环境变量（值为等待窗口毫秒数）
+GROUP_COMMIT_ENV = 'HMS_GROUP_COMMIT_MS'
+
+# 合并提交的默认等待窗口（秒）
+GROUP_COMMIT_WINDOW = 0.001
+
+# 一个事务最多合并的写操作数
+MAX_BATCH = 64
+
+# 等待写进程接受的连接数（每个工作进程的每个线程一个连接）
+LISTEN_BACKLOG = 128
+
+OPERATIONS = {}
+
+# 登记就诊、缴费时记录的当前日期时间（UTC，与 dashboard 的"今日"一致）
+_VISIT_INSERT_SQL = {
+    'sqlite': """
+        INSERT INTO visit (patient_id, dept_id, doctor_id, room_id, visit_date, visit_time, status)
+        VALUES (?, ?, ?, ?, date('now'), time('now'), '等待就诊')
+    """,
+    'mysql': """
+        INSERT INTO visit (patient_id, dept_id, doctor_id, room_id, visit_date, visit_time, status)
+        VALUES (?, ?, ?, ?, UTC_DATE(), UTC_TIME(), '等待就诊')
+    """,
+}
+
+_BILLING_INSERT_SQL = {
+    'sqlite': """
+        INSERT INTO billing (visit_id, patient_id, total_fee, insurance_fee,
+                            self_fee, payment_method, payment_status, payment_time, operator_id)
+        VALUES (?, ?, ?, ?, ?, ?, '已支付', datetime('now'), ?)
+    """,
+    'mysql': """
+        INSERT INTO billing (visit_id, patient_id, total_fee, insurance_fee,
+                            self_fee, payment_method, payment_status, payment_time, operator_id)
+        VALUES (?, ?, ?, ?, ?, ?, '已支付', UTC_TIMESTAMP(), ?)
+    """,
+}
+
+# SQLite 的写事务一开始就持有写锁；MySQL 用 FOR UPDATE 锁住这个电话（包括还不存在时的索引间隙），
+# 并发登记同一电话不会重复建档
+_PATIENT_BY_PHONE_SQL = {
+    'sqlite': "SELECT patient_id FROM patient WHERE phone = ?",
+    'mysql': "SELECT patient_id FROM patient WHERE phone = ? LIMIT 1 FOR UPDATE",
+}
+
+
+class WriteFailed(Exception):
+    """写进程连接失败，或合并提交的写操作出错，消息作为失败原因返回给前端"""
+
+
+def writer_key():
+    """工作进程与写进程之间的认证密钥，没有设置 HMS_WRITER_KEY 时抛出 WriteFailed"""
+    key = os.environ.get(WRITER_KEY_ENV)
+    if not key:
+        raise WriteFailed(f'没有设置写进程认证密钥 {WRITER_KEY_ENV}')
+    return key.encode('utf-8')
+
+
+def operation(name):
+    """注册一个写操作"""
+    def decorator(func):
+        OPERATIONS[name] = func
+        return func
+    return decorator
+
+
+# ==================== 写操作 ====================
+
+@operation('create_appointment')
+def create_appointment(cursor, data):
+    return booking.book(cursor, data)
+
+
+@operation('cancel_appointment')
+def cancel_appointment(cursor, params):
+    return {'schedule_id': booking.cancel(cursor, params['appt_id'], params.get('phone'))}
+
+
+@operation('register_visit')
+def register_visit(cursor, data):
+    # 检查患者是否存在
+    cursor.execute(_PATIENT_BY_PHONE_SQL[dialect(cursor)], (data['phone'],))
+    patient = cursor.fetchone()
+
+    if patient:
+        patient_id = patient['patient_id']
+    else:
+        # 创建新患者
+        cursor.execute("""
+            INSERT INTO patient (patient_name, gender, id_card, phone)
+            VALUES (?, ?, ?, ?)
+        """, (data['patient_name'], data.get('gender'), data.get('id_card'), data['phone']))
+        patient_id = cursor.lastrowid
+
+    # 创建就诊记录
+    cursor.execute(_VISIT_INSERT_SQL[dialect(cursor)], (patient_id, data['dept_id'], data.get('doctor_id'), data['room_id']))
+
+    visit_id = cursor.lastrowid
+
+    # 如果是预约患者，更新预约状态
+    if data.get('appt_id'):
+        cursor.execute("""
+            UPDATE appointment SET status = '已到院' WHERE appt_id = ?
+        """, (data['appt_id'],))
+
+    return {'visit_id': visit_id, 'patient_id': patient_id}
+
+
+def _update_visit(cursor, status, visit_id, columns):
+    """修改就诊状态，返回就诊记录的 columns 列（记录不存在时为 None）"""
+    if dialect(cursor) == 'mysql':
+        cursor.execute("UPDATE visit SET status = ? WHERE visit_id = ?", (status, visit_id))
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute(f"SELECT {columns} FROM visit WHERE visit_id = ?", (visit_id,))
+    else:
+        cursor.execute(f"""
+            UPDATE visit SET status = ? WHERE visit_id = ?
+            RETURNING {columns}
+        """, (status, visit_id))
+    return cursor.fetchone()
+
+
+@operation('update_visit_status')
+def update_visit_status(cursor, params):
+    visit = _update_visit(cursor, params['status'], params['visit_id'], 'visit_date')
+    if not visit:
+        raise WriteError('就诊记录不存在')
+
+    return {'visit_date': visit['visit_date']}
+
+
+@operation('create_billing')
+def create_billing(cursor, data):
+    total_fee = float(data['total_fee'])
+    insurance_fee = float(data.get('insurance_fee', 0))
+    self_fee = total_fee - insurance_fee
+
+    # 创建账单
+    cursor.execute(_BILLING_INSERT_SQL[dialect(cursor)], (
+        data['visit_id'],
+        data['patient_id'],
+        total_fee,
+        insurance_fee,
+        self_fee,
+        data['payment_method'],
+        data.get('operator_id')
+    ))
+
+    bill_id = cursor.lastrowid
+
+    # 更新就诊状态为已离院
+    visit = _update_visit(cursor, '已离院', data['visit_id'], 'visit_date, dept_id')
+    return {
+        'bill_id': bill_id,
+        'total_fee': total_fee,
+        'visit_date': visit['visit_date'] if visit else None,
+        'dept_id': visit['dept_id'] if visit else None,
+    }
+
+
+@operation('refund_billing')
+def refund_billing(cursor, params):
+    # 收入汇总表由触发器在同一事务中扣减
+    cursor.execute("""
+        UPDATE billing SET payment_status = '已退款'
+        WHERE bill_id = ? AND payment_status = '已支付'
+    """, (params['bill_id'],))
+
+    if cursor.rowcount == 0:
+        raise WriteError('账单不存在或未支付')
+
+    return {}
+
+
+@operation('create_schedule')
+def create_schedule(cursor, data):
+    cursor.execute("""
+        INSERT INTO doctor_schedule (doctor_id, room_id, work_date, start_time, end_time, max_patients)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (
+        data['doctor_id'],
+        data['room_id'],
+        data['work_date'],
+        data['start_time'],
+        data['end_time'],
+        data.get('max_patients', 30)
+    ))
+
+    return {'schedule_id': cursor.lastrowid}
+
+
+# ==================== 批量执行 ====================
+
+def _run_batch(cursor, requests):
+    results = []
+    for name, params in requests:
+        cursor.execute("SAVEPOINT write_op")
+        try:
+            func = OPERATIONS.get(name)
+            if func is None:
+                raise WriteFailed(f'未知的写操作: {name}')
+            results.append(('ok', func(cursor, params)))
+            cursor.execute("RELEASE SAVEPOINT write_op")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT write_op")
+            cursor.execute("RELEASE SAVEPOINT write_op")
+            results.append(('error' if isinstance(e, WriteError) else 'failed', str(e)))
+    return results
+
+
+def execute_batch(conn, requests):
+    """在一个写事务中依次执行 [(操作名, 参数)]，返回 [(状态, 结果或错误消息)]
+
+    状态为 'ok'、'error'（WriteError，业务错误）或 'failed'（其他异常）。
+    每个操作在自己的 SAVEPOINT 中执行，失败只回滚它自己的修改；
+    提交失败时整批都返回 'failed'。
+    """
+    try:
+        return write_transaction(conn, lambda cursor: _run_batch(cursor, requests))
+    except Exception as e:
+        return [('failed', str(e))] * len(requests)
+
+
+def _unwrap(status, value):
+    if status == 'ok':
+        return value
+    if status == 'error':
+        raise WriteError(value)
+    raise WriteFailed(value)
+
+
+def collect_batch(requests, max_batch, window=0):
+    """从队列取一批请求：等到第一个后，最多再等 window 秒，最多 max_batch 个"""
+    batch = [requests.get()]
+    deadline = time.monotonic() + window
+    while len(batch) < max_batch:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+# ==================== 进程内合并提交 ====================
+
+class _Pending:
+    __slots__ = ('name', 'params', 'result', 'done')
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.result = None
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """各线程的写操作交给一个提交线程，攒成一批在一个事务中提交"""
+
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.operations = 0
+        self._thread = threading.Thread(target=self._run, name='hms-group-commit', daemon=True)
+        self._thread.start()
+
+    def call(self, name, params):
+        pending = _Pending(name, params)
+        self.requests.put(pending)
+        pending.done.wait()
+        return pending.result
+
+    def close(self):
+        self.requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = collect_batch(self.requests, self.max_batch, self.window)
+            stop = None in batch
+            batch = [pending for pending in batch if pending is not None]
+            if batch:
+                try:
+                    with db.get_db() as conn:
+                        results = execute_batch(conn, [(pending.name, pending.params) for pending in batch])
+                except Exception as e:
+                    results = [('failed', str(e))] * len(batch)
+                self.batches += 1
+                self.operations += len(batch)
+                for pending, result in zip(batch, results):
+                    pending.result = result
+                    pending.done.set()
+            if stop:
+                return
+
+
+# ==================== 写进程客户端 ====================
+
+def parse_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class WriterClient:
+    """连接写进程，每个线程一个连接，同一连接上的请求依次执行"""
+
+    def __init__(self, address):
+        self.address = address
+        self.authkey = writer_key()
+        self._local = threading.local()
+
+    def call(self, name, params):
+        conn = getattr(self._local, 'conn', None)
+        try:
+            if conn is None:
+                conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            conn.send((name, params))
+            status, value = conn.recv()
+        except (OSError, EOFError) as e:
+            # 请求可能已经执行，不自动重试，由调用方决定是否重新提交
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            raise WriteFailed(f'写进程不可用：{e}')
+        return status, value
+
+
+_client = None
+
+
+def _set_client(client):
+    global _client
+    previous, _client = _client, client
+    if isinstance(previous, GroupCommitter):
+        previous.close()
+
+
+def configure_writer(address=None):
+    """设置写进程地址（host:port），None 表示在本进程内逐个提交写操作"""
+    _set_client(WriterClient(parse_address(address)) if address else None)
+
+
+def configure_group_commit(window=GROUP_COMMIT_WINDOW, max_batch=MAX_BATCH):
+    """开启进程内合并提交，window 为等待窗口（秒），None 表示关闭；返回 GroupCommitter"""
+    committer = GroupCommitter(window, max_batch) if window is not None else None
+    _set_client(committer)
+    return committer
+
+
+def configure_from_env():
+    """按环境变量 HMS_WRITER、HMS_GROUP_COMMIT_MS 选择执行方式"""
+    if os.environ.get(WRITER_ENV):
+        configure_writer(os.environ[WRITER_ENV])
+    elif os.environ.get(GROUP_COMMIT_ENV):
+        configure_group_commit(float(os.environ[GROUP_COMMIT_ENV]) / 1000)
+    else:
+        configure_writer(None)
+
+
+configure_from_env()
+
+
+def submit(name, params):
+    """执行一个写操作，返回它的结果；业务错误抛出 WriteError"""
+    if _client is not None:
+        return _unwrap(*_client.call(name, params))
+    with db.get_db() as conn:
+        return write_transaction(conn, lambda cursor: OPERATIONS[name](cursor, params))
+
+
+# ==================== 写进程 ====================
+
+class _Request:
+    __slots__ = ('conn', 'name', 'params')
+
+    def __init__(self, conn, name, params):
+        self.conn = conn
+        self.name = name
+        self.params = params
+
+
+class WriterServer:
+    """单写进程：接收各工作进程的写请求，合并成批提交"""
+
+    def __init__(self, address, max_batch=MAX_BATCH, window=0):
+        self.address = address
+        self.max_batch = max_batch
+        self.window = window
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.operations = 0
+
+    def _serve_connection(self, conn):
+        try:
+            while True:
+                name, params = conn.recv()
+                self.requests.put(_Request(conn, name, params))
+        except (OSError, EOFError):
+            conn.close()
+
+    def _accept(self, listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError):
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def serve_forever(self, conn):
+        listener = Listener(self.address, backlog=LISTEN_BACKLOG, authkey=writer_key())
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+        while True:
+            batch = collect_batch(self.requests, self.max_batch, self.window)
+            results = execute_batch(conn, [(request.name, request.params) for request in batch])
+            self.batches += 1
+            self.operations += len(batch)
+            for request, result in zip(batch, results):
+                try:
+                    request.conn.send(result)
+                except (OSError, EOFError):
+                    pass
+
+
+def wait_for_writer(address, timeout=10):
+    """等待写进程开始监听"""
+    deadline = time.time() + timeout
+    authkey = writer_key()
+    while True:
+        try:
+            Client(address, authkey=authkey).close()
+            return True
+        except (OSError, EOFError):
+            if time.time() > deadline:
+                return False
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='单写进程')
+    parser.add_argument('--db', default=db.DB_FILE, help='数据库文件')
+    parser.add_argument('--address', default=DEFAULT_WRITER_ADDRESS, help='监听地址 host:port')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='一个事务最多合并的写操作数')
+    parser.add_argument('--window-ms', type=float, default=0, help='合并提交的等待窗口（毫秒）')
+    args = parser.parse_args()
+
+    if not os.environ.get(WRITER_KEY_ENV):
+        print(f"需要设置环境变量 {WRITER_KEY_ENV}（与各工作进程相同的认证密钥）")
+        return 1
+    # SIGTERM 与 Ctrl+C 一样退出：正在执行的一批会回滚，客户端收到"写进程不可用"
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    db.configure(args.db, pool_size=1)
+    server = WriterServer(parse_address(args.address), args.max_batch, args.window_ms / 1000)
+    print(f"写进程已启动: {args.address}，数据库 {args.db}")
+    try:
+        with db.get_db() as conn:
+            server.serve_forever(conn)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        db.get_pool().close_all()
+        print(f"写进程退出：共 {server.batches} 个事务，{server.operations} 个写操作")
+
+
+if __name__ == '__main__':
+    sys.exit(main())